@@ -0,0 +1,98 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Benchmark of the end-to-end latency of an inventory step in a StepUp workflow.
+
+For each number of files, a synthetic tree with small files is created in a temporary directory,
+together with a `plan.py` that declares the files as static
+and runs `srr-make-inventory` with an `inventory.def` file.
+The wall time of `stepup build` is measured for different values of `AMEND_CHUNK_SIZE`,
+which controls how many inputs are sent to the director in each `amend` call.
+A chunk size larger than the number of files corresponds to a single `amend` call.
+
+Usage: `python benchmarks/bench_inventory_amend.py --nfile 1000 10000 100000`
+"""
+
+import argparse
+import contextlib
+import subprocess
+import tempfile
+import time
+
+from path import Path
+
+PLAN = """\
+#!/usr/bin/env python3
+from stepup.core.api import glob, run, static
+
+static("inventory.def", "data/")
+glob("data/*/*.txt")
+run(
+    "python -c 'import stepup.reprep.make_inventory as m; "
+    "m.AMEND_CHUNK_SIZE = {chunk_size}; m.main([\\"-i\\", \\"inventory.def\\"])'",
+    inp="inventory.def",
+    out="inventory.txt",
+)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark inventory steps in StepUp.")
+    parser.add_argument("--nfile", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--chunk-size", type=int, nargs="+", default=[5000, 1 << 30])
+    parser.add_argument("--tmpdir", default=None, help="Parent of the synthetic tree.")
+    args = parser.parse_args()
+
+    print(f"{'files':>8s} {'chunk size':>11s} {'time [s]':>10s} {'us/file':>8s}")
+    for nfile in args.nfile:
+        for chunk_size in args.chunk_size:
+            with (
+                tempfile.TemporaryDirectory(dir=args.tmpdir) as path_tmp,
+                contextlib.chdir(path_tmp),
+            ):
+                make_workflow(nfile, chunk_size)
+                start = time.perf_counter()
+                subprocess.run(
+                    ["stepup", "build", "--no-watch", "--no-progress"],
+                    check=True,
+                    stdout=subprocess.DEVNULL,
+                )
+                elapsed = time.perf_counter() - start
+                nline = len(Path("inventory.txt").read_text().splitlines())
+                if nline != nfile:
+                    raise AssertionError(f"Expected {nfile} files in the inventory, got {nline}")
+                label = "all" if chunk_size >= nfile else str(chunk_size)
+                print(f"{nfile:8d} {label:>11s} {elapsed:10.3f} {elapsed / nfile * 1e6:8.1f}")
+
+
+def make_workflow(nfile: int, chunk_size: int):
+    """Create small files in directories of 1000 files, an inventory.def and a plan.py."""
+    for i in range(nfile):
+        path = Path(f"data/{i // 1000:03d}/{i:06d}.txt")
+        if i % 1000 == 0:
+            path.parent.makedirs_p()
+        path.write_text(f"{i}\n")
+    Path("inventory.def").write_text("include data/**\n")
+    path_plan = Path("plan.py")
+    path_plan.write_text(PLAN.format(chunk_size=chunk_size))
+    path_plan.chmod(0o755)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Benchmark of the evaluation of an `inventory.def` file with many lines.
+
+A synthetic tree with many empty files is created in a temporary directory.
+An inventory definition with many include and exclude lines is then evaluated
+with `parse_inventory_def`, which walks the tree once,
+and with a line-by-line evaluation that globs the tree for every pattern,
+as in previous versions.
+Both results are verified to be identical.
+
+Usage: `python benchmarks/bench_inventory_def.py --nfile 100000 --git`
+"""
+
+import argparse
+import contextlib
+import glob
+import re
+import shlex
+import subprocess
+import tempfile
+import time
+
+from path import Path
+
+from stepup.core.nglob import convert_nglob_to_glob, convert_nglob_to_regex
+from stepup.reprep.make_inventory import parse_inventory_def
+
+EXTENSIONS = (".txt", ".csv", ".json", ".png", ".py", ".md")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark inventory.def evaluation.")
+    parser.add_argument("--nfile", type=int, default=100000, help="Number of files.")
+    parser.add_argument("--ndir", type=int, default=20, help="Number of top-level directories.")
+    parser.add_argument("--git", action="store_true", help="Also benchmark include-git lines.")
+    parser.add_argument("--tmpdir", default=None, help="Parent of the synthetic tree.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.tmpdir) as path_tmp, contextlib.chdir(path_tmp):
+        make_tree(args.nfile, args.ndir)
+        lines = make_def_lines(args.ndir)
+        if args.git:
+            subprocess.run(["git", "init", "-q"], check=True)
+            subprocess.run(["git", "add", "."], check=True)
+            lines.extend(f"exclude-git d{i:02d}/*.md\n" for i in range(0, args.ndir, 2))
+        print(f"Synthetic tree: {args.nfile} files, inventory.def with {len(lines)} lines")
+        start = time.perf_counter()
+        reference = parse_per_line(lines)
+        time_ref = time.perf_counter() - start
+        start = time.perf_counter()
+        paths = parse_inventory_def(lines)
+        elapsed = time.perf_counter() - start
+        if paths != reference:
+            raise AssertionError("Batched evaluation differs from line-by-line evaluation.")
+        print(f"Matching files: {len(paths)}")
+        print(f"{'method':>12s} {'time [s]':>10s} {'speedup':>8s}")
+        print(f"{'per line':>12s} {time_ref:10.3f} {1.0:8.2f}")
+        print(f"{'batched':>12s} {elapsed:10.3f} {time_ref / elapsed:8.2f}")
+
+
+def make_tree(nfile: int, ndir: int):
+    """Create empty files in two levels of directories."""
+    for i in range(nfile):
+        path = Path(
+            f"d{i % ndir:02d}/s{(i // ndir) % 50:02d}/f{i:06d}{EXTENSIONS[(i // ndir) % 6]}"
+        )
+        if i < ndir * 50:
+            path.parent.makedirs_p()
+        path.touch()
+
+
+def make_def_lines(ndir: int) -> list[str]:
+    """Create an inventory definition with a few lines per top-level directory."""
+    lines = []
+    for i in range(ndir):
+        lines.append(f"include d{i:02d}/**/*.txt d{i:02d}/**/*.csv\n")
+        lines.append(f"exclude d{i:02d}/s0*/*.csv\n")
+        lines.append(f"include d{i:02d}/s1*/*.png\n")
+    lines.append("include **/*.md\n")
+    lines.append("exclude d0*/s4?/*\n")
+    return lines
+
+
+def parse_per_line(lines: list[str]) -> set[str]:
+    """Evaluate an inventory definition line by line, as in previous versions."""
+    paths = set()
+    for line in lines:
+        words = shlex.split(line, comments=True)
+        action = words[0][:7]
+        if words[0].endswith("-git"):
+            cp = subprocess.run(
+                ["git", "ls-files", *words[1:]], capture_output=True, text=True, check=True
+            )
+            new_paths = {Path(path) for path in cp.stdout.splitlines()}
+        else:
+            new_paths = set()
+            for pattern in words[1:]:
+                regex = re.compile(convert_nglob_to_regex(pattern))
+                for path in glob.iglob(
+                    convert_nglob_to_glob(pattern), recursive=True, include_hidden=True
+                ):
+                    if regex.fullmatch(path):
+                        new_paths.add(Path(path))
+        new_paths = [path for path in new_paths if not path.is_dir()]
+        if action == "include":
+            paths.update(new_paths)
+        else:
+            paths.difference_update(new_paths)
+    return paths
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Benchmark of parallel digest computation in `write_inventory`.
+
+A synthetic tree with many small files and a few large ones is created in a temporary directory.
+The inventory is then written with different numbers of threads,
+and the resulting files are verified to be byte-identical.
+
+Usage: `python benchmarks/bench_inventory_jobs.py --jobs 1 2 4 8`
+"""
+
+import argparse
+import contextlib
+import os
+import tempfile
+import time
+
+from path import Path
+
+from stepup.reprep.make_inventory import write_inventory
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parallel inventory hashing.")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--nsmall", type=int, default=20000, help="Number of small files.")
+    parser.add_argument("--small-size", type=int, default=4096, help="Size of small files.")
+    parser.add_argument("--nlarge", type=int, default=4, help="Number of large files.")
+    parser.add_argument("--large-size", type=int, default=256, help="Size of large files in MB.")
+    parser.add_argument("--tmpdir", default=None, help="Parent of the synthetic tree.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.tmpdir) as path_tmp, contextlib.chdir(path_tmp):
+        paths = make_tree(args.nsmall, args.small_size, args.nlarge, args.large_size << 20)
+        print(f"Synthetic tree: {len(paths)} files, {sum(os.path.getsize(p) for p in paths)} bytes")
+        print(f"{'jobs':>6s} {'time [s]':>10s} {'speedup':>8s}")
+        reference = None
+        time_ref = None
+        for jobs in args.jobs:
+            path_txt = f"inventory-{jobs}.txt"
+            start = time.perf_counter()
+            write_inventory(path_txt, paths, do_amend=False, jobs=jobs)
+            elapsed = time.perf_counter() - start
+            with open(path_txt, "rb") as fh:
+                contents = fh.read()
+            if reference is None:
+                reference = contents
+                time_ref = elapsed
+            elif contents != reference:
+                raise AssertionError(f"Inventory with {jobs} jobs differs from the first one.")
+            print(f"{jobs:6d} {elapsed:10.3f} {time_ref / elapsed:8.2f}")
+
+
+def make_tree(nsmall: int, small_size: int, nlarge: int, large_size: int) -> list[Path]:
+    """Create many small files in nested directories and a few large ones."""
+    paths = []
+    for i in range(nsmall):
+        path = Path(f"small/{i // 1000:03d}/{i:06d}.bin")
+        path.parent.makedirs_p()
+        path.write_bytes(os.urandom(small_size))
+        paths.append(path)
+    Path("large").makedirs_p()
+    for i in range(nlarge):
+        path = Path(f"large/{i:02d}.bin")
+        with open(path, "wb") as fh:
+            for _ in range(large_size >> 20):
+                fh.write(os.urandom(1 << 20))
+        paths.append(path)
+    return sorted(paths)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Benchmark of the PDF save profiles in `save_document`.
+
+Each input PDF (e.g. compiled with LaTeX or Typst) is saved with each profile, twice,
+to measure the wall time and to verify that the output is reproducible.
+When multiple PDFs are given, their concatenation is also included,
+as a model for a book or a handout assembled from chapters.
+The output size and the time are reported for each profile.
+
+Usage: `python benchmarks/bench_pdf_save.py latex.pdf typst.pdf`
+"""
+
+import argparse
+import tempfile
+import time
+
+import fitz
+from path import Path
+
+from stepup.reprep.normalize_pdf import SAVE_PROFILES, normalize_document, save_document
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF save profiles.")
+    parser.add_argument("paths_pdf", nargs="+", help="Real-world PDFs, e.g. from LaTeX or Typst.")
+    parser.add_argument("--tmpdir", default=None, help="Directory for the output PDFs.")
+    args = parser.parse_args()
+
+    cases = [[path_pdf] for path_pdf in args.paths_pdf]
+    if len(args.paths_pdf) > 1:
+        cases.append(args.paths_pdf)
+    print(f"{'input':>30s} {'pages':>6s} {'profile':>8s} {'time [s]':>10s} {'size [kB]':>10s}")
+    with tempfile.TemporaryDirectory(dir=args.tmpdir) as path_tmp:
+        path_tmp = Path(path_tmp)
+        for paths_pdf in cases:
+            label = Path(paths_pdf[0]).name[-30:] if len(paths_pdf) == 1 else "(all concatenated)"
+            for profile in SAVE_PROFILES:
+                times = []
+                outputs = []
+                for irun in range(2):
+                    doc = make_document(paths_pdf)
+                    npage = doc.page_count
+                    path_out = path_tmp / f"out{irun}.pdf"
+                    start = time.perf_counter()
+                    save_document(doc, path_out, profile)
+                    times.append(time.perf_counter() - start)
+                    doc.close()
+                    outputs.append(path_out.read_bytes())
+                if outputs[0] != outputs[1]:
+                    raise AssertionError(f"Profile {profile} is not reproducible: {label}")
+                print(
+                    f"{label:>30s} {npage:6d} {profile:>8s} "
+                    f"{min(times):10.3f} {len(outputs[0]) / 1000:10.1f}"
+                )
+
+
+def make_document(paths_pdf: list[str]) -> fitz.Document:
+    """Concatenate PDFs and normalize the result, as done in `cat_pdf`."""
+    doc = fitz.open()
+    for path_pdf in paths_pdf:
+        with fitz.open(path_pdf) as src:
+            src.scrub()
+            doc.insert_pdf(src)
+    normalize_document(doc)
+    return doc
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Benchmark of parallel compression in `zip_inventory`.
+
+A mixed dataset with compressible text files, incompressible binary files
+and a few large files is created in a temporary directory.
+The ZIP archive is then created with different numbers of threads,
+and the resulting archives are verified to be byte-identical.
+
+Usage: `python benchmarks/bench_zip_jobs.py --jobs 1 4 16`
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import tempfile
+import time
+
+from path import Path
+
+from stepup.reprep.make_inventory import write_inventory
+from stepup.reprep.zip_inventory import zip_inventory
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parallel ZIP compression.")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--ntext", type=int, default=2000, help="Number of text files.")
+    parser.add_argument("--nbinary", type=int, default=500, help="Number of binary files.")
+    parser.add_argument("--nlarge", type=int, default=2, help="Number of large files.")
+    parser.add_argument("--large-size", type=int, default=64, help="Size of large files in MB.")
+    parser.add_argument("--tmpdir", default=None, help="Parent of the synthetic tree.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.tmpdir) as path_tmp, contextlib.chdir(path_tmp):
+        paths = make_tree(args.ntext, args.nbinary, args.nlarge, args.large_size << 20)
+        print(f"Synthetic tree: {len(paths)} files, {sum(os.path.getsize(p) for p in paths)} bytes")
+        write_inventory("inventory.txt", paths, do_amend=False)
+        print(f"{'jobs':>6s} {'time [s]':>10s} {'speedup':>8s}")
+        reference = None
+        time_ref = None
+        for jobs in args.jobs:
+            path_zip = f"archive-{jobs}.zip"
+            start = time.perf_counter()
+            zip_inventory("inventory.txt", path_zip, jobs)
+            elapsed = time.perf_counter() - start
+            contents = Path(path_zip).read_bytes()
+            if reference is None:
+                reference = contents
+                time_ref = elapsed
+            elif contents != reference:
+                raise AssertionError(f"ZIP file with {jobs} jobs differs from the first one.")
+            print(f"{jobs:6d} {elapsed:10.3f} {time_ref / elapsed:8.2f}")
+
+
+def make_tree(ntext: int, nbinary: int, nlarge: int, large_size: int) -> list[Path]:
+    """Create a mix of compressible and incompressible files."""
+    rng = random.Random(42)
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"]
+    paths = []
+    Path("text").makedirs_p()
+    for i in range(ntext):
+        path = Path(f"text/{i:05d}.txt")
+        nword = rng.randrange(100, 100000)
+        path.write_text(" ".join(rng.choice(words) for _ in range(nword)))
+        paths.append(path)
+    Path("binary").makedirs_p()
+    for i in range(nbinary):
+        path = Path(f"binary/{i:05d}.bin")
+        path.write_bytes(os.urandom(rng.randrange(1000, 1000000)))
+        paths.append(path)
+    Path("large").makedirs_p()
+    for i in range(nlarge):
+        path = Path(f"large/{i:02d}.csv")
+        with open(path, "w") as fh:
+            while fh.tell() < large_size:
+                fh.write(",".join(str(rng.random()) for _ in range(10)) + "\n")
+        paths.append(path)
+    return sorted(paths)
+
+
+if __name__ == "__main__":
+    main()
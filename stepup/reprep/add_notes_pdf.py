@@ -24,13 +24,19 @@ import sys
 
 import fitz
 
-__all__ = ("add_notes_pdf",)
+from stepup.core.api import getenv
+
+from .normalize_pdf import add_save_profile_argument, normalize_document, save_document
+
+__all__ = ("add_notes_document", "add_notes_pdf")
 
 
 def main(argv: list[str] | None = None):
     """Main program."""
     args = parse_args(argv)
-    add_notes_pdf(args.path_src, args.path_notes, args.path_dst)
+    if args.save_profile is None:
+        args.save_profile = getenv("REPREP_PDF_SAVE_PROFILE", "default")
+    add_notes_pdf(args.path_src, args.path_notes, args.path_dst, args.save_profile)
 
 
 def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
@@ -42,10 +48,11 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
     parser.add_argument("path_src", help="The source pdf to which notes should be added.")
     parser.add_argument("path_notes", help="The pdf with the notes page(s).")
     parser.add_argument("path_dst", help="The output pdf.")
+    add_save_profile_argument(parser)
     return parser.parse_args(argv)
 
 
-def add_notes_pdf(path_src: str, path_notes: str, path_dst: str):
+def add_notes_pdf(path_src: str, path_notes: str, path_dst: str, save_profile: str = "default"):
     """Insert notes pages at every even page."""
     for path_pdf in path_src, path_notes, path_dst:
         if not path_pdf.endswith(".pdf"):
@@ -54,25 +61,29 @@ def add_notes_pdf(path_src: str, path_notes: str, path_dst: str):
     # See https://github.com/pymupdf/PyMuPDF/issues/3635
     src.scrub()
     notes = fitz.open(path_notes)
+    dst = add_notes_document(src, notes)
+
+    # Strip metadata for reproducibility and save
+    normalize_document(dst)
+    save_document(dst, path_dst, save_profile)
+
+    dst.close()
+    src.close()
+    notes.close()
 
-    # Create the combined PDF
+
+def add_notes_document(src: fitz.Document, notes: fitz.Document) -> fitz.Document:
+    """Return a new document with the pages of `src`, each followed by a page of `notes`.
+
+    The pages of `notes` are used cyclically.
+    """
     dst = fitz.open()
     for isrc in range(len(src)):
         final = isrc == len(src) - 1
         dst.insert_pdf(src, from_page=isrc, to_page=isrc, final=final)
         inotes = isrc % len(notes)
         dst.insert_pdf(notes, from_page=inotes, to_page=inotes, final=final)
-
-    # Strip metadata for reproducibility and save
-    dst.set_metadata({})
-    dst.del_xml_metadata()
-    dst.xref_set_key(-1, "ID", "null")
-    dst.scrub()
-    dst.save(path_dst, garbage=4, deflate=True, no_new_id=True)
-
-    dst.close()
-    src.close()
-    notes.close()
+    return dst
 
 
 if __name__ == "__main__":
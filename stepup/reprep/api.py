@@ -31,6 +31,8 @@ from stepup.core.path import StrPath, coerce_path, coerce_paths, coerce_str, mak
 from stepup.core.stepinfo import StepInfo
 from stepup.core.utils import string_to_bool
 
+from .inventory import check_digest_algorithms
+
 __all__ = (
     "add_notes_pdf",
     "cat_pdf",
@@ -52,8 +54,10 @@ __all__ = (
     "flatten_latex",
     "make_inventory",
     "nup_pdf",
+    "pdf_pipeline",
     "raster_pdf",
     "sanitize_bibtex",
+    "shard_inventory",
     "sync_zenodo",
     "unplot",
     "wrap_git",
@@ -67,6 +71,7 @@ def add_notes_pdf(
     path_dst: StrPath,
     optional: bool = False,
     resources: dict[str, int] | str | None = None,
+    save_profile: str | None = None,
 ) -> StepInfo:
     """Add a notes page at every even page of a PDF file.
 
@@ -83,14 +88,21 @@ def add_notes_pdf(
     resources
         Named resources required to run this step, e.g. `{"gpu": 1}`.
         See `stepup.core.api.step()` for details.
+    save_profile
+        How the output PDF is saved: `fast`, `default` or `compact`.
+        The default is `${REPREP_PDF_SAVE_PROFILE}` or `default` if the variable is not set.
+        See `stepup.reprep.normalize_pdf.save_document` for details.
 
     Returns
     -------
     step_info
         Holds relevant information of the step, useful for defining follow-up steps.
     """
+    command = f"srr-add-notes-pdf {shq(path_src)} {shq(path_notes)} {shq(path_dst)}"
+    if save_profile is not None:
+        command += f" --save-profile {shlex.quote(save_profile)}"
     return run(
-        f"srr-add-notes-pdf {shq(path_src)} {shq(path_notes)} {shq(path_dst)}",
+        command,
         inp=[path_src, path_notes],
         out=path_dst,
         optional=optional,
@@ -103,6 +115,8 @@ def cat_pdf(
     path_out: StrPath,
     *,
     insert_blank: bool = False,
+    dedup: bool = False,
+    save_profile: str | None = None,
     optional: bool = False,
     resources: dict[str, int] | str | None = None,
 ) -> StepInfo:
@@ -117,6 +131,13 @@ def cat_pdf(
     insert_blank
         Insert a blank page after a PDF with an odd number of pages.
         The last page of each PDF is used to determine the size of the added blank page.
+    dedup
+        Share identical fonts and images of different input PDFs as a single object.
+        This is useful for many input PDFs with the same fonts or images, e.g. chapters of a book.
+    save_profile
+        How the output PDF is saved: `fast`, `default` or `compact`.
+        The default is `${REPREP_PDF_SAVE_PROFILE}` or `default` if the variable is not set.
+        See `stepup.reprep.normalize_pdf.save_document` for details.
     optional
         If `True`, the step is only executed when needed by other steps.
     resources
@@ -131,6 +152,10 @@ def cat_pdf(
     parts = [f"srr-cat-pdf {shq(paths_inp)} {shq(path_out)}"]
     if insert_blank:
         parts.append("--insert-blank")
+    if dedup:
+        parts.append("--dedup")
+    if save_profile is not None:
+        parts.append(f"--save-profile {shlex.quote(save_profile)}")
     return run(
         " ".join(parts),
         inp=paths_inp,
@@ -1133,6 +1158,9 @@ def flatten_latex(
 def make_inventory(
     *paths: Collection[StrPath],
     path_def: StrPath | None = None,
+    index: bool = False,
+    extra_digests: Collection[str] = (),
+    cache: bool = False,
     optional: bool = False,
     resources: dict[str, int] | str | None = None,
 ) -> StepInfo:
@@ -1145,6 +1173,21 @@ def make_inventory(
         except for the last, which is the inventory file to write.
     path_def
         An inventory definitions file, used to constructe the list of files.
+    index
+        If `True`, a binary index is written next to the inventory file,
+        with the same prefix and suffix `.idx`.
+    extra_digests
+        Names of additional hash functions, e.g. `("md5",)`.
+        For each of them, a file with the same prefix as the inventory
+        and the name of the hash function as suffix is written, e.g. `inventory.md5`,
+        in the format of `md5sum`.
+        The digests are computed in the same pass over the file contents as the main digest.
+        See `stepup.reprep.inventory.check_digest_algorithms` for the supported names.
+    cache
+        If `True`, digests are kept in a cache file next to the inventory,
+        with the same prefix and suffix `-cache.sqlite`.
+        Digests of unchanged files are then not recomputed when the step runs again.
+        The cache file should not be committed to Git or included in other inventories.
     optional
         If `True`, the step is only executed when needed by other steps.
     resources
@@ -1167,8 +1210,17 @@ def make_inventory(
         parts.append(f"-i {shq(path_def)}")
         paths_inp.append(path_def)
     parts.append(f"-o {shq(path_out)}")
+    paths_out = [path_out]
+    if index:
+        parts.append("--index")
+        paths_out.append(str(path_out)[:-4] + ".idx")
+    if cache:
+        parts.append("--cache")
+    for algorithm in check_digest_algorithms(extra_digests):
+        parts.append(f"-d {shlex.quote(algorithm)}")
+        paths_out.append(str(path_out)[:-4] + "." + algorithm)
     return run(
-        " ".join(parts), inp=paths_inp, out=[path_out], optional=optional, resources=resources
+        " ".join(parts), inp=paths_inp, out=paths_out, optional=optional, resources=resources
     )
 
 
@@ -1180,6 +1232,7 @@ def nup_pdf(
     ncol: int | None = None,
     margin: float | None = None,
     page_format: str | None = None,
+    save_profile: str | None = None,
     optional: bool = False,
     resources: dict[str, int] | str | None = None,
 ) -> StepInfo:
@@ -1203,6 +1256,10 @@ def nup_pdf(
     page_format
         The output page format
         The default is `${REPREP_NUP_PAGE_FORMAT}` or A4-L if the variable is not set.
+    save_profile
+        How the output PDF is saved: `fast`, `default` or `compact`.
+        The default is `${REPREP_PDF_SAVE_PROFILE}` or `default` if the variable is not set.
+        See `stepup.reprep.normalize_pdf.save_document` for details.
     optional
         If `True`, the step is only executed when needed by other steps.
     resources
@@ -1223,15 +1280,67 @@ def nup_pdf(
         parts.append(f"-m {margin!s}")
     if page_format is not None:
         parts.append(f"-p {shlex.quote(page_format)}")
+    if save_profile is not None:
+        parts.append(f"--save-profile {shlex.quote(save_profile)}")
     return run(" ".join(parts), inp=path_src, out=path_dst, optional=optional, resources=resources)
 
 
+def pdf_pipeline(
+    path_pipeline: StrPath,
+    path_out: StrPath,
+    *,
+    save_profile: str | None = None,
+    optional: bool = False,
+    resources: dict[str, int] | str | None = None,
+) -> StepInfo:
+    """Apply a sequence of operations to PDFs in memory and save the result once.
+
+    This is equivalent to a chain of `cat_pdf`, `add_notes_pdf`, `nup_pdf` and `raster_pdf` steps,
+    but the intermediate PDFs are not written to disk.
+    See `stepup.reprep.pdf_pipeline` for the format of the pipeline file.
+
+    Parameters
+    ----------
+    path_pipeline
+        The YAML or JSON file with the list of operations.
+        The PDF files used in the operations are amended as inputs of the step.
+    path_out
+        The output PDF.
+    save_profile
+        How the output PDF is saved: `fast`, `default` or `compact`.
+        The default is `${REPREP_PDF_SAVE_PROFILE}` or `default` if the variable is not set.
+        See `stepup.reprep.normalize_pdf.save_document` for details.
+    optional
+        If `True`, the step is only executed when needed by other steps.
+    resources
+        Named resources required to run this step, e.g. `{"gpu": 1}`.
+        See `stepup.core.api.step()` for details.
+
+    Returns
+    -------
+    step_info
+        Holds relevant information of the step, useful for defining follow-up steps.
+    """
+    command = f"srr-pdf-pipeline {shq(path_pipeline)} {shq(path_out)}"
+    if save_profile is not None:
+        command += f" --save-profile {shlex.quote(save_profile)}"
+    return run(
+        command,
+        inp=path_pipeline,
+        out=path_out,
+        optional=optional,
+        resources=resources,
+    )
+
+
 def raster_pdf(
     path_inp: StrPath,
     dest: StrPath,
     *,
     resolution: int | None = None,
     quality: int | None = None,
+    jobs: int | None = None,
+    save_profile: str | None = None,
     optional: bool = False,
     resources: dict[str, int] | str | None = None,
 ) -> StepInfo:
@@ -1250,6 +1359,15 @@ def raster_pdf(
     quality
         The JPEG quality of the bitmap.
         The default value is taken from `${REPREP_RASTER_QUALITY}` or 50 if the variable is not set.
+    jobs
+        The number of processes used to render the pages.
+        The default value is taken from `${REPREP_RASTER_JOBS}` or 1 if the variable is not set.
+        The output does not depend on the number of processes.
+        Consider using `resources` to limit the number of such steps running concurrently.
+    save_profile
+        How the output PDF is saved: `fast`, `default` or `compact`.
+        The default is `${REPREP_PDF_SAVE_PROFILE}` or `default` if the variable is not set.
+        See `stepup.reprep.normalize_pdf.save_document` for details.
     optional
         If `True`, the step is only executed when needed by other steps.
     resources
@@ -1267,6 +1385,10 @@ def raster_pdf(
         parts.append(f"-r {resolution!s}")
     if quality is not None:
         parts.append(f"-q {quality!s}")
+    if jobs is not None:
+        parts.append(f"-j {jobs!s}")
+    if save_profile is not None:
+        parts.append(f"--save-profile {shlex.quote(save_profile)}")
     return run(" ".join(parts), inp=path_inp, out=path_out, optional=optional, resources=resources)
 
 
@@ -1337,6 +1459,57 @@ def sanitize_bibtex(
     )
 
 
+def shard_inventory(
+    path_inventory: StrPath,
+    max_size: int | str,
+    *,
+    compression: str | None = None,
+    optional: bool = False,
+    resources: dict[str, int] | str | None = None,
+) -> StepInfo:
+    """Split the files of an `inventory.txt` file into multiple ZIP files with a maximum size.
+
+    Parameters
+    ----------
+    path_inventory
+        A file created with the `make_inventory` API or with the command-line script
+        `srr-make-inventory`.
+    max_size
+        The maximum size of each ZIP file, in bytes or as a string with a unit, e.g. `"50G"`.
+    compression
+        The compression policy, see `zip_inventory`.
+    optional
+        If `True`, the step is only executed when needed by other steps.
+    resources
+        Named resources required to run this step, e.g. `{"gpu": 1}`.
+        See `stepup.core.api.step()` for details.
+
+    Returns
+    -------
+    step_info
+        Holds relevant information of the step, useful for defining follow-up steps.
+        The number of ZIP files depends on the sizes of the files in the inventory,
+        which are only known when the step runs.
+        Hence, only the index with suffix `-shards.json` is declared as output here.
+        The step amends the inventory and ZIP files of the shards as outputs,
+        before writing them, so follow-up steps can use them as inputs.
+        See `stepup.reprep.shard_inventory.shard_inventory` for details.
+    """
+    path_inventory = coerce_str(path_inventory)
+    if not path_inventory.endswith(".txt"):
+        raise ValueError(f"The inventory file must have a `.txt` extension. Got {path_inventory}")
+    parts = ["srr-shard-inventory", shq(path_inventory), f"-s {shlex.quote(str(max_size))}"]
+    if compression is not None:
+        parts.append(f"-c {shlex.quote(compression)}")
+    return run(
+        " ".join(parts),
+        inp=path_inventory,
+        out=path_inventory[:-4] + "-shards.json",
+        optional=optional,
+        resources=resources,
+    )
+
+
 def sync_zenodo(
     path_config: StrPath,
     *,
@@ -1484,6 +1657,7 @@ def zip_inventory(
     path_inventory: StrPath,
     path_zip: StrPath,
     *,
+    compression: str | None = None,
     optional: bool = False,
     resources: dict[str, int] | str | None = None,
 ) -> StepInfo:
@@ -1496,6 +1670,10 @@ def zip_inventory(
         `srr-make-inventory`.
     path_zip
         The output ZIP file
+    compression
+        The compression policy, e.g. `auto` to store already compressed file formats.
+        The default is `${REPREP_ZIP_COMPRESSION}` or `deflate` if the variable is not set.
+        See `stepup.reprep.zip_inventory.CompressionPolicy` for details.
     optional
         If `True`, the step is only executed when needed by other steps.
     resources
@@ -1507,8 +1685,11 @@ def zip_inventory(
     step_info
         Holds relevant information of the step, useful for defining follow-up steps.
     """
+    parts = ["srr-zip-inventory", shq(path_inventory), shq(path_zip)]
+    if compression is not None:
+        parts.append(f"-c {shlex.quote(compression)}")
     return run(
-        f"srr-zip-inventory {shq(path_inventory)} {shq(path_zip)}",
+        " ".join(parts),
         inp=path_inventory,
         out=path_zip,
         optional=optional,
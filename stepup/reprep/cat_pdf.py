@@ -20,17 +20,32 @@
 """Concatenate multiple PDFs into a single document, optionally inserting blank pages."""
 
 import argparse
+import re
 import sys
 
 import fitz
 
-__all__ = ("cat_pdf",)
+from stepup.core.api import getenv
+
+from .normalize_pdf import add_save_profile_argument, normalize_document, save_document
+from .pdf_digest import RE_REFERENCE_STR, compute_object_digest
+
+__all__ = ("append_pdfs", "cat_pdf", "share_objects")
+
+
+FONT_KEYS = {
+    "/Font": ("ToUnicode", "Encoding", "Widths", "DescendantFonts"),
+    "/FontDescriptor": ("FontFile", "FontFile2", "FontFile3", "CIDSet"),
+}
+"""Keys of font dictionaries and font descriptors that may refer to shareable objects."""
 
 
 def main():
     """Main program."""
     args = parse_args()
-    cat_pdf(args.paths_src, args.path_dst, args.insert_blank)
+    if args.save_profile is None:
+        args.save_profile = getenv("REPREP_PDF_SAVE_PROFILE", "default")
+    cat_pdf(args.paths_src, args.path_dst, args.insert_blank, args.dedup, args.save_profile)
 
 
 def parse_args() -> argparse.Namespace:
@@ -50,6 +65,15 @@ def parse_args() -> argparse.Namespace:
         default=False,
         action="store_true",
     )
+    parser.add_argument(
+        "-d",
+        "--dedup",
+        help="Share identical fonts and images of different source PDFs as a single object. "
+        "This results in smaller output files, also with the fast save profile.",
+        default=False,
+        action="store_true",
+    )
+    add_save_profile_argument(parser)
     return parser.parse_args()
 
 
@@ -57,6 +81,8 @@ def cat_pdf(
     paths_src: list[str],
     path_dst: str,
     insert_blank: bool,
+    dedup: bool = False,
+    save_profile: str = "default",
 ):
     """Put multiple pages in a single page, using a fixed layout.
 
@@ -69,6 +95,12 @@ def cat_pdf(
     insert_blank
         Insert a blank page after a PDF with an odd number of pages.
         The last page of each PDF is used to determine the size of the added blank page.
+    dedup
+        Share identical fonts and images of different source PDFs, see `share_objects`.
+        Other duplicate objects, e.g. graphics states and color profiles,
+        are still merged when saving, unless the `fast` save profile is used.
+    save_profile
+        How the output is saved, see `save_document`.
     """
     for path_pdf in [*paths_src, path_dst]:
         if not path_pdf.endswith(".pdf"):
@@ -76,25 +108,104 @@ def cat_pdf(
                 f"All arguments must have a `.pdf` extension, got: {path_pdf}", file=sys.stderr
             )
     dst = fitz.open()
+    append_pdfs(dst, paths_src, insert_blank, dedup)
+
+    # Strip metadata for reproducibility and save
+    normalize_document(dst)
+    save_document(dst, path_dst, save_profile)
+
+    dst.close()
+
 
+def append_pdfs(
+    dst: fitz.Document, paths_src: list[str], insert_blank: bool = False, dedup: bool = False
+):
+    """Append the pages of PDF files to a document.
+
+    See `cat_pdf` for the parameters.
+    When `dedup` is set, fonts and images are also shared with those already in `dst`.
+    """
+    shared = {}
+    memo = {}
+    if dedup and dst.xref_length() > 1:
+        share_objects(dst, 1, shared, memo)
     for path_src in paths_src:
         src = fitz.open(path_src)
         # See https://github.com/pymupdf/PyMuPDF/issues/3635
         src.scrub()
+        start = dst.xref_length()
         dst.insert_pdf(src)
+        if dedup:
+            share_objects(dst, start, shared, memo)
         if insert_blank and src.page_count % 2 == 1:
             last_page = src[-1]
             dst.insert_page(-1, width=last_page.rect.width, height=last_page.rect.height)
         src.close()
 
-    # Strip metadata for reproducibility and save
-    dst.set_metadata({})
-    dst.del_xml_metadata()
-    dst.xref_set_key(-1, "ID", "null")
-    dst.scrub()
-    dst.save(path_dst, garbage=4, deflate=True, no_new_id=True)
 
-    dst.close()
+def share_objects(
+    doc: fitz.Document, start: int, shared: dict[bytes, int], memo: dict[int, bytes]
+) -> int:
+    """Replace new fonts and images by identical objects already present in the document.
+
+    Parameters
+    ----------
+    doc
+        The document, to which objects have just been added, e.g. with `insert_pdf`.
+    start
+        The first object number of the new objects.
+        Only new objects are compared to existing ones and only these are modified.
+    shared
+        The digests (see `compute_object_digest`) of fonts and images in the document,
+        mapped to their object numbers.
+        This dictionary is updated in place with the new objects that are kept.
+    memo
+        Digests of objects in the document, see `compute_object_digest`.
+
+    Returns
+    -------
+    nshared
+        The number of new objects replaced by an existing one.
+        References to these objects are redirected to the existing objects.
+        The replaced objects are no longer used and are removed when saving with garbage collection.
+    """
+    stop = doc.xref_length()
+    # Find all new fonts, their descriptors, programs and encodings, and images.
+    candidates = set()
+    for xref in range(start, stop):
+        keys = FONT_KEYS.get(doc.xref_get_key(xref, "Type")[1])
+        if keys is not None:
+            candidates.add(xref)
+            for key in keys:
+                kind, value = doc.xref_get_key(xref, key)
+                if kind == "xref":
+                    candidates.add(int(value.split()[0]))
+        elif doc.xref_get_key(xref, "Subtype")[1] == "/Image":
+            candidates.add(xref)
+    replacements = {}
+    for xref in sorted(candidates):
+        if xref < start:
+            continue
+        digest = compute_object_digest(doc, xref, memo)
+        other = shared.setdefault(digest, xref)
+        if other != xref:
+            replacements[xref] = other
+    if len(replacements) == 0:
+        return 0
+
+    # Redirect all references in new objects.
+    def replace(match: re.Match) -> str:
+        xref = replacements.get(int(match.group(1)))
+        return match.group() if xref is None else f"{xref} 0 R"
+
+    for xref in range(start, stop):
+        if xref in replacements:
+            continue
+        source = doc.xref_object(xref)
+        new_source = RE_REFERENCE_STR.sub(replace, source)
+        if new_source != source:
+            doc.update_object(xref, new_source)
+    return len(replacements)
 
 
 if __name__ == "__main__":
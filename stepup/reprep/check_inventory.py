@@ -20,13 +20,35 @@
 """Checking of inventory files."""
 
 import argparse
-from collections.abc import Iterator
+import json
+import os
+import stat
+import sys
+from collections.abc import Collection, Iterator
 
+import attrs
 from path import Path
 
-from .inventory import FileSummary, check_summary, get_summary, parse_summary
+from stepup.core.api import getenv
 
-__all__ = ("check_inventory", "iter_inventory", "main")
+from .inventory import (
+    DigestCache,
+    FileSummary,
+    check_summary,
+    get_summary,
+    iter_ordered,
+    parse_summary,
+)
+
+__all__ = (
+    "InventoryIssue",
+    "audit_inventory",
+    "check_inventory",
+    "diff_summary",
+    "iter_inventory",
+    "main",
+    "report_issues",
+)
 
 
 def main(argv: list[str] | None = None):
@@ -35,10 +57,127 @@ def main(argv: list[str] | None = None):
         prog="srr-check-inventory", description="Check an inventory.txt."
     )
     parser.add_argument("inventory_txt", help="An inventory.txt file generated with RepRep")
+    parser.add_argument(
+        "-g",
+        "--graph-db",
+        dest="paths_graph_db",
+        action="append",
+        default=[],
+        help="A StepUp .stepup/graph.db file. Digests of files whose stat properties match "
+        "those recorded in the workflow are not recomputed. "
+        "This option may be given multiple times.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of threads used to check files. "
+        "The default is ${REPREP_INVENTORY_JOBS} or 1 if the variable is not set.",
+    )
+    parser.add_argument(
+        "-k",
+        "--keep-going",
+        action="store_true",
+        default=False,
+        help="Report all problems instead of stopping at the first one.",
+    )
+    parser.add_argument(
+        "--json",
+        dest="path_json",
+        help="Write a JSON report with all problems to this file. Use - for the standard output. "
+        "Implies -k.",
+    )
+    parser.add_argument(
+        "--stat-only",
+        action="store_true",
+        default=False,
+        help="Only compare file sizes and modes, without computing digests.",
+    )
     args = parser.parse_args(argv)
     if not args.inventory_txt.endswith(".txt"):
         raise ValueError("The inventory file must end with .txt")
-    check_inventory(args.inventory_txt)
+    if args.jobs is None:
+        args.jobs = int(getenv("REPREP_INVENTORY_JOBS", "1"))
+    if not (args.keep_going or args.path_json is not None):
+        check_inventory(args.inventory_txt, args.paths_graph_db, args.jobs, args.stat_only)
+        return
+    issues = audit_inventory(args.inventory_txt, args.paths_graph_db, args.jobs, args.stat_only)
+    report_issues(
+        issues, args.path_json, {"inventory": args.inventory_txt, "stat_only": args.stat_only}
+    )
+
+
+def report_issues(issues: list["InventoryIssue"], path_json: str | None, header: dict):
+    """Print or write issues, and exit with a non-zero status if there are any.
+
+    Parameters
+    ----------
+    issues
+        The issues to report.
+    path_json
+        If given, the issues are written to this JSON file (`-` for the standard output).
+        Otherwise, they are printed in a human-readable form.
+    header
+        Additional fields to include in the JSON report.
+    """
+    if path_json is not None:
+        report = {**header, "issues": [attrs.asdict(issue) for issue in issues]}
+        if path_json == "-":
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        else:
+            with open(path_json, "w") as fh:
+                json.dump(report, fh, indent=2)
+                print(file=fh)
+    else:
+        for issue in issues:
+            print(issue.format())
+    if len(issues) > 0:
+        sys.exit(1)
+
+
+@attrs.define
+class InventoryIssue:
+    """A discrepancy between an inventory record and the file on disk."""
+
+    path: str = attrs.field()
+    """The path of the file, relative to the parent of the inventory file."""
+
+    kind: str = attrs.field()
+    """One of `missing`, `extra`, `corrupt`, `type`, `size`, `mode` or `digest`.
+
+    The kind `type` means that a directory was found where a file was expected.
+    """
+
+    expected: int | str | None = attrs.field(default=None)
+    """The value in the inventory. Digests are hexadecimal strings."""
+
+    actual: int | str | None = attrs.field(default=None)
+    """The value found on disk (or in an archive). Digests are hexadecimal strings."""
+
+    def format(self) -> str:
+        """Return a single-line description of the issue."""
+        if self.kind == "missing":
+            return f"File missing: {self.path}"
+        if self.kind == "extra":
+            return f"File not in inventory: {self.path}"
+        if self.kind == "corrupt":
+            return f"File corrupt: {self.path}"
+        if self.kind == "digest":
+            return f"File digest mismatch: {self.path}"
+        return f"File {self.kind} should be {self.expected} but got {self.actual}: {self.path}"
+
+
+def diff_summary(new: FileSummary, ref: FileSummary) -> list[InventoryIssue]:
+    """Return all differences between a new summary and the reference in the inventory."""
+    issues = []
+    if new.size != ref.size:
+        issues.append(InventoryIssue(ref.path, "size", ref.size, new.size))
+    if new.mode != ref.mode:
+        issues.append(InventoryIssue(ref.path, "mode", ref.mode, new.mode))
+    if new.digest != ref.digest:
+        issues.append(InventoryIssue(ref.path, "digest", ref.digest.hex(), new.digest.hex()))
+    return issues
 
 
 def iter_inventory(path_inventory: str) -> Iterator[FileSummary]:
@@ -51,13 +190,112 @@ def iter_inventory(path_inventory: str) -> Iterator[FileSummary]:
             yield fs
 
 
-def check_inventory(path_inventory: str):
+def _make_cache(root: str, paths_graph_db: Collection[str]) -> DigestCache | None:
+    if len(paths_graph_db) == 0:
+        return None
+    cache = DigestCache()
+    for path_graph_db in paths_graph_db:
+        cache.load_graph_db(path_graph_db, root)
+    return cache
+
+
+def _get_stat_summary(path: str, root: str, st: os.stat_result | None = None) -> FileSummary:
+    """Like `get_summary`, but without a digest."""
+    path = Path(path)
+    if st is None:
+        st = path.stat(follow_symlinks=False)
+    size = None if stat.S_ISLNK(st.st_mode) else st.st_size
+    return FileSummary(size, stat.filemode(st.st_mode), b"", path.relpath(root).normpath())
+
+
+def check_inventory(
+    path_inventory: str,
+    paths_graph_db: Collection[str] = (),
+    jobs: int = 1,
+    stat_only: bool = False,
+):
+    """Check that all files in an inventory have the expected size, mode and digest.
+
+    Parameters
+    ----------
+    path_inventory
+        The inventory file to check.
+    paths_graph_db
+        StepUp `graph.db` files from which digests are reused,
+        for files whose size, modification time, inode and mode are unchanged.
+        Note that this will not detect corruption of files that StepUp considers unchanged.
+    jobs
+        The number of threads used to check files.
+    stat_only
+        When `True`, only sizes and modes are checked.
+
+    Raises
+    ------
+    ValueError
+        At the first file that is not consistent with the inventory.
+    """
     path_inventory = Path(path_inventory)
     root = path_inventory.parent
-    for ref in iter_inventory(path_inventory):
-        new = get_summary(root / ref.path, root)
+    cache = _make_cache(root, paths_graph_db)
+    refs = list(iter_inventory(path_inventory))
+    if stat_only:
+        news = iter_ordered(lambda ref: _get_stat_summary(root / ref.path, root), refs, jobs)
+    else:
+        news = iter_ordered(lambda ref: get_summary(root / ref.path, root, cache), refs, jobs)
+    for new, ref in zip(news, refs, strict=True):
+        if stat_only:
+            new.digest = ref.digest
         check_summary(new, ref)
 
 
+def audit_inventory(
+    path_inventory: str,
+    paths_graph_db: Collection[str] = (),
+    jobs: int = 1,
+    stat_only: bool = False,
+) -> list[InventoryIssue]:
+    """Check all files in an inventory and collect all discrepancies.
+
+    Parameters
+    ----------
+    path_inventory
+        The inventory file to check.
+    paths_graph_db, jobs, stat_only
+        See `check_inventory`.
+
+    Returns
+    -------
+    issues
+        All discrepancies, in the order of the inventory file.
+        The list is empty when all files are consistent with the inventory.
+    """
+    path_inventory = Path(path_inventory)
+    root = path_inventory.parent
+    cache = _make_cache(root, paths_graph_db)
+
+    def audit(ref: FileSummary) -> list[InventoryIssue]:
+        path = root / ref.path
+        try:
+            st = path.stat(follow_symlinks=False)
+            if stat.S_ISDIR(st.st_mode):
+                return [InventoryIssue(ref.path, "type", ref.mode, stat.filemode(st.st_mode))]
+            if stat_only:
+                new = _get_stat_summary(path, root, st)
+                new.digest = ref.digest
+            else:
+                new = get_summary(path, root, cache, st)
+        except OSError:
+            # Also covers a parent directory replaced by a file (NotADirectoryError)
+            # and files that cannot be read.
+            return [InventoryIssue(ref.path, "missing")]
+        return diff_summary(new, ref)
+
+    return [
+        issue
+        for issues in iter_ordered(audit, iter_inventory(path_inventory), jobs)
+        for issue in issues
+    ]
+
+
 if __name__ == "__main__":
     main()
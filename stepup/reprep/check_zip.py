@@ -0,0 +1,234 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Verify a ZIP file created by `srr-zip-inventory` without extracting it."""
+
+import argparse
+import stat
+import zipfile
+import zlib
+
+from stepup.core.api import getenv
+from stepup.core.hash import HASH_CHUNK_SIZE
+
+from .check_inventory import InventoryIssue, diff_summary, report_issues
+from .inventory import FileSummary, check_summary, iter_ordered, new_digest_hasher, parse_summary
+
+__all__ = ("audit_zip", "check_zip", "read_zip_inventory", "summarize_member")
+
+
+def main(argv: list[str] | None = None):
+    """Main program."""
+    parser = argparse.ArgumentParser(
+        prog="srr-check-zip",
+        description="Check all members of a ZIP file against the inventory.txt it contains.",
+    )
+    parser.add_argument("path_zip", help="A ZIP file created with srr-zip-inventory")
+    parser.add_argument(
+        "-i",
+        "--inventory",
+        help="The name of the inventory file in the ZIP. "
+        "The default is the last member, which is where srr-zip-inventory puts it.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of threads used to check members. "
+        "The default is ${REPREP_INVENTORY_JOBS} or 1 if the variable is not set.",
+    )
+    parser.add_argument(
+        "-k",
+        "--keep-going",
+        action="store_true",
+        default=False,
+        help="Report all problems instead of stopping at the first one.",
+    )
+    parser.add_argument(
+        "--json",
+        dest="path_json",
+        help="Write a JSON report with all problems to this file. Use - for the standard output. "
+        "Implies -k.",
+    )
+    args = parser.parse_args(argv)
+    if args.jobs is None:
+        args.jobs = int(getenv("REPREP_INVENTORY_JOBS", "1"))
+    if not (args.keep_going or args.path_json is not None):
+        check_zip(args.path_zip, args.inventory, args.jobs)
+        return
+    issues = audit_zip(args.path_zip, args.inventory, args.jobs)
+    report_issues(issues, args.path_json, {"zip": args.path_zip})
+
+
+def read_zip_inventory(fz: zipfile.ZipFile, arcname: str | None = None) -> list[FileSummary]:
+    """Load the inventory embedded in a ZIP file.
+
+    Parameters
+    ----------
+    fz
+        A ZIP file opened for reading.
+    arcname
+        The name of the inventory member.
+        When not given, the last member is used.
+
+    Returns
+    -------
+    refs
+        The summaries in the inventory, in the order of the inventory file.
+    """
+    if arcname is None:
+        infolist = fz.infolist()
+        if len(infolist) == 0:
+            raise ValueError("Empty ZIP file, no inventory found.")
+        arcname = infolist[-1].filename
+    if not arcname.endswith(".txt"):
+        raise ValueError(f"The inventory file must have a `.txt` extension. Got {arcname}")
+    refs = []
+    text = fz.read(arcname).decode("utf-8")
+    for iline, line in enumerate(text.splitlines()):
+        try:
+            refs.append(parse_summary(line))
+        except Exception as exc:
+            raise ValueError(f"Could not parse line {iline} of {arcname}") from exc
+    return refs
+
+
+def summarize_member(fz: zipfile.ZipFile, zipinfo: zipfile.ZipInfo) -> FileSummary:
+    """Compute the summary of a ZIP member by streaming its decompressed contents.
+
+    Parameters
+    ----------
+    fz
+        A ZIP file opened for reading.
+        This function may be called from multiple threads for the same ZIP file.
+    zipinfo
+        The member to summarize.
+
+    Returns
+    -------
+    file_summary
+        Contains the size, mode, digest, and name of the member.
+        Members with symbolic link modes are treated as in inventory files:
+        their size is None and the digest is derived from the link target.
+
+    Raises
+    ------
+    zipfile.BadZipFile
+        When the member is corrupt, e.g. when its CRC does not match.
+    zlib.error
+        When the compressed data cannot be decompressed.
+    """
+    st_mode = zipinfo.external_attr >> 16
+    hasher = new_digest_hasher()
+    size = 0
+    with fz.open(zipinfo) as fh:
+        while True:
+            chunk = fh.read(HASH_CHUNK_SIZE)
+            if len(chunk) == 0:
+                break
+            hasher.update(chunk)
+            size += len(chunk)
+    if stat.S_ISLNK(st_mode):
+        size = None
+    return FileSummary(size, stat.filemode(st_mode), hasher.digest(), zipinfo.filename)
+
+
+def _get_zipinfos(
+    fz: zipfile.ZipFile, arcname: str | None
+) -> tuple[list[FileSummary], dict[str, zipfile.ZipInfo]]:
+    refs = read_zip_inventory(fz, arcname)
+    zipinfos = {zipinfo.filename: zipinfo for zipinfo in fz.infolist()}
+    if arcname is None:
+        arcname = fz.infolist()[-1].filename
+    del zipinfos[arcname]
+    return refs, zipinfos
+
+
+def check_zip(path_zip: str, arcname: str | None = None, jobs: int = 1):
+    """Check that all members of a ZIP file match the inventory it contains.
+
+    Parameters
+    ----------
+    path_zip
+        The ZIP file to check, created with `zip_inventory`.
+    arcname
+        The name of the inventory member, see `read_zip_inventory`.
+    jobs
+        The number of threads used to decompress and hash members.
+        Each thread holds at most one chunk of decompressed data in memory.
+
+    Raises
+    ------
+    ValueError
+        At the first member that is missing, corrupt, not listed in the inventory,
+        or not consistent with the inventory.
+    """
+    with zipfile.ZipFile(path_zip) as fz:
+        refs, zipinfos = _get_zipinfos(fz, arcname)
+        paths = set()
+        for ref in refs:
+            if ref.path not in zipinfos:
+                raise ValueError(f"File missing: {ref.path}")
+            paths.add(ref.path)
+        for name in zipinfos:
+            if name not in paths:
+                raise ValueError(f"File not in inventory: {name}")
+        news = iter_ordered(lambda ref: summarize_member(fz, zipinfos[ref.path]), refs, jobs)
+        try:
+            for new, ref in zip(news, refs, strict=True):
+                check_summary(new, ref)
+        except (zipfile.BadZipFile, zlib.error) as exc:
+            raise ValueError(f"Corrupt ZIP member in {path_zip}") from exc
+
+
+def audit_zip(path_zip: str, arcname: str | None = None, jobs: int = 1) -> list[InventoryIssue]:
+    """Check all members of a ZIP file and collect all discrepancies with its inventory.
+
+    Parameters
+    ----------
+    path_zip, arcname, jobs
+        See `check_zip`.
+
+    Returns
+    -------
+    issues
+        All problems found, in inventory order,
+        followed by members that are not listed in the inventory.
+    """
+    with zipfile.ZipFile(path_zip) as fz:
+        refs, zipinfos = _get_zipinfos(fz, arcname)
+
+        def audit(ref: FileSummary) -> list[InventoryIssue]:
+            zipinfo = zipinfos.get(ref.path)
+            if zipinfo is None:
+                return [InventoryIssue(ref.path, "missing")]
+            try:
+                new = summarize_member(fz, zipinfo)
+            except (zipfile.BadZipFile, zlib.error):
+                return [InventoryIssue(ref.path, "corrupt")]
+            return diff_summary(new, ref)
+
+        issues = [issue for issues in iter_ordered(audit, refs, jobs) for issue in issues]
+        paths = {ref.path for ref in refs}
+        issues.extend(InventoryIssue(name, "extra") for name in zipinfos if name not in paths)
+    return issues
+
+
+if __name__ == "__main__":
+    main()
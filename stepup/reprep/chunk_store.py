@@ -0,0 +1,460 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Content-addressed store of chunks, for deduplicated versions of a dataset.
+
+Files are split into chunks with content-defined boundaries,
+such that an insertion or deletion in a file only affects the chunks around the change.
+Each chunk is stored once, under its SHA-256 digest, and is shared by all versions using it.
+A version is described by a JSON manifest with the inventory file
+and, for each file, the list of its chunks.
+
+The store has the following layout:
+
+- ``chunks/ab/cdef...``: the chunk with SHA-256 digest ``abcdef...``.
+- ``versions/<name>.json``: the manifest of a version.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import stat
+import tempfile
+import zipfile
+from collections.abc import Iterator
+from typing import BinaryIO
+
+import attrs
+import numpy as np
+from path import Path
+
+from stepup.core.api import getenv
+
+from .check_inventory import diff_summary, iter_inventory
+from .inventory import (
+    FileSummary,
+    check_dest_paths,
+    get_dest_path,
+    iter_ordered,
+    new_digest_hasher,
+    parse_summary,
+)
+from .zip_inventory import DATE_TIME, CompressionPolicy, write_chunks_member
+
+__all__ = ("ChunkStore", "VersionStats", "iter_chunks")
+
+
+MIN_CHUNK_SIZE = 1 << 18
+"""Chunks are at least 256 KiB, except for the last chunk of a file."""
+
+MAX_CHUNK_SIZE = 1 << 22
+"""Chunks are at most 4 MiB."""
+
+CHUNK_MASK = ((1 << 20) - 1) << 12
+"""A chunk ends where the rolling hash has these bits set to zero, on average every 1 MiB."""
+
+GEAR = np.array(
+    [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:4], "little") for i in range(256)],
+    dtype=np.uint32,
+)
+"""Random 32-bit values for each byte, used by the Gear rolling hash."""
+
+VERSION_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9._+-]*")
+
+
+def main(argv: list[str] | None = None):
+    """Main program."""
+    parser = argparse.ArgumentParser(
+        prog="srr-chunk-store",
+        description="Store versions of a dataset in a deduplicated chunk store, "
+        "and restore them as files or as a reproducible ZIP file.",
+    )
+    parser.add_argument("store", help="The directory of the chunk store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser_add = subparsers.add_parser("add", help="Add the files of an inventory as a version.")
+    parser_add.add_argument("inventory_txt", help="The inventory file of the version.")
+    parser_add.add_argument("version", help="The name of the version.")
+    parser_add.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of threads used to chunk files. "
+        "The default is ${REPREP_INVENTORY_JOBS} or 1 if the variable is not set.",
+    )
+    parser_restore = subparsers.add_parser("restore", help="Write the files of a version.")
+    parser_restore.add_argument("version", help="The name of the version.")
+    parser_restore.add_argument("dest", help="The destination directory.")
+    parser_zip = subparsers.add_parser("zip", help="Write a version as a reproducible ZIP file.")
+    parser_zip.add_argument("version", help="The name of the version.")
+    parser_zip.add_argument("output_zip", help="Destination zip file.")
+    parser_zip.add_argument(
+        "-c",
+        "--compression",
+        help="The compression policy, see srr-zip-inventory. "
+        "The default is ${REPREP_ZIP_COMPRESSION} or deflate if the variable is not set.",
+    )
+    subparsers.add_parser("list", help="List all versions.")
+    args = parser.parse_args(argv)
+    store = ChunkStore(args.store)
+    if args.command == "add":
+        if args.jobs is None:
+            args.jobs = int(getenv("REPREP_INVENTORY_JOBS", "1"))
+        stats = store.add_version(args.inventory_txt, args.version, args.jobs)
+        print(stats.format())
+    elif args.command == "restore":
+        store.restore(args.version, args.dest)
+    elif args.command == "zip":
+        if args.compression is None:
+            args.compression = getenv("REPREP_ZIP_COMPRESSION", "deflate")
+        store.write_zip(args.version, args.output_zip, args.compression)
+    else:
+        for version in store.list_versions():
+            print(version)
+
+
+def iter_chunks(fh: BinaryIO) -> Iterator[bytes]:
+    """Split a file into chunks with content-defined boundaries.
+
+    Parameters
+    ----------
+    fh
+        A file opened in binary mode.
+
+    Returns
+    -------
+    chunks
+        The consecutive chunks of the file.
+        A chunk ends after a byte where the Gear rolling hash of the last 32 bytes
+        matches `CHUNK_MASK`, with chunk sizes between `MIN_CHUNK_SIZE` and `MAX_CHUNK_SIZE`.
+        The boundaries only depend on the file contents.
+    """
+    pending = b""
+    while True:
+        block = fh.read(MAX_CHUNK_SIZE)
+        data = pending + block if len(pending) > 0 else block
+        if len(data) == 0:
+            return
+        eof = len(block) == 0
+        begin = 0
+        for end in _find_boundaries(data):
+            if end - begin < MIN_CHUNK_SIZE:
+                continue
+            while end - begin > MAX_CHUNK_SIZE:
+                yield data[begin : begin + MAX_CHUNK_SIZE]
+                begin += MAX_CHUNK_SIZE
+            if end - begin >= MIN_CHUNK_SIZE:
+                yield data[begin:end]
+                begin = end
+        while len(data) - begin > MAX_CHUNK_SIZE:
+            yield data[begin : begin + MAX_CHUNK_SIZE]
+            begin += MAX_CHUNK_SIZE
+        pending = data[begin:]
+        if eof:
+            if len(pending) > 0:
+                yield pending
+            return
+
+
+def _find_boundaries(data: bytes) -> np.ndarray:
+    """Return the positions after all bytes where the rolling hash matches `CHUNK_MASK`.
+
+    The hash at position i is the sum of `GEAR[data[i - k]] << k` for k from 0 to 31,
+    computed for all positions at once by doubling the window in five steps.
+    Only positions with a full window of 32 bytes are considered,
+    which is always the case for chunk boundaries, because `MIN_CHUNK_SIZE` is larger.
+    """
+    hashes = GEAR[np.frombuffer(data, dtype=np.uint8)]
+    width = 1
+    while width < 32 and len(hashes) > width:
+        hashes = hashes[width:] + (hashes[:-width] << np.uint32(width))
+        width *= 2
+    if width < 32:
+        return np.zeros(0, dtype=np.intp)
+    return np.flatnonzero((hashes & np.uint32(CHUNK_MASK)) == 0) + 32
+
+
+@attrs.define
+class VersionStats:
+    """Statistics of a version added to a chunk store."""
+
+    nfile: int = attrs.field(default=0)
+    """The number of files in the version."""
+
+    size: int = attrs.field(default=0)
+    """The total size of all regular files."""
+
+    nchunk: int = attrs.field(default=0)
+    """The total number of chunks of all files."""
+
+    nchunk_new: int = attrs.field(default=0)
+    """The number of chunks that were not yet present in the store."""
+
+    size_new: int = attrs.field(default=0)
+    """The total size of the new chunks."""
+
+    def format(self) -> str:
+        """Return a single-line description of the statistics."""
+        return (
+            f"Files: {self.nfile}, size: {self.size} bytes, chunks: {self.nchunk}, "
+            f"new chunks: {self.nchunk_new}, new size: {self.size_new} bytes"
+        )
+
+
+@attrs.define
+class ChunkStore:
+    """A directory with deduplicated chunks and manifests of dataset versions.
+
+    Chunks and manifests are written to temporary files first and then renamed,
+    so the store remains consistent when a process is interrupted
+    and multiple threads may add chunks at the same time.
+    """
+
+    root: Path = attrs.field(converter=Path)
+    """The directory of the store."""
+
+    def _path_chunk(self, digest: bytes) -> Path:
+        digest_hex = digest.hex()
+        return self.root / "chunks" / digest_hex[:2] / digest_hex[2:]
+
+    def _path_manifest(self, version: str) -> Path:
+        if VERSION_NAME.fullmatch(version) is None:
+            raise ValueError(f"Invalid version name: {version}")
+        return self.root / "versions" / f"{version}.json"
+
+    def list_versions(self) -> list[str]:
+        """Return the names of all versions in the store."""
+        path_versions = self.root / "versions"
+        if not path_versions.is_dir():
+            return []
+        return sorted(path.stem for path in path_versions.iterdir() if path.suffix == ".json")
+
+    def add_version(self, path_inventory: str, version: str, jobs: int = 1) -> VersionStats:
+        """Add all files listed in an inventory file as a new version.
+
+        Parameters
+        ----------
+        path_inventory
+            The inventory.txt file.
+            The size, mode and digest of each file is checked while it is chunked.
+        version
+            The name of the version, which must not exist yet.
+        jobs
+            The number of threads used to chunk files.
+
+        Returns
+        -------
+        stats
+            Statistics of the new version, including the number of new chunks.
+        """
+        path_manifest = self._path_manifest(version)
+        if path_manifest.exists():
+            raise ValueError(f"Version already exists in chunk store: {version}")
+        path_inventory = Path(path_inventory)
+        if not path_inventory.endswith(".txt"):
+            raise ValueError(
+                f"The inventory file must have a `.txt` extension. Got {path_inventory}"
+            )
+        root = path_inventory.parent
+        refs = list(iter_inventory(path_inventory))
+        stats = VersionStats()
+        files = {}
+        for ref, (entry, nchunk_new, size_new) in zip(
+            refs,
+            iter_ordered(lambda ref: self._add_file(root / ref.path, ref), refs, jobs),
+            strict=True,
+        ):
+            files[ref.path] = entry
+            stats.nfile += 1
+            if ref.size is not None:
+                stats.size += ref.size
+                stats.nchunk += len(entry["chunks"])
+                stats.nchunk_new += nchunk_new
+                stats.size_new += size_new
+        manifest = {
+            "inventory": {
+                "name": path_inventory.name,
+                "mode": path_inventory.stat().st_mode,
+                "text": path_inventory.read_text(),
+            },
+            "files": files,
+        }
+        _write_atomic(path_manifest, json.dumps(manifest, indent=2).encode("utf-8") + b"\n")
+        return stats
+
+    def _add_file(self, src: Path, ref: FileSummary) -> tuple[dict, int, int]:
+        """Chunk a file, store new chunks and return its manifest entry."""
+        st = src.stat(follow_symlinks=False)
+        if stat.S_ISLNK(st.st_mode):
+            target = src.readlink()
+            digest = hashlib.sha256(target.encode("utf-8")).digest()
+            new = FileSummary(None, stat.filemode(st.st_mode), digest, ref.path)
+            entry = {"mode": st.st_mode, "target": target}
+            nchunk_new = size_new = 0
+        else:
+            hasher = new_digest_hasher()
+            chunks = []
+            nchunk_new = size_new = 0
+            size = 0
+            with open(src, "rb") as fh:
+                for chunk in iter_chunks(fh):
+                    hasher.update(chunk)
+                    size += len(chunk)
+                    chunk_digest = hashlib.sha256(chunk).digest()
+                    chunks.append(chunk_digest.hex())
+                    path_chunk = self._path_chunk(chunk_digest)
+                    if not path_chunk.exists():
+                        _write_atomic(path_chunk, chunk)
+                        nchunk_new += 1
+                        size_new += len(chunk)
+            new = FileSummary(size, stat.filemode(st.st_mode), hasher.digest(), ref.path)
+            entry = {"mode": st.st_mode, "chunks": chunks}
+        issues = diff_summary(new, ref)
+        if len(issues) > 0:
+            raise ValueError(f"File not consistent with inventory. {issues[0].format()}")
+        return entry, nchunk_new, size_new
+
+    def load_manifest(self, version: str) -> dict:
+        """Load the manifest of a version."""
+        path_manifest = self._path_manifest(version)
+        if not path_manifest.is_file():
+            raise ValueError(f"Version not found in chunk store: {version}")
+        with open(path_manifest) as fh:
+            return json.load(fh)
+
+    def iter_file_chunks(self, entry: dict) -> Iterator[bytes]:
+        """Iterate over the chunks of a regular file in a manifest, verifying each chunk."""
+        for digest_hex in entry["chunks"]:
+            digest = bytes.fromhex(digest_hex)
+            data = self._path_chunk(digest).read_bytes()
+            if hashlib.sha256(data).digest() != digest:
+                raise ValueError(f"Corrupt chunk in store: {digest_hex}")
+            yield data
+
+    def restore(self, version: str, dest: str):
+        """Write all files of a version to a directory.
+
+        Parameters
+        ----------
+        version
+            The name of the version.
+        dest
+            The destination directory, created if needed.
+            The inventory file is written last, after all files were verified.
+        """
+        manifest = self.load_manifest(version)
+        dest = Path(dest)
+        refs = [parse_summary(line) for line in manifest["inventory"]["text"].splitlines()]
+        check_dest_paths(refs)
+        for ref in refs:
+            entry = manifest["files"][ref.path]
+            dst = get_dest_path(dest, ref.path)
+            dst.parent.makedirs_p()
+            dst.remove_p()
+            if "target" in entry:
+                dst.symlink_to(entry["target"])
+                continue
+            hasher = new_digest_hasher()
+            with open(dst, "wb") as fh:
+                for chunk in self.iter_file_chunks(entry):
+                    hasher.update(chunk)
+                    fh.write(chunk)
+            dst.chmod(stat.S_IMODE(entry["mode"]))
+            new = FileSummary(dst.size, stat.filemode(entry["mode"]), hasher.digest(), ref.path)
+            issues = diff_summary(new, ref)
+            if len(issues) > 0:
+                raise ValueError(
+                    f"Restored file not consistent with inventory. {issues[0].format()}"
+                )
+        path_inventory = get_dest_path(dest, manifest["inventory"]["name"])
+        path_inventory.remove_p()
+        path_inventory.write_text(manifest["inventory"]["text"])
+        path_inventory.chmod(stat.S_IMODE(manifest["inventory"]["mode"]))
+
+    def write_zip(self, version: str, path_zip: str, compression: str = "deflate"):
+        """Stream a version into a ZIP file, identical to the one created by `zip_inventory`.
+
+        Parameters
+        ----------
+        version
+            The name of the version.
+        path_zip
+            The ZIP file to be created.
+        compression
+            The compression policy, see `CompressionPolicy`.
+        """
+        manifest = self.load_manifest(version)
+        policy = CompressionPolicy.from_spec(compression)
+        path_zip = Path(path_zip)
+        fd, path_tmp = tempfile.mkstemp(suffix=".zip", dir=path_zip.parent.normpath())
+        try:
+            with os.fdopen(fd, "wb") as fh, zipfile.ZipFile(fh, "w") as fz:
+                fz.comment = policy.comment
+                for line in manifest["inventory"]["text"].splitlines():
+                    ref = parse_summary(line)
+                    entry = manifest["files"][ref.path]
+                    if "target" in entry:
+                        zipinfo = zipfile.ZipInfo(ref.path, DATE_TIME)
+                        zipinfo.create_system = 3  # 3 means Unix
+                        zipinfo.external_attr |= entry["mode"] << 16
+                        fz.writestr(zipinfo, entry["target"])
+                    else:
+                        write_chunks_member(
+                            fz,
+                            self.iter_file_chunks(entry),
+                            ref.path,
+                            entry["mode"],
+                            ref.size,
+                            ref,
+                            policy,
+                        )
+                text = manifest["inventory"]["text"].encode("utf-8")
+                write_chunks_member(
+                    fz,
+                    [text],
+                    manifest["inventory"]["name"],
+                    manifest["inventory"]["mode"],
+                    len(text),
+                    None,
+                    policy,
+                )
+            os.replace(path_tmp, path_zip)
+        except BaseException:
+            if os.path.exists(path_tmp):
+                os.remove(path_tmp)
+            raise
+
+
+def _write_atomic(path: Path, data: bytes):
+    """Write a file through a temporary file in the same directory."""
+    path.parent.makedirs_p()
+    fd, path_tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".srr-tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.replace(path_tmp, path)
+    except BaseException:
+        if os.path.exists(path_tmp):
+            os.remove(path_tmp)
+        raise
+
+
+if __name__ == "__main__":
+    main()
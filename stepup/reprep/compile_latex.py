@@ -33,7 +33,7 @@ from stepup.core.hash import compute_file_digest
 from .bibtex_log import parse_bibtex_log
 from .latex_deps import scan_latex_deps
 from .latex_log import parse_latex_log
-from .make_inventory import write_inventory
+from .make_inventory import get_workflow_graph_dbs, write_inventory
 
 
 def main(argv: list[str] | None = None) -> None:
@@ -129,7 +129,12 @@ def main(argv: list[str] | None = None) -> None:
     # Write inventory
     inventory_files.extend([f"{stem}.tex", f"{stem}.aux", f"{stem}.pdf"])
     if args.inventory is not None:
-        write_inventory(args.inventory, inventory_files, do_amend=False)
+        write_inventory(
+            args.inventory,
+            inventory_files,
+            do_amend=False,
+            paths_graph_db=get_workflow_graph_dbs(),
+        )
 
     # Look for input files and output files from the fls file.
     # These are usually worth tracking, but are not needed for the inventory file.
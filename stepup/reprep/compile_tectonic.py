@@ -35,7 +35,7 @@ from stepup.core.api import amend, getenv
 from stepup.core.extapi import filter_dependencies, run_subprocess
 from stepup.core.utils import string_to_bool
 
-from .make_inventory import write_inventory
+from .make_inventory import get_workflow_graph_dbs, write_inventory
 
 
 def main(argv: list[str] | None = None) -> None:
@@ -106,7 +106,12 @@ def main(argv: list[str] | None = None) -> None:
     # Write inventory
     if args.inventory is not None:
         inventory_paths = sorted(inp_paths) + out_paths
-        write_inventory(args.inventory, inventory_paths, do_amend=False)
+        write_inventory(
+            args.inventory,
+            inventory_paths,
+            do_amend=False,
+            paths_graph_db=get_workflow_graph_dbs(),
+        )
 
     if cp.returncode != 0:
         # Only use sys.exit in cases of an error,
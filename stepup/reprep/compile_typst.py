@@ -37,7 +37,7 @@ from stepup.core.api import amend, getenv
 from stepup.core.extapi import filter_dependencies, run_subprocess
 from stepup.core.utils import string_to_bool
 
-from .make_inventory import write_inventory
+from .make_inventory import get_workflow_graph_dbs, write_inventory
 
 
 def main():
@@ -116,7 +116,12 @@ def main():
     # Write inventory
     if args.inventory is not None:
         inventory_paths = sorted(inp_paths) + sorted(out_paths)
-        write_inventory(args.inventory, inventory_paths, do_amend=False)
+        write_inventory(
+            args.inventory,
+            inventory_paths,
+            do_amend=False,
+            paths_graph_db=get_workflow_graph_dbs(),
+        )
 
     # If the output path contains placeholders `{p}`, `{0p}`, or `{t}`,
     # we need to amend the output.
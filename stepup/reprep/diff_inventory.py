@@ -0,0 +1,284 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Compare two inventory files without reading the files they describe."""
+
+import argparse
+import contextlib
+import itertools
+import json
+import sys
+from collections import defaultdict, deque
+from collections.abc import Callable, Iterable, Sequence
+
+import attrs
+
+from .check_inventory import iter_inventory
+from .inventory import FileSummary
+from .inventory_index import InventoryIndex, load_inventory_index
+
+__all__ = ("InventoryChange", "diff_indexes", "diff_inventories", "diff_inventory", "main")
+
+
+def main(argv: list[str] | None = None):
+    """Main program."""
+    parser = argparse.ArgumentParser(
+        prog="srr-diff-inventory", description="Compare two inventory.txt files."
+    )
+    parser.add_argument("old_txt", help="The old inventory file.")
+    parser.add_argument("new_txt", help="The new inventory file.")
+    parser.add_argument(
+        "--json",
+        dest="path_json",
+        help="Write a JSON report with all changes to this file. Use - for the standard output.",
+    )
+    parser.add_argument(
+        "--no-renames",
+        dest="renames",
+        action="store_false",
+        default=True,
+        help="Do not detect renamed files. They are reported as removed and added instead.",
+    )
+    args = parser.parse_args(argv)
+    changes = diff_inventory(args.old_txt, args.new_txt, args.renames)
+    if args.path_json is None:
+        for change in changes:
+            print(change.format())
+        return
+    report = {
+        "old": args.old_txt,
+        "new": args.new_txt,
+        "changes": [attrs.asdict(change) for change in changes],
+    }
+    if args.path_json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.path_json, "w") as fh:
+            json.dump(report, fh, indent=2)
+            print(file=fh)
+
+
+@attrs.define
+class InventoryChange:
+    """A difference between two inventory files."""
+
+    path: str = attrs.field()
+    """The path of the file in the new inventory, or in the old one if it was removed."""
+
+    kind: str = attrs.field()
+    """One of `added`, `removed`, `modified`, `mode` or `renamed`."""
+
+    old_path: str | None = attrs.field(default=None)
+    """The path in the old inventory, only for renamed files."""
+
+    old_mode: str | None = attrs.field(default=None)
+    """The old mode, only set when the mode has changed."""
+
+    new_mode: str | None = attrs.field(default=None)
+    """The new mode, only set when the mode has changed."""
+
+    def format(self) -> str:
+        """Return a single-line description of the change."""
+        if self.kind == "renamed":
+            result = f"Renamed: {self.old_path} -> {self.path}"
+        elif self.kind == "mode":
+            result = f"Mode changed: {self.path}"
+        else:
+            result = f"{self.kind.capitalize()}: {self.path}"
+        if self.old_mode is not None:
+            result += f" ({self.old_mode} -> {self.new_mode})"
+        return result
+
+
+def diff_inventory(old_txt: str, new_txt: str, renames: bool = True) -> list[InventoryChange]:
+    """Compare two inventory files.
+
+    When both inventory files have an up-to-date binary index (see `write_inventory_index`),
+    the comparison uses `diff_indexes`, which skips unchanged directories.
+    Otherwise, all records are compared with `diff_inventories`.
+
+    Parameters
+    ----------
+    old_txt, new_txt
+        The inventory files to compare.
+    renames
+        See `diff_inventories`.
+
+    Returns
+    -------
+    changes
+        See `diff_inventories`.
+    """
+    with contextlib.ExitStack() as stack:
+        old_index = load_inventory_index(old_txt)
+        if old_index is not None:
+            stack.enter_context(old_index)
+            new_index = load_inventory_index(new_txt)
+            if new_index is not None:
+                stack.enter_context(new_index)
+                return diff_indexes(old_index, new_index, renames)
+    return diff_inventories(iter_inventory(old_txt), iter_inventory(new_txt), renames)
+
+
+def _sorted_by_path(summaries: Iterable[FileSummary]) -> list[FileSummary]:
+    """Return summaries sorted by path, which is normally a no-op for inventory files."""
+    summaries = list(summaries)
+    if any(fs1.path > fs2.path for fs1, fs2 in itertools.pairwise(summaries)):
+        summaries.sort(key=lambda fs: fs.path)
+    return summaries
+
+
+def diff_inventories(
+    olds: Iterable[FileSummary], news: Iterable[FileSummary], renames: bool = True
+) -> list[InventoryChange]:
+    """Compare two lists of file summaries with a merge join on the paths.
+
+    Parameters
+    ----------
+    olds, news
+        The old and new file summaries.
+        These are normally already sorted by path. If not, they are sorted first.
+    renames
+        When `True`, removed and added files with the same digest and size
+        are reported as renamed files.
+        Identical copies are paired in the order of their paths.
+
+    Returns
+    -------
+    changes
+        All changes sorted by path.
+        Files whose size, mode and digest are unchanged are not included.
+    """
+    return _merge_join(_sorted_by_path(olds), _sorted_by_path(news), renames)
+
+
+def diff_indexes(
+    old: InventoryIndex, new: InventoryIndex, renames: bool = True
+) -> list[InventoryChange]:
+    """Compare two binary inventory indexes, skipping directories with equal Merkle digests.
+
+    The cost of this comparison scales with the size of the directories that have changed,
+    rather than with the total number of files.
+
+    Parameters
+    ----------
+    old, new
+        The indexes of the old and new inventory files.
+    renames
+        See `diff_inventories`.
+
+    Returns
+    -------
+    changes
+        The same result as `diff_inventories`.
+    """
+    differ = set()
+
+    def skip(iold: int, inew: int, path: str) -> tuple[int, int] | None:
+        parts = path.split("/")[:-1]
+        for ndir in range(len(parts) + 1):
+            path_dir = "/".join(parts[:ndir])
+            if path_dir in differ:
+                continue
+            digest = old.get_tree_digest(path_dir)
+            if digest is not None and digest == new.get_tree_digest(path_dir):
+                return old.find_subtree_end(path_dir, iold), new.find_subtree_end(path_dir, inew)
+            differ.add(path_dir)
+        return None
+
+    return _merge_join(old, new, renames, skip)
+
+
+def _merge_join(
+    olds: Sequence[FileSummary],
+    news: Sequence[FileSummary],
+    renames: bool,
+    skip: Callable[[int, int, str], tuple[int, int] | None] | None = None,
+) -> list[InventoryChange]:
+    """Compare two sequences of file summaries sorted by path.
+
+    The optional `skip` function is called when both sequences have a record with the same path.
+    It may return new positions in both sequences, to skip identical records.
+    """
+    changes = []
+    removed = []
+    added = []
+    iold = 0
+    inew = 0
+    while iold < len(olds) or inew < len(news):
+        old = olds[iold] if iold < len(olds) else None
+        new = news[inew] if inew < len(news) else None
+        if new is None or (old is not None and old.path < new.path):
+            removed.append(old)
+            iold += 1
+        elif old is None or new.path < old.path:
+            added.append(new)
+            inew += 1
+        else:
+            if skip is not None:
+                skipped = skip(iold, inew, old.path)
+                if skipped is not None:
+                    iold, inew = skipped
+                    continue
+            mode_changed = old.mode != new.mode
+            if old.digest != new.digest or old.size != new.size:
+                change = InventoryChange(new.path, "modified")
+            elif mode_changed:
+                change = InventoryChange(new.path, "mode")
+            else:
+                change = None
+            if change is not None:
+                if mode_changed:
+                    change.old_mode = old.mode
+                    change.new_mode = new.mode
+                changes.append(change)
+            iold += 1
+            inew += 1
+
+    # Match removed and added files by digest.
+    if renames:
+        candidates = defaultdict(deque)
+        for old in removed:
+            candidates[old.digest, old.size].append(old)
+        renamed = set()
+        for new in added:
+            queue = candidates.get((new.digest, new.size))
+            if queue:
+                old = queue.popleft()
+                renamed.add(old.path)
+                change = InventoryChange(new.path, "renamed", old.path)
+                if old.mode != new.mode:
+                    change.old_mode = old.mode
+                    change.new_mode = new.mode
+                changes.append(change)
+            else:
+                changes.append(InventoryChange(new.path, "added"))
+        changes.extend(
+            InventoryChange(old.path, "removed") for old in removed if old.path not in renamed
+        )
+    else:
+        changes.extend(InventoryChange(new.path, "added") for new in added)
+        changes.extend(InventoryChange(old.path, "removed") for old in removed)
+    changes.sort(key=lambda change: change.path)
+    return changes
+
+
+if __name__ == "__main__":
+    main()
@@ -19,12 +19,23 @@
 # --
 """Inventory utilities."""
 
+import hashlib
+import os
+import sqlite3
 import stat
+import time
+from collections import deque
+from collections.abc import Callable, Collection, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Self, TypeVar
 
 import attrs
 from path import Path
 
-from stepup.core.hash import compute_file_digest
+from stepup.core.hash import HASH_CHUNK_SIZE, FileHash, compute_file_digest
+
+T = TypeVar("T")
+R = TypeVar("R")
 
 
 @attrs.define
@@ -46,9 +57,246 @@ class FileSummary:
     mode: str = attrs.field()
     digest: bytes = attrs.field()
     path: str = attrs.field()
+    extra_digests: dict[str, bytes] = attrs.field(factory=dict, kw_only=True, eq=False)
+    """Digests with other hash functions, computed in the same pass as the main digest.
+
+    These are not part of the inventory text file and are ignored when comparing summaries.
+    """
+
+
+DIGEST_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS digest (
+  path TEXT PRIMARY KEY,
+  size INTEGER NOT NULL,
+  mtime_ns INTEGER NOT NULL,
+  ino INTEGER NOT NULL,
+  mode INTEGER NOT NULL,
+  digest BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+
+RACY_MTIME_NS = 2_000_000_000
+"""Files modified less than this number of nanoseconds ago are not stored in the cache.
+
+Some file systems have a coarse timestamp resolution,
+such that a file may be modified after its digest was computed,
+without a change in its modification time.
+"""
+
+
+def new_digest_hasher():
+    """Create a hash object for the digests of regular files in inventories.
+
+    The result is the same as that of `stepup.core.hash.compute_file_digest`,
+    but this allows computing the digest while the file contents are used for other purposes.
+    """
+    return hashlib.sha256()
+
+
+def check_digest_algorithms(algorithms: Iterable[str]) -> list[str]:
+    """Validate names of hash functions for extra digests and return them without duplicates.
+
+    Any fixed-size hash function guaranteed by `hashlib` is supported, e.g. `md5` or `blake2b`.
+    """
+    result = []
+    for algorithm in algorithms:
+        if algorithm not in hashlib.algorithms_guaranteed or algorithm.startswith("shake_"):
+            raise ValueError(f"Unsupported hash function for extra digests: {algorithm}")
+        if algorithm not in result:
+            result.append(algorithm)
+    return result
+
+
+def compute_file_digests(
+    path: str, algorithms: Collection[str] = ("sha256",), follow_symlinks: bool = False
+) -> dict[str, bytes]:
+    """Compute digests of a file with several hash functions, reading it only once.
+
+    Parameters
+    ----------
+    path
+        The file or symbolic link of which the digests must be computed.
+    algorithms
+        Names of hash functions in `hashlib`.
+    follow_symlinks
+        As in `stepup.core.hash.compute_file_digest`:
+        when `False`, the link target of a symbolic link is hashed instead of the file contents.
+
+    Returns
+    -------
+    digests
+        A dictionary with the digest for each hash function.
+        The `sha256` digest is identical to the one computed with
+        `stepup.core.hash.compute_file_digest`.
+    """
+    hashers = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+    path = Path(path)
+    if path.islink() and not follow_symlinks:
+        target = path.readlink().encode("utf-8")
+        for hasher in hashers.values():
+            hasher.update(target)
+    else:
+        # A single buffer is reused for all chunks and shared by all hash functions.
+        buf = bytearray(HASH_CHUNK_SIZE)
+        view = memoryview(buf)
+        with open(path, "rb", buffering=0) as fh:
+            while True:
+                nread = fh.readinto(buf)
+                if nread == 0:
+                    break
+                chunk = view[:nread]
+                for hasher in hashers.values():
+                    hasher.update(chunk)
+    return {algorithm: hasher.digest() for algorithm, hasher in hashers.items()}
+
 
+def _stat_key(st: os.stat_result) -> tuple[int, int, int, int]:
+    return (st.st_size, st.st_mtime_ns, st.st_ino, st.st_mode)
 
-def get_summary(path: str, root: str) -> FileSummary:
+
+@attrs.define
+class DigestCache:
+    """Digests of regular files, reused as long as their stat properties are unchanged.
+
+    The cache is loaded from and saved to an SQLite database.
+    A digest is reused when the size, modification time (in nanoseconds),
+    inode and mode of a file match those recorded in the database.
+    Only the entries looked up or stored after loading are saved,
+    so files that are no longer part of the inventory are dropped from the cache.
+
+    Digests can also be taken from the `graph.db` file of a StepUp workflow,
+    which uses the same hash function and records the same stat properties.
+
+    The methods `lookup` and `store` may be called from multiple threads.
+    """
+
+    path_db: str | None = attrs.field(default=None)
+    """The SQLite database to load from and save to. If `None`, the cache is not persistent."""
+
+    _old: dict[str, tuple[tuple[int, int, int, int], bytes]] = attrs.field(init=False, factory=dict)
+    """Entries loaded from the database: path -> (stat key, digest)."""
+
+    _new: dict[str, tuple[tuple[int, int, int, int], bytes]] = attrs.field(init=False, factory=dict)
+    """Entries to be saved in the database: path -> (stat key, digest)."""
+
+    _workflow: dict[str, FileHash] = attrs.field(init=False, factory=dict)
+    """File hashes loaded from StepUp graph.db files: path -> file hash."""
+
+    @classmethod
+    def load(cls, path_db: str) -> Self:
+        """Load a digest cache from a database, or start from scratch if it does not exist."""
+        cache = cls(path_db)
+        if not os.path.isfile(path_db):
+            return cache
+        try:
+            con = sqlite3.connect(f"file:{path_db}?mode=ro", uri=True)
+            try:
+                sql = "SELECT path, size, mtime_ns, ino, mode, digest FROM digest"
+                for path, size, mtime_ns, ino, mode, digest in con.execute(sql):
+                    cache._old[path] = ((size, mtime_ns, ino, mode), digest)
+            finally:
+                con.close()
+        except sqlite3.DatabaseError:
+            # A corrupt or incompatible cache is simply discarded.
+            cache._old.clear()
+        return cache
+
+    def load_graph_db(self, path_graph_db: str, root: str):
+        """Add file hashes from a StepUp `graph.db` file.
+
+        Parameters
+        ----------
+        path_graph_db
+            The `graph.db` file, which must be in a `.stepup` directory.
+        root
+            The parent of the inventory file, to construct relative paths.
+
+        Notes
+        -----
+        When the database cannot be read, e.g. because it is locked or has a different schema,
+        it is ignored and the digests are computed as usual.
+        """
+        path_graph_db = Path(path_graph_db)
+        if path_graph_db.parent.name != ".stepup":
+            raise ValueError("A graph.db file must be in a .stepup directory.")
+        workflow_root = path_graph_db.parent.parent
+        try:
+            con = sqlite3.connect(f"file:{path_graph_db}?mode=ro", uri=True)
+            try:
+                sql = (
+                    "SELECT label, hash FROM node JOIN file ON node.i = file.node "
+                    "WHERE hash IS NOT NULL"
+                )
+                rows = con.execute(sql).fetchall()
+            finally:
+                con.close()
+        except sqlite3.DatabaseError:
+            return
+        for label, hash_json in rows:
+            if label.endswith("/"):
+                continue
+            file_hash = FileHash.from_json(hash_json)
+            if not file_hash.is_unknown:
+                path = (workflow_root / label).relpath(root).normpath()
+                self._workflow[path] = file_hash
+
+    def lookup(self, path: str, st: os.stat_result) -> bytes | None:
+        """Return the cached digest of a file, or `None` if its stat properties have changed.
+
+        Parameters
+        ----------
+        path
+            The path of the file, relative to the parent of the inventory file.
+        st
+            The current result of `os.stat` for the file.
+        """
+        key = _stat_key(st)
+        for entries in self._new, self._old:
+            entry = entries.get(path)
+            if entry is not None and entry[0] == key:
+                return entry[1]
+        file_hash = self._workflow.get(path)
+        if (
+            file_hash is not None
+            and stat.S_ISREG(st.st_mode)
+            and file_hash.mode == st.st_mode
+            and file_hash.size == st.st_size
+            and file_hash.mtime == st.st_mtime
+            and file_hash.inode == st.st_ino
+        ):
+            return file_hash.digest
+        return None
+
+    def store(self, path: str, st: os.stat_result, digest: bytes):
+        """Record the digest of a file with its stat properties."""
+        if time.time_ns() - st.st_mtime_ns < RACY_MTIME_NS:
+            return
+        self._new[path] = (_stat_key(st), digest)
+
+    def save(self):
+        """Write all entries looked up or stored since loading to the database."""
+        if self.path_db is None:
+            return
+        con = sqlite3.connect(self.path_db)
+        try:
+            with con:
+                con.executescript(DIGEST_CACHE_SCHEMA)
+                con.execute("DELETE FROM digest")
+                con.executemany(
+                    "INSERT INTO digest VALUES (?, ?, ?, ?, ?, ?)",
+                    sorted((path, *key, digest) for path, (key, digest) in self._new.items()),
+                )
+        finally:
+            con.close()
+
+
+def get_summary(
+    path: str,
+    root: str,
+    cache: DigestCache | None = None,
+    st: os.stat_result | None = None,
+    extra_digests: Collection[str] = (),
+) -> FileSummary:
     """Compute a file summary for an inventory file.
 
     Parameters
@@ -58,6 +306,16 @@ def get_summary(path: str, root: str) -> FileSummary:
         relative to the current working directory.
     root
         The parent of the inventory file, to construct relative paths.
+    cache
+        When given, the digest of a regular file is taken from the cache if possible.
+        Newly computed digests are stored in the cache.
+    st
+        The result of `lstat` on the path, if already known,
+        e.g. from a `DirEntry` obtained while walking a directory.
+    extra_digests
+        Names of additional hash functions, see `check_digest_algorithms`.
+        When given, the main digest and the extra digests are computed in a single pass
+        over the file contents, even if the main digest is found in the cache.
 
     Returns
     -------
@@ -65,14 +323,126 @@ def get_summary(path: str, root: str) -> FileSummary:
         Contains the size, mode, digest, and relative path of the file.
     """
     path = Path(path)
-    st = path.stat(follow_symlinks=False)
+    if st is None:
+        st = path.stat(follow_symlinks=False)
+    if stat.S_ISDIR(st.st_mode):
+        raise ValueError(f"Directories are not allowed in the inventory: {path}")
     size = None if stat.S_ISLNK(st.st_mode) else st.st_size
     mode = stat.filemode(st.st_mode)
-    digest = compute_file_digest(path, follow_symlinks=False)
     relpath = path.relpath(root).normpath()
+    if len(extra_digests) > 0:
+        digests = compute_file_digests(path, {"sha256", *extra_digests})
+        digest = digests["sha256"]
+        digests = {algorithm: digests[algorithm] for algorithm in extra_digests}
+        if cache is not None and size is not None:
+            cache.store(relpath, st, digest)
+        return FileSummary(size, mode, digest, relpath, extra_digests=digests)
+    if cache is None or size is None:
+        digest = compute_file_digest(path, follow_symlinks=False)
+    else:
+        digest = cache.lookup(relpath, st)
+        if digest is None:
+            digest = compute_file_digest(path, follow_symlinks=False)
+        cache.store(relpath, st, digest)
     return FileSummary(size, mode, digest, relpath)
 
 
+def iter_summaries(
+    paths: Iterable[str],
+    root: str,
+    jobs: int = 1,
+    cache: DigestCache | None = None,
+    stats: dict[str, os.stat_result] | None = None,
+    extra_digests: Collection[str] = (),
+) -> Iterator[FileSummary]:
+    """Compute file summaries of multiple files, possibly in parallel.
+
+    Parameters
+    ----------
+    paths
+        The locations of the files to be summarized,
+        relative to the current working directory.
+    root
+        The parent of the inventory file, to construct relative paths.
+    jobs
+        The number of threads used to compute the digests.
+    cache
+        An optional digest cache, see `get_summary`.
+    stats
+        Known `lstat` results of (some of) the paths, see `get_summary`.
+    extra_digests
+        Names of additional hash functions, see `get_summary`.
+
+    Returns
+    -------
+    file_summaries
+        An iterator over the summaries, in the same order as the paths.
+    """
+    if stats is None:
+        stats = {}
+    return iter_ordered(
+        lambda path: get_summary(path, root, cache, stats.get(path), extra_digests), paths, jobs
+    )
+
+
+def iter_ordered(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    jobs: int = 1,
+    weigh: Callable[[T], int] | None = None,
+    max_weight: int = 0,
+) -> Iterator[R]:
+    """Apply a function to all items with a bounded thread pool and yield results in order.
+
+    Parameters
+    ----------
+    func
+        The function to apply to each item.
+        It is called from worker threads when `jobs > 1`.
+    items
+        The items to process.
+        They are consumed lazily, such that at most a few items per thread are pending.
+    jobs
+        The number of threads.
+        When set to one, no threads are created.
+    weigh
+        An optional estimate of the memory used by the result of an item, e.g. a file size.
+    max_weight
+        When `weigh` is given, no more items are submitted while the total weight of the pending
+        items would exceed this value, except when no items are pending.
+
+    Returns
+    -------
+    results
+        The return values of `func`, in the same order as the items.
+        Exceptions raised by `func` are propagated when the corresponding result is reached.
+    """
+    if jobs < 1:
+        raise ValueError(f"The number of jobs must be strictly positive, got {jobs}")
+    if jobs == 1:
+        yield from map(func, items)
+        return
+    with ThreadPoolExecutor(jobs) as executor:
+        pending = deque()
+        total = 0
+        try:
+            for item in items:
+                weight = 0 if weigh is None else weigh(item)
+                while len(pending) >= 4 * jobs or (
+                    len(pending) > 0 and weigh is not None and total + weight > max_weight
+                ):
+                    future, done = pending.popleft()
+                    total -= done
+                    yield future.result()
+                pending.append((executor.submit(func, item), weight))
+                total += weight
+            while len(pending) > 0:
+                yield pending.popleft()[0].result()
+        finally:
+            for future, _ in pending:
+                future.cancel()
+
+
 def format_summary(fs: FileSummary) -> str:
     """Create a single-line string representation of the summary."""
     size_str = "               " if fs.size is None else format(fs.size, "15d")
@@ -99,3 +469,132 @@ def check_summary(new: FileSummary, ref: FileSummary):
         raise ValueError(f"File mode should be {ref.mode} but got {new.mode}: {new.path}")
     if new.digest != ref.digest:
         raise ValueError(f"File digest mismatch: {new.path}")
+
+
+def check_dest_paths(summaries: Iterable[FileSummary]):
+    """Refuse inventories whose files would be written outside a destination directory.
+
+    Parameters
+    ----------
+    summaries
+        The records of an inventory file, to be written to a destination directory.
+
+    Raises
+    ------
+    ValueError
+        When a path is absolute, contains `..` components,
+        or has a symbolic link of the same inventory as one of its parent directories.
+    """
+    summaries = list(summaries)
+    links = {fs.path for fs in summaries if fs.size is None}
+    for fs in summaries:
+        parts = fs.path.split("/")
+        if fs.path.startswith("/") or any(part in ("", ".", "..") for part in parts):
+            raise ValueError(f"Refusing to write a file outside the destination: {fs.path}")
+        for i in range(1, len(parts)):
+            if "/".join(parts[:i]) in links:
+                raise ValueError(f"Refusing to write a file through a symbolic link: {fs.path}")
+
+
+def get_dest_path(dest: str, path: str) -> Path:
+    """Return the path of a file in a destination directory, refusing symlinked parents.
+
+    Parameters
+    ----------
+    dest
+        The destination directory.
+    path
+        A relative path, already validated with `check_dest_paths`.
+
+    Returns
+    -------
+    dst
+        The path `dest / path`.
+
+    Raises
+    ------
+    ValueError
+        When one of the parent directories of `path` inside `dest` is a symbolic link.
+        Writing through such a link could modify files outside the destination.
+    """
+    dest = Path(dest)
+    parent = dest
+    for part in path.split("/")[:-1]:
+        parent = parent / part
+        if parent.islink():
+            raise ValueError(f"Refusing to write a file through a symbolic link: {parent}")
+    return dest / path
+
+
+def format_digest_sums(summaries: Iterable[FileSummary], algorithm: str) -> str:
+    """Format extra digests of regular files in the format of `md5sum` and similar tools.
+
+    Parameters
+    ----------
+    summaries
+        File summaries with extra digests, see `get_summary`.
+        Symbolic links are skipped because these tools would hash the file they point to.
+    algorithm
+        The name of the hash function.
+
+    Returns
+    -------
+    text
+        One line per regular file with the hexadecimal digest and the path.
+    """
+    return "".join(
+        f"{fs.extra_digests[algorithm].hex()}  {fs.path}\n"
+        for fs in summaries
+        if fs.size is not None
+    )
+
+
+def parse_digest_sums(text: str) -> dict[str, bytes]:
+    """Parse the output of `format_digest_sums` into a dictionary from path to digest."""
+    result = {}
+    for line in text.splitlines():
+        digest_hex, _, path = line.partition("  ")
+        result[path] = bytes.fromhex(digest_hex)
+    return result
+
+
+def compute_tree_digests(summaries: Iterable[FileSummary]) -> dict[str, bytes]:
+    """Compute Merkle digests of all directories in an inventory, bottom-up.
+
+    Parameters
+    ----------
+    summaries
+        The records of an inventory file.
+
+    Returns
+    -------
+    tree_digests
+        A dictionary with the digest of every directory that contains files in the inventory.
+        Keys are directory paths without trailing slash. The root is the empty string.
+        The digest of a directory depends on the names, sizes, modes and digests
+        of all its files and on the names and digests of its subdirectories.
+        Two directories with the same digest therefore have identical contents in the inventory.
+    """
+    children = {"": []}
+    for fs in summaries:
+        parent, _, name = fs.path.rpartition("/")
+        size_str = "-" if fs.size is None else str(fs.size)
+        # Register the parent and its ancestors, stopping at the first one that is known.
+        path_dir = parent
+        while path_dir not in children:
+            children[path_dir] = []
+            path_dir = path_dir.rpartition("/")[0]
+        children[parent].append(
+            (name.encode("utf-8"), f"f {fs.mode} {size_str} ".encode("ascii"), fs.digest)
+        )
+    tree_digests = {}
+    # Deeper directories come first, so their digests are known before those of their parents.
+    for path_dir in sorted(children, key=lambda path: path.count("/") + (path != ""), reverse=True):
+        hasher = new_digest_hasher()
+        for name, header, digest in sorted(children[path_dir]):
+            hasher.update(header + name + b"\0" + digest)
+        tree_digests[path_dir] = hasher.digest()
+        if path_dir != "":
+            parent, _, name = path_dir.rpartition("/")
+            children[parent].append((name.encode("utf-8"), b"d ", tree_digests[path_dir]))
+    return tree_digests
@@ -0,0 +1,270 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Binary index of an inventory file, for fast lookups by path.
+
+The index is a companion of an ``inventory.txt`` file with the same prefix and suffix ``.idx``.
+All integers are little-endian. The file consists of four parts:
+
+- A header: the magic bytes ``SRRINVX2``, the number of file records (uint64),
+  the number of directory records (uint64)
+  and the SHA-256 digest of the inventory text file from which the index was created.
+- Fixed-size file records sorted by the UTF-8 encoded path.
+  Each record contains the offset (uint64) and length (uint32) of the path
+  in the path table, the size (int64, -1 for symbolic links),
+  the mode (10 ASCII characters) and the file digest (32 bytes).
+- Fixed-size directory records sorted by the UTF-8 encoded path.
+  Each record contains the offset (uint64) and length (uint32) of the path
+  in the path table and the Merkle digest of the directory (32 bytes),
+  see `compute_tree_digests`. The root directory has an empty path.
+- The path table: the concatenation of all UTF-8 encoded file paths, in sorted order,
+  followed by all directory paths, in sorted order.
+"""
+
+import bisect
+import hashlib
+import mmap
+import struct
+from collections.abc import Iterable, Iterator
+from typing import Self
+
+import attrs
+from path import Path
+
+from .inventory import FileSummary, compute_tree_digests
+
+__all__ = ("INDEX_MAGIC", "InventoryIndex", "load_inventory_index", "write_inventory_index")
+
+
+INDEX_MAGIC = b"SRRINVX2"
+
+HEADER = struct.Struct("<8sQQ32s")
+
+RECORD = struct.Struct("<QIq10s32s")
+
+DIR_RECORD = struct.Struct("<QI32s")
+
+
+def write_inventory_index(path_idx: str, summaries: Iterable[FileSummary], path_txt: str):
+    """Write a binary index for an inventory file.
+
+    Parameters
+    ----------
+    path_idx
+        The index file to be written.
+    summaries
+        The records in the inventory file.
+    path_txt
+        The inventory file, of which the digest is stored in the index.
+    """
+    summaries = list(summaries)
+    items = sorted(
+        ((summary.path.encode("utf-8"), summary) for summary in summaries), key=lambda item: item[0]
+    )
+    dirs = sorted(
+        (path_dir.encode("utf-8"), digest)
+        for path_dir, digest in compute_tree_digests(summaries).items()
+    )
+    inventory_digest = hashlib.sha256(Path(path_txt).read_bytes()).digest()
+    with open(path_idx, "wb") as fh:
+        fh.write(HEADER.pack(INDEX_MAGIC, len(items), len(dirs), inventory_digest))
+        offset = 0
+        for path, summary in items:
+            size = -1 if summary.size is None else summary.size
+            fh.write(
+                RECORD.pack(offset, len(path), size, summary.mode.encode("ascii"), summary.digest)
+            )
+            offset += len(path)
+        for path, digest in dirs:
+            fh.write(DIR_RECORD.pack(offset, len(path), digest))
+            offset += len(path)
+        for path, _ in items:
+            fh.write(path)
+        for path, _ in dirs:
+            fh.write(path)
+
+
+class _PathColumn:
+    """Sequence view on the paths of file or directory records, for use with `bisect`."""
+
+    def __init__(self, index: "InventoryIndex", start: int, size: int, count: int):
+        self._index = index
+        self._start = start
+        self._size = size
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> bytes:
+        offset, length = struct.unpack_from("<QI", self._index.mm, self._start + i * self._size)
+        start = self._index.table_start + offset
+        return self._index.mm[start : start + length]
+
+
+@attrs.define
+class InventoryIndex:
+    """A memory-mapped binary inventory index.
+
+    Lookups by path use a binary search and only decode the records that are visited.
+    Use this class as a context manager or call `close` to release the memory map.
+    """
+
+    mm: mmap.mmap = attrs.field()
+    """The memory-mapped index file."""
+
+    count: int = attrs.field()
+    """The number of file records."""
+
+    ndir: int = attrs.field()
+    """The number of directory records."""
+
+    inventory_digest: bytes = attrs.field()
+    """The SHA-256 digest of the inventory file from which the index was created."""
+
+    paths: _PathColumn = attrs.field(init=False)
+    """The UTF-8 encoded paths of all file records, as a sorted sequence."""
+
+    dir_paths: _PathColumn = attrs.field(init=False)
+    """The UTF-8 encoded paths of all directory records, as a sorted sequence."""
+
+    @paths.default
+    def _default_paths(self) -> _PathColumn:
+        return _PathColumn(self, HEADER.size, RECORD.size, self.count)
+
+    @dir_paths.default
+    def _default_dir_paths(self) -> _PathColumn:
+        return _PathColumn(self, self.dir_start, DIR_RECORD.size, self.ndir)
+
+    @property
+    def dir_start(self) -> int:
+        """The offset of the first directory record."""
+        return HEADER.size + self.count * RECORD.size
+
+    @property
+    def table_start(self) -> int:
+        """The offset of the path table."""
+        return self.dir_start + self.ndir * DIR_RECORD.size
+
+    @classmethod
+    def load(cls, path_idx: str) -> Self:
+        """Memory-map an index file."""
+        with open(path_idx, "rb") as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mm) < HEADER.size:
+            mm.close()
+            raise ValueError(f"Inventory index too short: {path_idx}")
+        magic, count, ndir, inventory_digest = HEADER.unpack_from(mm, 0)
+        if magic != INDEX_MAGIC:
+            mm.close()
+            raise ValueError(f"Not an inventory index: {path_idx}")
+        return cls(mm, count, ndir, inventory_digest)
+
+    def close(self):
+        self.mm.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> FileSummary:
+        """Return the summary at a position in the sorted file records."""
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        offset, length, size, mode, digest = RECORD.unpack_from(
+            self.mm, HEADER.size + i * RECORD.size
+        )
+        start = self.table_start + offset
+        path = self.mm[start : start + length].decode("utf-8")
+        return FileSummary(None if size < 0 else size, mode.decode("ascii"), digest, path)
+
+    def find(self, path: str) -> int | None:
+        """Return the position of a path in the sorted records, or None if it is not present."""
+        key = path.encode("utf-8")
+        i = bisect.bisect_left(self.paths, key)
+        if i < self.count and self.paths[i] == key:
+            return i
+        return None
+
+    def find_subtree_end(self, path_dir: str, begin: int = 0) -> int:
+        """Return the position after the last file record in a directory (recursively)."""
+        if path_dir == "":
+            return self.count
+        key = path_dir.encode("utf-8") + b"/\xff"
+        return bisect.bisect_left(self.paths, key, begin)
+
+    def get(self, path: str) -> FileSummary | None:
+        """Return the summary of a file, or None if it is not in the inventory."""
+        i = self.find(path)
+        return None if i is None else self[i]
+
+    def get_tree_digest(self, path_dir: str) -> bytes | None:
+        """Return the Merkle digest of a directory, or None if it is not in the inventory.
+
+        The root directory is represented by an empty string.
+        """
+        key = path_dir.encode("utf-8")
+        i = bisect.bisect_left(self.dir_paths, key)
+        if i < self.ndir and self.dir_paths[i] == key:
+            offset = self.dir_start + i * DIR_RECORD.size
+            return DIR_RECORD.unpack_from(self.mm, offset)[2]
+        return None
+
+    def __contains__(self, path: str) -> bool:
+        return self.find(path) is not None
+
+    def __iter__(self) -> Iterator[FileSummary]:
+        """Iterate over all summaries, sorted by path."""
+        for i in range(self.count):
+            yield self[i]
+
+    def matches(self, path_txt: str) -> bool:
+        """Return True if the index was created from the given inventory file."""
+        return hashlib.sha256(Path(path_txt).read_bytes()).digest() == self.inventory_digest
+
+
+def load_inventory_index(path_txt: str) -> InventoryIndex | None:
+    """Load the index of an inventory file, if it exists and is up to date.
+
+    Parameters
+    ----------
+    path_txt
+        The inventory file. The index has the same prefix with suffix ``.idx``.
+
+    Returns
+    -------
+    index
+        The memory-mapped index, or None when there is no valid index for the inventory file.
+    """
+    path_idx = Path(path_txt[:-4] + ".idx")
+    if not path_idx.is_file():
+        return None
+    try:
+        index = InventoryIndex.load(path_idx)
+    except ValueError:
+        return None
+    if not index.matches(path_txt):
+        index.close()
+        return None
+    return index
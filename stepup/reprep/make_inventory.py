@@ -27,21 +27,35 @@ There are two kinds of inventory files:
 """
 
 import argparse
+import bisect
 import contextlib
+import fnmatch
+import os
+import re
 import shlex
 import sqlite3
+import stat
+import time
 from collections.abc import Collection
 
+import attrs
 from path import Path
 
-from stepup.core.api import amend
+from stepup.core.api import amend, getenv
 from stepup.core.extapi import run_subprocess
 from stepup.core.file import FileState
-from stepup.core.nglob import NGlobMulti
+from stepup.core.nglob import convert_nglob_to_regex
 
-from .inventory import format_summary, get_summary
+from .inventory import (
+    DigestCache,
+    check_digest_algorithms,
+    format_digest_sums,
+    format_summary,
+    iter_summaries,
+)
+from .inventory_index import write_inventory_index
 
-__all__ = ("main", "write_inventory")
+__all__ = ("FileLister", "get_workflow_graph_dbs", "main", "parse_inventory_def", "write_inventory")
 
 
 def main(argv: list[str] | None = None):
@@ -57,6 +71,50 @@ def main(argv: list[str] | None = None):
     )
     parser.add_argument("-i", "--inventory-def", help="An inventory definition file.", default=None)
     parser.add_argument("-o", "--inventory-txt", help="An inventory output file.", default=None)
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of threads used to compute file digests. "
+        "The default is ${REPREP_INVENTORY_JOBS} or 1 if the variable is not set.",
+    )
+    parser.add_argument(
+        "-c",
+        "--cache",
+        action="store_true",
+        default=False,
+        help="Keep the digests of all files in a cache file next to the inventory, "
+        "with suffix -cache.sqlite. Digests of unchanged files are then taken from the cache "
+        "the next time the inventory is made.",
+    )
+    parser.add_argument(
+        "-g",
+        "--graph-db",
+        dest="paths_graph_db",
+        action="append",
+        default=[],
+        help="A StepUp .stepup/graph.db file. Digests of files whose stat properties match "
+        "those recorded in the workflow are reused instead of being recomputed. "
+        "This option may be given multiple times.",
+    )
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        default=False,
+        help="Also write a binary index of the inventory, with suffix .idx, "
+        "for fast lookups by path.",
+    )
+    parser.add_argument(
+        "-d",
+        "--extra-digest",
+        dest="extra_digests",
+        action="append",
+        default=[],
+        help="Also compute digests with this hash function, e.g. md5, in the same pass "
+        "over the file contents. They are written in the format of md5sum "
+        "to a file with the same prefix as the inventory and the name of the hash function "
+        "as suffix, e.g. inventory.md5. This option may be given multiple times.",
+    )
     args = parser.parse_args(argv)
     make_inventory(args)
 
@@ -83,72 +141,345 @@ def make_inventory(args: argparse.Namespace):
     # Collect the complete list of files.
     path_inventory_txt = Path(args.inventory_txt)
     root = path_inventory_txt.parent.normpath()
+    stats = {}
     if args.inventory_def is None:
         paths = set()
     else:
         with open(args.inventory_def) as fh:
             lines = fh.readlines()
         with contextlib.chdir(root):
-            paths = {root / path for path in parse_inventory_def(lines)}
+            paths = {root / path for path in parse_inventory_def(lines, stats=stats)}
+        stats = {root / path: st for path, st in stats.items()}
+    # Paths from the inventory definition are never directories.
+    known_files = set(paths)
+    known_files.difference_update(args.paths)
     paths.update(args.paths)
-    write_inventory(path_inventory_txt, sorted(paths))
+    path_cache = path_inventory_txt[:-4] + "-cache.sqlite" if args.cache else None
+    path_index = path_inventory_txt[:-4] + ".idx" if args.index else None
+    write_inventory(
+        path_inventory_txt,
+        sorted(paths),
+        jobs=args.jobs,
+        path_cache=path_cache,
+        paths_graph_db=args.paths_graph_db,
+        path_index=path_index,
+        stats=stats,
+        extra_digests=args.extra_digests,
+        known_files=known_files,
+    )
 
 
-def get_file_list_nglob(i: int, args: list[str]) -> Collection[Path]:
-    if len(args) == 0:
-        raise ValueError(
-            f"Error on line {i} of the inventory definition: include or exclude has no arguments."
-        )
-    ngm = NGlobMulti.from_patterns(args)
-    ngm.glob()
-    return ngm.files()
+def _split_pattern(pattern: str) -> tuple[str, int | None]:
+    """Split a glob pattern into a wildcard-free prefix and the depth of the remainder.
+
+    Returns
+    -------
+    prefix
+        The leading directories without wildcards, including a trailing slash,
+        or an empty string if the first component contains wildcards.
+    depth
+        The number of path components matched by the remainder of the pattern,
+        or `None` if it contains a recursive wildcard.
+    """
+    parts = pattern.split("/")
+    nbase = 0
+    for part in parts[:-1]:
+        if any(char in part for char in "*?[$"):
+            break
+        nbase += 1
+    prefix = "".join(part + "/" for part in parts[:nbase])
+    rest = parts[nbase:]
+    return prefix, None if "**" in pattern else len(rest)
+
 
+def _covers(prefix: str, other: str) -> bool:
+    """Return True if a directory listing for `prefix` includes all paths under `other`."""
+    if prefix == "":
+        return not other.startswith(("/", "./", "../"))
+    return other.startswith(prefix)
 
-def get_file_list_git(i: int, args: list[str]) -> Collection[Path]:
-    cp = run_subprocess(shlex.join(["git", "ls-files", *args]))
-    return [Path(line.strip()) for line in cp.stdout.splitlines()]
 
+def _find_walk(walks: dict[str, int | None], prefix: str, depth: int | None) -> str | None:
+    """Return the prefix of a walk that lists all files below `prefix` up to `depth`, if any."""
+    for root, root_depth in walks.items():
+        if not _covers(root, prefix):
+            continue
+        if root_depth is None or (
+            depth is not None and prefix[len(root) :].count("/") + depth <= root_depth
+        ):
+            return root
+    return None
 
-def get_file_list_workflow(i: int, args: list[str]) -> Collection[Path]:
-    """Get a list of files from a StepUp graph.db workflow file.
 
-    There must be at least two arguments: the state and one or more patterns of graph.db files.
+def _walk(prefix: str, depth: int | None) -> list[str]:
+    """List all files below a prefix, up to a given depth, excluding directories.
+
+    Like `glob.glob` with `include_hidden=True`, symbolic links to directories are followed,
+    except when they point to a parent directory, which would cause an infinite loop.
     """
-    if len(args) < 2:
-        raise ValueError(
-            f"Error on line {i} of the inventory definition: Expecting at least two arguments."
-        )
-    state = FileState[args[0]]
-    ngm = NGlobMulti.from_patterns(args[1:])
-    ngm.glob()
-    paths_graph_db = ngm.files()
-    if len(paths_graph_db) == 0:
-        raise ValueError(
-            f"Error on line {i} of the inventory definition: no matching graph.db workflow files."
-        )
+    result = []
+
+    def scan(path_dir: str, depth: int | None, parents: frozenset[tuple[int, int]]):
+        try:
+            it = os.scandir(path_dir if path_dir != "" else ".")
+        except OSError:
+            return
+        with it:
+            entries = list(it)
+        for entry in entries:
+            path = path_dir + entry.name
+            if not entry.is_dir():
+                result.append(path)
+            elif depth is None or depth > 1:
+                st = entry.stat()
+                key = (st.st_dev, st.st_ino)
+                if key not in parents:
+                    scan(path + "/", None if depth is None else depth - 1, parents | {key})
+
+    try:
+        st = os.stat(prefix if prefix != "" else ".")
+    except OSError:
+        return result
+    scan(prefix, depth, frozenset([(st.st_dev, st.st_ino)]))
+    result.sort()
+    return result
+
+
+@attrs.define
+class FileLister:
+    """Evaluate the sources of all lines in an inventory definition with shared work.
+
+    All glob patterns are collected first by `plan`,
+    after which every directory tree is walked only once.
+    Each line then matches its patterns against the in-memory listing.
+    The output of `git ls-files` and the results of `graph.db` queries are cached.
+    """
+
+    stats: dict[str, os.stat_result] = attrs.field(init=False, factory=dict)
+    """The `lstat` results of files found by `tree`, which can be reused by `get_summary`."""
+
+    _listings: dict[str, list[str]] = attrs.field(init=False, factory=dict)
+    """Sorted directory listings, with the walked prefix as key."""
+
+    _walks: dict[str, int | None] = attrs.field(init=False, factory=dict)
+    """The depth of each walk, with the walked prefix as key."""
+
+    _git_files: list[str] | None = attrs.field(init=False, default=None)
+    """The output of `git ls-files` without arguments, if needed."""
+
+    _git_cache: dict[tuple[str, ...], list[Path]] = attrs.field(init=False, factory=dict)
+    """Cached outputs of `git ls-files` with pathspecs that cannot be matched in memory."""
+
+    _workflow_cache: dict[tuple[str, int], set[Path]] = attrs.field(init=False, factory=dict)
+    """Cached paths in a `graph.db` file, with the file and the state as key."""
+
+    def plan(self, commands: list[tuple[int, str, str, list[str]]]) -> dict[str, int | None]:
+        """Walk all directory trees needed to evaluate the glob patterns in the commands.
+
+        Parameters
+        ----------
+        commands
+            A list of parsed lines: line number, action, source and arguments.
+
+        Returns
+        -------
+        walks
+            The prefixes of the walked directory trees and the depth of each walk.
+            A prefix is only walked once if its listing is not included in that of a shorter
+            prefix, so shallow and deep patterns (e.g. `*.md` and `data/**`)
+            are walked separately instead of walking the whole tree.
+        """
+        patterns = []
+        for _, _, source, args in commands:
+            if source == "":
+                patterns.extend(args)
+            elif source == "-workflow":
+                patterns.extend(args[1:])
+        # Find the required depth of the walk for each prefix.
+        depths = {}
+        for pattern in patterns:
+            prefix, depth = _split_pattern(pattern)
+            if prefix in depths:
+                old = depths[prefix]
+                depth = None if old is None or depth is None else max(old, depth)
+            depths[prefix] = depth
+        # Walk each prefix, unless it is already included in a walk of a shorter prefix.
+        for prefix in sorted(depths, key=len):
+            depth = depths[prefix]
+            if _find_walk(self._walks, prefix, depth) is None:
+                self._listings[prefix] = _walk(prefix, depth)
+                self._walks[prefix] = depth
+        return dict(self._walks)
+
+    def _get_candidates(self, pattern: str) -> list[str]:
+        """Return all listed files that start with the wildcard-free prefix of the pattern."""
+        prefix, depth = _split_pattern(pattern)
+        root = _find_walk(self._walks, prefix, depth)
+        if root is None:
+            # Not planned: walk the tree for this pattern only.
+            root = prefix
+            self._listings[root] = _walk(prefix, depth)
+            self._walks[root] = depth
+        listing = self._listings[root]
+        literal = re.split(r"[*?\[$]", pattern, maxsplit=1)[0]
+        begin = bisect.bisect_left(listing, literal)
+        end = bisect.bisect_left(listing, literal + "\U0010ffff", begin)
+        return listing[begin:end]
+
+    def glob(self, patterns: list[str]) -> set[Path]:
+        """Return all files (not directories) matching any of the given patterns."""
+        result = set()
+        for pattern in patterns:
+            regex = re.compile(convert_nglob_to_regex(pattern))
+            result.update(map(Path, filter(regex.fullmatch, self._get_candidates(pattern))))
+        return result
+
+    def nglob(self, i: int, args: list[str]) -> Collection[Path]:
+        if len(args) == 0:
+            raise ValueError(
+                f"Error on line {i} of the inventory definition: "
+                "include or exclude has no arguments."
+            )
+        return self.glob(args)
+
+    def git(self, i: int, args: list[str]) -> Collection[Path]:
+        if any(arg.startswith(("-", ":", "/")) or ".." in arg.split("/") for arg in args):
+            # Options, magic pathspecs or paths outside the current directory.
+            key = tuple(args)
+            result = self._git_cache.get(key)
+            if result is None:
+                cp = run_subprocess(shlex.join(["git", "ls-files", *args]))
+                result = [Path(line.strip()) for line in cp.stdout.splitlines()]
+                result = [path for path in result if not path.is_dir()]
+                self._git_cache[key] = result
+            return result
+        if self._git_files is None:
+            cp = run_subprocess("git ls-files")
+            self._git_files = [line.strip() for line in cp.stdout.splitlines()]
+        if len(args) == 0:
+            matches = self._git_files
+        else:
+            matches = filter(_compile_pathspecs(args).fullmatch, self._git_files)
+        return [Path(path) for path in matches if not os.path.isdir(path)]
+
+    def tree(self, i: int, args: list[str]) -> Collection[Path]:
+        """Get all files in a directory tree, skipping entries whose names match prune patterns.
+
+        The first argument is the directory.
+        All subsequent arguments are `fnmatch` patterns of file or directory names
+        that are skipped during the walk, e.g. `.git` or `__pycache__`.
+        Symbolic links are included as such, except those pointing to directories,
+        which are neither included nor followed.
+        """
+        if len(args) < 1:
+            raise ValueError(
+                f"Error on line {i} of the inventory definition: Expecting at least one argument."
+            )
+        path_dir = args[0]
+        if not os.path.isdir(path_dir):
+            raise ValueError(
+                f"Error on line {i} of the inventory definition: not a directory: {path_dir}"
+            )
+        prune = re.compile("|".join(fnmatch.translate(pattern) for pattern in args[1:]) or "(?!)")
+        prefix = "" if path_dir in (".", "./") else path_dir.rstrip("/") + "/"
+        result = []
+        stack = [prefix]
+        while len(stack) > 0:
+            current = stack.pop()
+            try:
+                with os.scandir(current if current != "" else ".") as it:
+                    entries = list(it)
+            except OSError as exc:
+                raise ValueError(
+                    f"Error on line {i} of the inventory definition: "
+                    f"cannot read directory {current or '.'}: {exc.strerror}"
+                ) from exc
+            for entry in entries:
+                if prune.fullmatch(entry.name):
+                    continue
+                path = current + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(path + "/")
+                elif not (entry.is_symlink() and entry.is_dir()):
+                    self.stats[path] = entry.stat(follow_symlinks=False)
+                    result.append(Path(path))
+        return result
+
+    def workflow(self, i: int, args: list[str]) -> Collection[Path]:
+        """Get a list of files from a StepUp graph.db workflow file.
+
+        There must be at least two arguments: the state and one or more patterns of graph.db files.
+        """
+        if len(args) < 2:
+            raise ValueError(
+                f"Error on line {i} of the inventory definition: Expecting at least two arguments."
+            )
+        state = FileState[args[0]]
+        paths_graph_db = sorted(self.glob(args[1:]))
+        if len(paths_graph_db) == 0:
+            raise ValueError(
+                f"Error on line {i} of the inventory definition: "
+                "no matching graph.db workflow files."
+            )
+        paths = set()
+        for path_graph_db in paths_graph_db:
+            key = (path_graph_db, state.value)
+            cached = self._workflow_cache.get(key)
+            if cached is None:
+                cached = _query_graph_db(path_graph_db, state)
+                self._workflow_cache[key] = cached
+            paths.update(cached)
+        return paths
+
+
+def _compile_pathspecs(pathspecs: list[str]) -> re.Pattern:
+    """Emulate the default matching of `git ls-files` pathspecs (without magic) with a regex."""
+    regexes = []
+    for pathspec in pathspecs:
+        pathspec = pathspec.removeprefix("./").rstrip("/")
+        if pathspec in ("", "."):
+            return re.compile(".*", re.DOTALL)
+        # A pathspec matches the path itself and everything below it.
+        regexes.append(re.escape(pathspec) + "(?:/.*)?")
+        if any(char in pathspec for char in "*?["):
+            # Wildcards also match slashes.
+            regexes.append(fnmatch.translate(pathspec))
+    return re.compile("|".join(f"(?:{regex})" for regex in regexes), re.DOTALL)
+
+
+def _query_graph_db(path_graph_db: Path, state: FileState) -> set[Path]:
+    if path_graph_db.parent.name != ".stepup":
+        raise ValueError("A graph.db file must be in a .stepup directory.")
+    root = path_graph_db.parent.parent
     paths = set()
-    for path_graph_db in paths_graph_db:
-        if path_graph_db.parent.name != ".stepup":
-            raise ValueError("A graph.db file must be in a .stepup directory.")
-        root = path_graph_db.parent.parent
-        con = sqlite3.connect(f"file:{path_graph_db}?mode=ro", uri=True)
+    con = sqlite3.connect(f"file:{path_graph_db}?mode=ro", uri=True)
+    try:
         sql = "SELECT label FROM node JOIN file ON node.i = file.node WHERE state = ?"
         for (path,) in con.execute(sql, (state.value,)):
-            if not path.endswith("/"):
+            if not path.endswith("/") and not (root / path).is_dir():
                 paths.add(root / path)
+    finally:
+        con.close()
     return paths
 
 
 FILE_LIST_SOURCES = {
-    "": get_file_list_nglob,
-    "-git": get_file_list_git,
-    "-workflow": get_file_list_workflow,
+    "": FileLister.nglob,
+    "-git": FileLister.git,
+    "-tree": FileLister.tree,
+    "-workflow": FileLister.workflow,
 }
 
 
-def parse_inventory_def(lines: list[str], paths: list[str] | None = None) -> set[str]:
+def parse_inventory_def(
+    lines: list[str], paths: list[str] | None = None, stats: dict | None = None
+) -> set[str]:
     """Process lines from an inventory definition file.
 
+    All lines are parsed before any files are listed,
+    such that a directory tree is walked only once for all glob patterns,
+    and `git ls-files` is called at most once (see `FileLister`).
+
     Parameters
     ----------
     lines
@@ -156,6 +487,9 @@ def parse_inventory_def(lines: list[str], paths: list[str] | None = None) -> set
     paths
         A list of paths to use as a starting point, if any.
         When not given, this function starts from an empty list.
+    stats
+        If given, this dictionary is updated with the `lstat` results of paths
+        that were obtained while walking directories, see `FileLister.tree`.
 
     Returns
     -------
@@ -163,32 +497,48 @@ def parse_inventory_def(lines: list[str], paths: list[str] | None = None) -> set
         A set of paths obtained by processing the include and exclude commands.
         When an initial paths list is given, it is not altered.
     """
-    paths = set() if paths is None else set(paths)
+    commands = []
     for i, line in enumerate(lines):
         words = shlex.split(line, comments=True)
         if len(words) == 0:
             continue
         command = words[0]
-        args = words[1:]
         action = command[:7].lower()
         if action not in ["include", "exclude"]:
             raise ValueError(f"Line {i} does not start with include or exclude: {line}")
         source = command[7:].lower()
-        file_list_function = FILE_LIST_SOURCES.get(source)
-        if file_list_function is None:
+        if source not in FILE_LIST_SOURCES:
             raise ValueError(f"Unsupported command on line {i}: {command}")
-        new_paths = file_list_function(i, args)
-        new_paths = [path for path in new_paths if not path.is_dir()]
+        commands.append((i, action, source, words[1:]))
+
+    lister = FileLister()
+    lister.plan(commands)
+    paths = set() if paths is None else set(paths)
+    for i, action, source, args in commands:
+        new_paths = FILE_LIST_SOURCES[source](lister, i, args)
         if len(new_paths) == 0:
-            raise ValueError(f"Line {i} matches no paths: {line}")
+            raise ValueError(f"Line {i} matches no paths: {lines[i]}")
         if action == "include":
             paths.update(new_paths)
         else:
             paths.difference_update(new_paths)
+    if stats is not None:
+        stats.update((path, lister.stats[path]) for path in paths if path in lister.stats)
     return paths
 
 
-def write_inventory(path_txt: str, paths: Collection[str], do_amend: bool = True):
+def write_inventory(
+    path_txt: str,
+    paths: Collection[str],
+    do_amend: bool = True,
+    jobs: int | None = None,
+    path_cache: str | None = None,
+    paths_graph_db: Collection[str] = (),
+    path_index: str | None = None,
+    stats: dict[str, os.stat_result] | None = None,
+    extra_digests: Collection[str] = (),
+    known_files: Collection[str] = (),
+):
     """Write an inventory file.
 
     Parameters
@@ -200,27 +550,141 @@ def write_inventory(path_txt: str, paths: Collection[str], do_amend: bool = True
         These must be paths relative to the current working directory.
         They will be written to the inventory file
         as paths relative to the parent of the inventory file.
+    do_amend
+        When `True`, all paths are amended as inputs of the current step.
+        This is done in chunks of `AMEND_CHUNK_SIZE` paths,
+        all of which are amended before the inventory file is written.
+    jobs
+        The number of threads used to compute file digests.
+        The default is `${REPREP_INVENTORY_JOBS}` or 1 if the variable is not set.
+        The order of the lines in the inventory file does not depend on this number.
+    path_cache
+        An SQLite database with digests of previously summarized files.
+        Digests of files whose size, modification time, inode and mode are unchanged
+        are taken from this cache instead of being recomputed.
+        The cache is updated after the inventory file is written.
+        The cache file itself is never included in the inventory.
+    paths_graph_db
+        StepUp `graph.db` files from which digests are reused,
+        for files whose size, modification time, inode and mode are unchanged.
+        See `get_workflow_graph_dbs` for the database of the current workflow.
+    path_index
+        If given, a binary index of the inventory is written to this file,
+        see `stepup.reprep.inventory_index`.
+        The index file itself is never included in the inventory.
+    stats
+        Known `lstat` results of (some of) the paths, e.g. from `parse_inventory_def`.
+        These are used instead of calling `lstat` again.
+    extra_digests
+        Names of additional hash functions, e.g. `md5`.
+        These digests are computed in the same pass over the file contents as the main digest.
+        For each hash function, a file with the same prefix as the inventory file
+        and the name of the hash function as suffix is written, e.g. `inventory.md5`,
+        in the format of `md5sum` and similar tools.
+        Their modification time is set to the time at which the digests started to be computed,
+        such that files modified later can be detected, see `stepup.reprep.sync_zenodo`.
+        These files are never included in the inventory.
+    known_files
+        Paths that are known not to be directories, e.g. all results of `parse_inventory_def`.
+        Other paths are checked before the inventory file is written,
+        using `stats` when available, and `is_dir` otherwise.
     """
+    if stats is None:
+        stats = {}
+    extra_digests = check_digest_algorithms(extra_digests)
+    paths_sums = [Path(path_txt[:-4] + "." + algorithm) for algorithm in extra_digests]
+    paths_skip = {
+        Path(path_skip).normpath()
+        for path_skip in (path_cache, path_index, *paths_sums)
+        if path_skip is not None
+    }
+    paths = [path for path in paths if Path(path).normpath() not in paths_skip]
+
     # Amend all paths included in the inventory file as inputs.
     # This is needed to ensure that the inventory is rebuilt when the paths change.
     # Other actions calling this function may not want this,
     # because they already take care of file dependencies and amendments
     # may then cause cyclic dependencies.
+    # The inputs are checked and amended in chunks of `AMEND_CHUNK_SIZE` paths,
+    # so the director can process one chunk while the next one is checked.
+    # All chunks are amended before the inventory file is written.
     if do_amend:
-        inp_paths = []
-        for path in paths:
-            path = Path(path)
-            if path.endswith("/") or path.is_dir():
-                raise ValueError(f"Directories are not allowed in the inventory: {path}")
-            inp_paths.append(path)
-        amend(inp=inp_paths)
+        amend(
+            out=paths_sums if path_index is None else [path_index, *paths_sums],
+            vol=[] if path_cache is None else [path_cache],
+        )
+    known_files = set(known_files)
+    for begin in range(0, len(paths), AMEND_CHUNK_SIZE):
+        chunk = paths[begin : begin + AMEND_CHUNK_SIZE]
+        _check_no_directories(chunk, stats, known_files)
+        if do_amend:
+            amend(inp=chunk)
 
     # Write the inventory file.
+    if jobs is None:
+        jobs = int(getenv("REPREP_INVENTORY_JOBS", "1"))
     path_txt = Path(path_txt)
     root = path_txt.parent.normpath()
-    with open(path_txt, "w") as fh:
-        for path in paths:
-            print(format_summary(get_summary(path, root)), file=fh)
+    cache = None if path_cache is None else DigestCache.load(path_cache)
+    if len(paths_graph_db) > 0:
+        if cache is None:
+            cache = DigestCache()
+        for path_graph_db in paths_graph_db:
+            cache.load_graph_db(path_graph_db, root)
+    summaries = []
+    # A temporary file is renamed on success, so no partial inventory file is left behind.
+    path_tmp = root / f".{path_txt.name}.srr-tmp"
+    start_ns = time.time_ns()
+    try:
+        with open(path_tmp, "w") as fh:
+            for summary in iter_summaries(paths, root, jobs, cache, stats, extra_digests):
+                print(format_summary(summary), file=fh)
+                summaries.append(summary)
+        os.replace(path_tmp, path_txt)
+    except BaseException:
+        path_tmp.remove_p()
+        raise
+    if path_index is not None:
+        write_inventory_index(path_index, summaries, path_txt)
+    for algorithm, path_sums in zip(extra_digests, paths_sums, strict=True):
+        path_sums.write_text(format_digest_sums(summaries, algorithm))
+        os.utime(path_sums, ns=(start_ns, start_ns))
+    if cache is not None:
+        cache.save()
+
+
+AMEND_CHUNK_SIZE = 5000
+"""The maximum number of inputs per `amend` call in `write_inventory`."""
+
+
+def _check_no_directories(
+    paths: list[str], stats: dict[str, os.stat_result], known_files: set[str]
+):
+    """Raise a `ValueError` if one of the paths is a directory or a link to a directory.
+
+    Paths in `known_files` are not checked, and known `lstat` results in `stats` are reused.
+    """
+    for path in paths:
+        if path in known_files:
+            continue
+        st = stats.get(path)
+        if path.endswith("/") or (Path(path).is_dir() if st is None else stat.S_ISDIR(st.st_mode)):
+            raise ValueError(f"Directories are not allowed in the inventory: {path}")
+
+
+def get_workflow_graph_dbs() -> list[Path]:
+    """Return the `graph.db` file of the StepUp workflow running the current step, if any.
+
+    Returns
+    -------
+    paths_graph_db
+        A list with the `graph.db` file, or an empty list when not running in a StepUp workflow.
+    """
+    stepup_root = os.getenv("STEPUP_ROOT")
+    if stepup_root is None:
+        return []
+    path_graph_db = Path(stepup_root) / ".stepup/graph.db"
+    return [path_graph_db] if path_graph_db.is_file() else []
 
 
 if __name__ == "__main__":
@@ -20,42 +20,117 @@
 """Remove trailer ID and flaky metadata to make PDFs reproducible."""
 
 import argparse
+import inspect
 import shutil
 import tempfile
 
 import fitz
 from path import Path
 
-__all__ = ("pdf_normalize",)
+from stepup.core.api import getenv
+
+__all__ = (
+    "SAVE_PROFILES",
+    "add_save_profile_argument",
+    "normalize_document",
+    "pdf_normalize",
+    "save_document",
+)
+
+
+SAVE_PROFILES = ("fast", "default", "compact")
+"""The supported save profiles, see `save_document`."""
 
 
 def main():
     """Main program."""
-    pdf_normalize(parse_args().path_pdf)
+    args = parse_args()
+    pdf_normalize(args.path_pdf, args.save_profile)
 
 
 def parse_args() -> argparse.Namespace:
     """Parse command-line arguments."""
     parser = argparse.ArgumentParser(prog="srr-normalize-pdf", description="Normalize a PDF file.")
     parser.add_argument("path_pdf", help="The pdf to be normalized (in place).")
-    return parser.parse_args()
+    add_save_profile_argument(parser)
+    args = parser.parse_args()
+    if args.save_profile is None:
+        args.save_profile = getenv("REPREP_PDF_SAVE_PROFILE", "default")
+    return args
+
 
+def add_save_profile_argument(parser: argparse.ArgumentParser):
+    """Add the `--save-profile` option to the argument parser of a script that writes a PDF.
 
-def pdf_normalize(path_pdf: str):
+    When the option is not given, the value of `args.save_profile` is `None`
+    and should be replaced by `${REPREP_PDF_SAVE_PROFILE}` or `default`.
+    """
+    parser.add_argument(
+        "--save-profile",
+        choices=SAVE_PROFILES,
+        help="How the output PDF is saved: fast, default or compact. "
+        "The default is ${REPREP_PDF_SAVE_PROFILE} or default if the variable is not set.",
+    )
+
+
+def pdf_normalize(path_pdf: str, save_profile: str = "default"):
     """Replace a PDF file by its normalized equivalent. This helps making PDFs reproducible."""
     if not path_pdf.endswith(".pdf"):
         raise ValueError(f"The input must have a `.pdf` extension, got: {path_pdf}")
     pdf = fitz.open(path_pdf)
-    pdf.set_metadata({})
-    pdf.del_xml_metadata()
-    pdf.xref_set_key(-1, "ID", "null")
-    pdf.scrub()
+    normalize_document(pdf)
     with tempfile.TemporaryDirectory(suffix="srr-normalize-pdf", prefix="rr") as dn:
         path_out = Path(dn) / "out.pdf"
-        pdf.save(path_out, garbage=4, deflate=True, no_new_id=True)
+        save_document(pdf, path_out, save_profile)
         pdf.close()
         shutil.copy(path_out, path_pdf)
 
 
+def normalize_document(doc: fitz.Document):
+    """Strip metadata and the trailer ID from a document before it is saved, for reproducibility."""
+    doc.set_metadata({})
+    doc.del_xml_metadata()
+    doc.xref_set_key(-1, "ID", "null")
+    doc.scrub()
+
+
+def save_document(doc: fitz.Document, path_pdf: str, profile: str = "default"):
+    """Save a document reproducibly, with the options of a save profile.
+
+    Parameters
+    ----------
+    doc
+        The document to save.
+    path_pdf
+        The output PDF.
+    profile
+        One of the following:
+
+        - `fast`: only unused objects are removed (`garbage=1`)
+          and uncompressed streams are compressed.
+          Already compressed streams are copied as is.
+        - `default`: also duplicate objects are merged (`garbage=4`).
+        - `compact`: also images and fonts are compressed, fonts are subsetted,
+          and objects are stored in compressed object streams.
+          The last two are only done with PyMuPDF versions that support them natively.
+
+        All profiles produce reproducible outputs.
+    """
+    if profile not in SAVE_PROFILES:
+        raise ValueError(f"Unknown save profile: {profile}")
+    options = {"garbage": 4, "deflate": True, "no_new_id": True}
+    if profile == "fast":
+        options["garbage"] = 1
+    elif profile == "compact":
+        options["deflate_images"] = True
+        options["deflate_fonts"] = True
+        # Older versions of PyMuPDF need fontTools for subsetting and do not have object streams.
+        if "fallback" in inspect.signature(doc.subset_fonts).parameters:
+            doc.subset_fonts()
+        if "use_objstms" in inspect.signature(doc.save).parameters:
+            options["use_objstms"] = True
+    doc.save(path_pdf, **options)
+
+
 if __name__ == "__main__":
     main()
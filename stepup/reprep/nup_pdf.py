@@ -25,7 +25,9 @@ import fitz
 
 from stepup.core.api import getenv
 
-__all__ = ("nup_pdf",)
+from .normalize_pdf import add_save_profile_argument, normalize_document, save_document
+
+__all__ = ("nup_document", "nup_pdf")
 
 
 def main():
@@ -39,7 +41,17 @@ def main():
         args.margin = float(getenv("REPREP_NUP_MARGIN", "10.0"))
     if args.page_format is None:
         args.page_format = getenv("REPREP_NUP_PAGE_FORMAT", "A4-L")
-    nup_pdf(args.path_src, args.path_dst, args.nrow, args.ncol, args.margin, args.page_format)
+    if args.save_profile is None:
+        args.save_profile = getenv("REPREP_PDF_SAVE_PROFILE", "default")
+    nup_pdf(
+        args.path_src,
+        args.path_dst,
+        args.nrow,
+        args.ncol,
+        args.margin,
+        args.page_format,
+        args.save_profile,
+    )
 
 
 def parse_args() -> argparse.Namespace:
@@ -76,6 +88,7 @@ def parse_args() -> argparse.Namespace:
         help="The output page format. "
         "The default is ${REPREP_NUP_PAGE_FORMAT} or A4-L if the variable is not set.",
     )
+    add_save_profile_argument(parser)
     return parser.parse_args()
 
 
@@ -86,6 +99,7 @@ def nup_pdf(
     ncol: int,
     margin: float,
     page_format: str,
+    save_profile: str = "default",
 ):
     """Put multiple pages in a single page, using a fixed layout.
 
@@ -103,6 +117,8 @@ def nup_pdf(
         The margin and (minimal) spacing between small pages in millimeter.
     page_format
         A string describing the output page size.
+    save_profile
+        How the output is saved, see `save_document`.
     """
     for path_pdf in path_src, path_dst:
         if not path_pdf.endswith(".pdf"):
@@ -110,6 +126,20 @@ def nup_pdf(
     src = fitz.open(path_src)
     # See https://github.com/pymupdf/PyMuPDF/issues/3635
     src.scrub()
+    dst = nup_document(src, nrow, ncol, margin, page_format)
+
+    # Strip metadata for reproducibility and save
+    normalize_document(dst)
+    save_document(dst, path_dst, save_profile)
+
+    dst.close()
+    src.close()
+
+
+def nup_document(
+    src: fitz.Document, nrow: int, ncol: int, margin: float, page_format: str
+) -> fitz.Document:
+    """Return a new document with multiple pages of `src` per page, see `nup_pdf`."""
     dst = fitz.open()
 
     nup = nrow * ncol
@@ -139,16 +169,7 @@ def nup_pdf(
                 src,
                 ifine,
             )
-
-    # Strip metadata for reproducibility and save
-    dst.set_metadata({})
-    dst.del_xml_metadata()
-    dst.xref_set_key(-1, "ID", "null")
-    dst.scrub()
-    dst.save(path_dst, garbage=4, deflate=True, no_new_id=True)
-
-    dst.close()
-    src.close()
+    return dst
 
 
 if __name__ == "__main__":
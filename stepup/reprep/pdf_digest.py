@@ -0,0 +1,164 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Digests of PDF objects that do not depend on object numbers.
+
+Objects are hashed recursively: each indirect reference in the source of an object
+is replaced by the digest of the object it refers to.
+Two objects therefore have the same digest if they have the same contents,
+also when they come from different PDF files.
+References to parent objects (`/Parent` and `/P` keys) are ignored,
+to avoid that the digest of e.g. an annotation depends on the entire document.
+"""
+
+import re
+
+import fitz
+
+from .inventory import new_digest_hasher
+
+__all__ = ("RE_REFERENCE", "RE_REFERENCE_STR", "compute_object_digest", "compute_source_digest")
+
+
+RE_REFERENCE_STR = re.compile(r"(\d+) (\d+) R")
+"""An indirect reference in the source of a PDF object, e.g. from `fitz.Document.xref_object`."""
+
+RE_REFERENCE = re.compile(RE_REFERENCE_STR.pattern.encode())
+"""The same as `RE_REFERENCE_STR`, for sources as bytes."""
+
+RE_BACK_REFERENCE = re.compile(rb"/(?:Parent|P) \d+ \d+ R")
+"""References to parent objects, which are ignored."""
+
+
+def compute_object_digest(
+    doc: fitz.Document,
+    xref: int,
+    memo: dict[int, bytes],
+    leaves: dict[int, bytes] | None = None,
+) -> bytes:
+    """Compute a digest of a PDF object and all objects it refers to.
+
+    Parameters
+    ----------
+    doc
+        The PDF document.
+    xref
+        The object number.
+    memo
+        Digests computed before for objects in the same document.
+        This dictionary is updated in place.
+        The memo must be discarded when objects in the document are modified,
+        unless the modifications do not change their digests.
+        It must always be used with the same `leaves`.
+    leaves
+        Objects that are not followed when they are referred to.
+        Instead, the given bytes are hashed, e.g. the page number for a page object.
+
+    Returns
+    -------
+    digest
+        The digest of the object source and, for streams, the raw stream data.
+        A reference that closes a cycle (not broken by ignoring parent references)
+        is hashed as the number of levels it goes up in the traversal.
+        Digests of objects in such a cycle are never stored in the memo,
+        so the digest of an object does not depend on earlier calls with the same memo.
+    """
+    return _object_digest(doc, xref, memo, leaves or {}, {})[0]
+
+
+def compute_source_digest(
+    doc: fitz.Document,
+    source: bytes,
+    memo: dict[int, bytes],
+    leaves: dict[int, bytes] | None = None,
+) -> bytes:
+    """Compute a digest of the source of a PDF object, replacing references by their digests.
+
+    See `compute_object_digest` for the parameters.
+    """
+    return _source_digest(doc, source, memo, leaves or {}, {})[0]
+
+
+def _object_digest(
+    doc: fitz.Document,
+    xref: int,
+    memo: dict[int, bytes],
+    leaves: dict[int, bytes],
+    stack: dict[int, int],
+) -> tuple[bytes, int | None]:
+    """Compute the digest of an object, see `compute_object_digest`.
+
+    The stack contains the objects being hashed, with their depth in the traversal.
+    The second return value is the lowest depth on the stack referred to by a cycle,
+    or `None` if no cycle reaches above this object.
+    """
+    digest = memo.get(xref)
+    if digest is not None:
+        return digest, None
+    depth = stack.get(xref)
+    if depth is not None:
+        return f"cycle {len(stack) - depth}".encode(), depth
+    depth = len(stack)
+    stack[xref] = depth
+    digest, low = _source_digest(
+        doc, doc.xref_object(xref, compressed=True).encode(), memo, leaves, stack
+    )
+    if doc.xref_is_stream(xref):
+        hasher = new_digest_hasher()
+        hasher.update(digest)
+        hasher.update(doc.xref_stream_raw(xref))
+        digest = hasher.digest()
+    del stack[xref]
+    if low is None:
+        memo[xref] = digest
+    elif low < depth:
+        # Part of a cycle through objects higher up.
+        return digest, low
+    # Digests computed while a cycle was cut are not stored in the memo,
+    # because they would then be reused in traversals that start elsewhere in the cycle.
+    return digest, None
+
+
+def _source_digest(
+    doc: fitz.Document,
+    source: bytes,
+    memo: dict[int, bytes],
+    leaves: dict[int, bytes],
+    stack: dict[int, int],
+) -> tuple[bytes, int | None]:
+    """Compute the digest of an object source, see `compute_source_digest` and `_object_digest`."""
+    source = RE_BACK_REFERENCE.sub(b"", source)
+    hasher = new_digest_hasher()
+    low = None
+    pos = 0
+    for match in RE_REFERENCE.finditer(source):
+        hasher.update(source[pos : match.start()])
+        ref = int(match.group(1))
+        if ref in leaves:
+            hasher.update(leaves[ref])
+        elif 0 < ref < doc.xref_length():
+            digest, ref_low = _object_digest(doc, ref, memo, leaves, stack)
+            hasher.update(digest)
+            if ref_low is not None:
+                low = ref_low if low is None else min(low, ref_low)
+        else:
+            hasher.update(match.group())
+        pos = match.end()
+    hasher.update(source[pos:])
+    return hasher.digest(), low
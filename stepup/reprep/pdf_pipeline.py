@@ -0,0 +1,266 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Apply a sequence of PDF operations in memory and save the result once.
+
+The pipeline is defined in a YAML (or JSON) file with a list of operations, e.g.
+
+```yaml
+- op: cat
+  paths: [chapter1.pdf, chapter2.pdf]
+  dedup: true
+- op: add_notes
+  notes: notes.pdf
+- op: nup
+  nrow: 2
+  ncol: 1
+- op: raster
+  resolution: 150
+```
+
+Each operation corresponds to one of the `srr-*-pdf` scripts,
+and has the same options and environment variables for their defaults.
+All paths are relative to the parent directory of the pipeline file.
+"""
+
+import argparse
+
+import attrs
+import cattrs
+import fitz
+import yaml
+from path import Path
+
+from stepup.core.api import amend, getenv
+
+from .add_notes_pdf import add_notes_document
+from .cat_pdf import append_pdfs
+from .normalize_pdf import add_save_profile_argument, normalize_document, save_document
+from .nup_pdf import nup_document
+from .raster_pdf import PageCache, raster_document
+from .utils import parse_size
+
+__all__ = (
+    "AddNotesOperation",
+    "CatOperation",
+    "NupOperation",
+    "RasterOperation",
+    "load_pipeline",
+    "run_pipeline",
+)
+
+
+def main(argv: list[str] | None = None):
+    """Main program."""
+    parser = argparse.ArgumentParser(
+        prog="srr-pdf-pipeline",
+        description="Apply a sequence of operations to a PDF in memory and save the result once.",
+    )
+    parser.add_argument("path_pipeline", help="The YAML or JSON file with the operations.")
+    parser.add_argument("path_out", help="The output PDF.")
+    add_save_profile_argument(parser)
+    args = parser.parse_args(argv)
+    if args.save_profile is None:
+        args.save_profile = getenv("REPREP_PDF_SAVE_PROFILE", "default")
+    operations = load_pipeline(args.path_pipeline)
+    root = Path(args.path_pipeline).parent
+    amend(inp=[root / path for operation in operations for path in operation.inputs()])
+    run_pipeline(operations, root, args.path_out, args.save_profile)
+
+
+@attrs.define
+class CatOperation:
+    """Append the pages of PDF files, see `srr-cat-pdf`."""
+
+    paths: list[str] = attrs.field()
+    """The PDF files to append."""
+
+    insert_blank: bool = attrs.field(default=False)
+    """Insert a blank page after a PDF with an odd number of pages."""
+
+    dedup: bool = attrs.field(default=False)
+    """Share identical fonts and images of the PDF files."""
+
+    def inputs(self) -> list[str]:
+        """Return the input files of the operation."""
+        return self.paths
+
+    def apply(self, doc: fitz.Document, root: Path) -> fitz.Document:
+        """Apply the operation and return the resulting document."""
+        append_pdfs(doc, [root / path for path in self.paths], self.insert_blank, self.dedup)
+        return doc
+
+
+@attrs.define
+class AddNotesOperation:
+    """Insert a notes page after every page, see `srr-add-notes-pdf`."""
+
+    notes: str = attrs.field()
+    """The PDF with the notes page(s)."""
+
+    def inputs(self) -> list[str]:
+        """Return the input files of the operation."""
+        return [self.notes]
+
+    def apply(self, doc: fitz.Document, root: Path) -> fitz.Document:
+        """Apply the operation and return the resulting document."""
+        with fitz.open(root / self.notes) as notes:
+            return add_notes_document(doc, notes)
+
+
+@attrs.define
+class NupOperation:
+    """Put multiple pages per sheet, see `srr-nup-pdf`."""
+
+    nrow: int | None = attrs.field(default=None)
+    """The number of rows, `${REPREP_NUP_NROW}` or 2 by default."""
+
+    ncol: int | None = attrs.field(default=None)
+    """The number of columns, `${REPREP_NUP_NCOL}` or 2 by default."""
+
+    margin: float | None = attrs.field(default=None)
+    """The margin in mm, `${REPREP_NUP_MARGIN}` or 10.0 by default."""
+
+    page_format: str | None = attrs.field(default=None)
+    """The output page format, `${REPREP_NUP_PAGE_FORMAT}` or A4-L by default."""
+
+    def inputs(self) -> list[str]:
+        """Return the input files of the operation."""
+        return []
+
+    def apply(self, doc: fitz.Document, root: Path) -> fitz.Document:
+        """Apply the operation and return the resulting document."""
+        return nup_document(
+            doc,
+            int(getenv("REPREP_NUP_NROW", "2")) if self.nrow is None else self.nrow,
+            int(getenv("REPREP_NUP_NCOL", "2")) if self.ncol is None else self.ncol,
+            float(getenv("REPREP_NUP_MARGIN", "10.0")) if self.margin is None else self.margin,
+            getenv("REPREP_NUP_PAGE_FORMAT", "A4-L")
+            if self.page_format is None
+            else self.page_format,
+        )
+
+
+@attrs.define
+class RasterOperation:
+    """Replace each page by a JPEG image, see `srr-raster-pdf`."""
+
+    resolution: int | None = attrs.field(default=None)
+    """The resolution in dots per inch, `${REPREP_RASTER_RESOLUTION}` or 100 by default."""
+
+    quality: int | None = attrs.field(default=None)
+    """The JPEG quality, `${REPREP_RASTER_QUALITY}` or 50 by default."""
+
+    jobs: int | None = attrs.field(default=None)
+    """The number of processes, `${REPREP_RASTER_JOBS}` or 1 by default."""
+
+    cache: str | None = attrs.field(default=None)
+    """The page cache directory, `${REPREP_RASTER_CACHE}` by default. Not relative to the root."""
+
+    cache_size: str | None = attrs.field(default=None)
+    """The maximum cache size, `${REPREP_RASTER_CACHE_SIZE}` or 1G by default."""
+
+    def inputs(self) -> list[str]:
+        """Return the input files of the operation."""
+        return []
+
+    def apply(self, doc: fitz.Document, root: Path) -> fitz.Document:
+        """Apply the operation and return the resulting document."""
+        resolution = self.resolution
+        if resolution is None:
+            resolution = int(getenv("REPREP_RASTER_RESOLUTION", "100"))
+        if resolution <= 0:
+            raise ValueError(f"The resolution must be strictly positive, got: {resolution}")
+        quality = (
+            int(getenv("REPREP_RASTER_QUALITY", "50")) if self.quality is None else self.quality
+        )
+        jobs = int(getenv("REPREP_RASTER_JOBS", "1")) if self.jobs is None else self.jobs
+        if jobs < 1:
+            raise ValueError(f"The number of jobs must be strictly positive, got {jobs}")
+        cache = getenv("REPREP_RASTER_CACHE") if self.cache is None else self.cache
+        result = raster_document(doc, resolution, quality, jobs, cache)
+        if cache is not None:
+            cache_size = self.cache_size
+            if cache_size is None:
+                cache_size = getenv("REPREP_RASTER_CACHE_SIZE", "1G")
+            PageCache(cache).prune(parse_size(cache_size))
+        return result
+
+
+OPERATIONS = {
+    "cat": CatOperation,
+    "add_notes": AddNotesOperation,
+    "nup": NupOperation,
+    "raster": RasterOperation,
+}
+"""The supported operations, by the value of the `op` field."""
+
+
+def load_pipeline(path_pipeline: str) -> list:
+    """Load a list of operations from a YAML or JSON file.
+
+    A file with a single operation, i.e. a mapping instead of a list, is also accepted.
+    """
+    with open(path_pipeline) as fh:
+        data = yaml.safe_load(fh)
+    if not isinstance(data, list):
+        data = [data]
+    operations = []
+    for item in data:
+        cls = OPERATIONS.get(item.get("op")) if isinstance(item, dict) else None
+        if cls is None:
+            raise ValueError(f"Invalid PDF pipeline: missing or unknown operation. ({item})")
+        operations.append(cattrs.structure({k: v for k, v in item.items() if k != "op"}, cls))
+    return operations
+
+
+def run_pipeline(operations: list, root: str, path_out: str, save_profile: str = "default"):
+    """Apply operations to an empty document and save the result.
+
+    Parameters
+    ----------
+    operations
+        A list of operations, e.g. loaded with `load_pipeline`.
+        The first operation is normally a `CatOperation` to load the input PDFs.
+    root
+        The directory relative to which paths in the operations are interpreted.
+    path_out
+        The output PDF, saved after all operations were applied.
+        As with the `srr-*-pdf` scripts, metadata are removed for reproducibility.
+    save_profile
+        How the output is saved, see `save_document`.
+    """
+    if not path_out.endswith(".pdf"):
+        raise ValueError(f"The output must have a `.pdf` extension, got: {path_out}")
+    root = Path(root)
+    doc = fitz.open()
+    for operation in operations:
+        result = operation.apply(doc, root)
+        if result is not doc:
+            doc.close()
+            doc = result
+    if doc.page_count == 0:
+        raise ValueError("The PDF pipeline did not produce any pages.")
+    normalize_document(doc)
+    save_document(doc, path_out, save_profile)
+    doc.close()
+
+
+if __name__ == "__main__":
+    main()
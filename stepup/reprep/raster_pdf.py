@@ -23,12 +23,35 @@ This is mainly intended to impede (the quality of) unauthorized copies.
 """
 
 import argparse
+import contextlib
+import os
+import struct
+import tempfile
+import zlib
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
 
+import attrs
 import fitz
+from path import Path
 
 from stepup.core.api import getenv
 
-__all__ = ("raster_pdf",)
+from .inventory import new_digest_hasher
+from .normalize_pdf import SAVE_PROFILES, add_save_profile_argument
+from .pdf_digest import compute_object_digest, compute_source_digest
+from .utils import parse_size
+
+__all__ = (
+    "PageCache",
+    "compute_page_digest",
+    "iter_raster_pages",
+    "page_leaves",
+    "raster_document",
+    "raster_pdf",
+    "write_jpeg_pdf",
+)
 
 
 def main():
@@ -38,8 +61,25 @@ def main():
         args.resolution = int(getenv("REPREP_RASTER_RESOLUTION", "100"))
     if args.quality is None:
         args.quality = int(getenv("REPREP_RASTER_QUALITY", "50"))
+    if args.jobs is None:
+        args.jobs = int(getenv("REPREP_RASTER_JOBS", "1"))
+    if args.cache is None:
+        args.cache = getenv("REPREP_RASTER_CACHE")
+    if args.cache is not None and args.cache_size is None:
+        args.cache_size = parse_size(getenv("REPREP_RASTER_CACHE_SIZE", "1G"))
+    if args.save_profile is None:
+        args.save_profile = getenv("REPREP_PDF_SAVE_PROFILE", "default")
 
-    raster_pdf(args.path_inp, args.path_out, args.resolution, args.quality)
+    raster_pdf(
+        args.path_inp,
+        args.path_out,
+        args.resolution,
+        args.quality,
+        args.jobs,
+        args.cache,
+        args.cache_size,
+        args.save_profile,
+    )
     return 0
 
 
@@ -50,30 +90,456 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("path_out", help="The output PDF file.")
     parser.add_argument("-r", "--resolution", type=int, help="Bitmap resolution")
     parser.add_argument("-q", "--quality", type=int, help="JPEG quality")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of processes used to render pages. "
+        "The default is ${REPREP_RASTER_JOBS} or 1 if the variable is not set.",
+    )
+    parser.add_argument(
+        "-c",
+        "--cache",
+        help="A directory with cached JPEG images of pages, "
+        "such that only new or modified pages are rendered. "
+        "The default is ${REPREP_RASTER_CACHE}. If not set, no cache is used.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=parse_size,
+        help="The maximum size of the cache, in bytes or with a unit, e.g. 500M or 2Gi. "
+        "The least recently used images are removed when the cache is larger. "
+        "The default is ${REPREP_RASTER_CACHE_SIZE} or 1G if the variable is not set.",
+    )
+    add_save_profile_argument(parser)
     return parser.parse_args()
 
 
-def raster_pdf(path_inp: str, path_out: str, resolution: int, quality: int):
-    """Convert a PDF into a rasterized version."""
+def raster_pdf(
+    path_inp: str,
+    path_out: str,
+    resolution: int,
+    quality: int,
+    jobs: int = 1,
+    cache: str | None = None,
+    cache_size: int = 10**9,
+    save_profile: str = "default",
+):
+    """Convert a PDF into a rasterized version.
+
+    Parameters
+    ----------
+    path_inp
+        The input PDF file.
+    path_out
+        The output PDF file.
+    resolution
+        The resolution of the bitmaps in dots per inch.
+    quality
+        The JPEG quality of the bitmaps.
+    jobs
+        The number of processes used to render and encode pages.
+        Each process opens the input PDF separately.
+        At most a few pages per process are kept in memory,
+        and each page is written to the output as soon as it is rendered, see `write_jpeg_pdf`.
+        The output does not depend on the number of processes.
+    cache
+        A directory with cached JPEG images of pages, see `PageCache`.
+        Pages whose digest (see `compute_page_digest`) is found in the cache are not rendered.
+        The output does not depend on the use of the cache.
+    cache_size
+        The maximum size of the cache in bytes, see `PageCache.prune`.
+    save_profile
+        How the output is saved, see `save_document`.
+        All profiles give the same result, because `write_jpeg_pdf`
+        already compresses and deduplicates all objects.
+    """
     if not path_inp.endswith(".pdf"):
         raise ValueError(f"The input must have a `.pdf` extension, got: {path_inp}")
     if not path_out.endswith(".pdf"):
         raise ValueError(f"The output must have a `.pdf` extension, got: {path_out}")
     if resolution <= 0:
         raise ValueError(f"The resolution must be strictly positive, git: {resolution}")
+    if jobs < 1:
+        raise ValueError(f"The number of jobs must be strictly positive, got {jobs}")
+    if save_profile not in SAVE_PROFILES:
+        raise ValueError(f"Unknown save profile: {save_profile}")
     with fitz.open(path_inp) as src:
-        dst = fitz.open()
-        for src_page in src:
-            src_page.wrap_contents()
-            if src_page.rotation in (90, 270):
-                height, width = src_page.mediabox_size
-            else:
-                width, height = src_page.mediabox_size
-            pix = src_page.get_pixmap(dpi=resolution)
-            stream = pix.tobytes(output="jpg", jpg_quality=quality)
-            dst_page = dst.new_page(-1, width, height)
-            dst_page.insert_image(dst_page.rect, stream=stream)
-        dst.save(path_out, garbage=4, deflate=True, no_new_id=True)
+        write_jpeg_pdf(path_out, iter_raster_pages(src, resolution, quality, jobs, cache))
+    if cache is not None:
+        PageCache(cache).prune(cache_size)
+
+
+def raster_document(
+    src: fitz.Document,
+    resolution: int,
+    quality: int,
+    jobs: int = 1,
+    cache: str | None = None,
+) -> fitz.Document:
+    """Return a new document with a JPEG image of each page of `src`, see `raster_pdf`.
+
+    All pages of the new document are kept in memory.
+    Use `write_jpeg_pdf` to write them to a file one by one instead.
+    """
+    dst = fitz.open()
+    for width, height, stream in iter_raster_pages(src, resolution, quality, jobs, cache):
+        dst_page = dst.new_page(-1, width, height)
+        dst_page.insert_image(dst_page.rect, stream=stream)
+    return dst
+
+
+def write_jpeg_pdf(path_pdf: str, pages: Iterable[tuple[float, float, bytes]]):
+    """Write a PDF with a JPEG image on each page, without keeping the pages in memory.
+
+    Parameters
+    ----------
+    path_pdf
+        The output PDF.
+    pages
+        For each page, the width and height of the page and the JPEG image,
+        e.g. from `iter_raster_pages`.
+        The image is stretched to fill the page.
+
+    Notes
+    -----
+    PyMuPDF keeps a new document in memory until it is saved.
+    This function writes every page as soon as it is received,
+    such that only the positions of the objects in the file are kept until the end.
+    Identical images and content streams are written only once.
+    The file is written under a temporary name and renamed when it is complete.
+    The output contains no metadata, timestamps or document ID, so it is reproducible.
+    """
+    path_pdf = Path(path_pdf)
+    path_tmp = path_pdf.parent / f".{path_pdf.name}.srr-tmp"
+    try:
+        with open(path_tmp, "wb") as fh:
+            _write_jpeg_pages(fh, pages)
+        os.replace(path_tmp, path_pdf)
+    except BaseException:
+        if os.path.lexists(path_tmp):
+            os.remove(path_tmp)
+        raise
+
+
+def _write_jpeg_pages(fh, pages: Iterable[tuple[float, float, bytes]]):
+    """Write the PDF for `write_jpeg_pdf` to an open binary file."""
+    offsets = [0, 0, 0]
+    kids = []
+    images = {}
+    contents = {}
+
+    def write_object(xref: int, source: bytes, stream: bytes | None = None):
+        offsets[xref] = fh.tell()
+        fh.write(b"%d 0 obj\n" % xref)
+        fh.write(source)
+        if stream is not None:
+            fh.write(b"\nstream\n")
+            fh.write(stream)
+            fh.write(b"\nendstream")
+        fh.write(b"\nendobj\n")
+
+    def new_object() -> int:
+        offsets.append(0)
+        return len(offsets) - 1
+
+    # Objects 1 and 2 are the catalog and the page tree, written at the end.
+    fh.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+    for width, height, stream in pages:
+        hasher = new_digest_hasher()
+        hasher.update(stream)
+        digest = hasher.digest()
+        xref_image = images.get(digest)
+        if xref_image is None:
+            xref_image = new_object()
+            images[digest] = xref_image
+            image_width, image_height, ncomponent = _get_jpeg_size(stream)
+            colorspace = {1: "DeviceGray", 3: "DeviceRGB"}.get(ncomponent)
+            if colorspace is None:
+                raise ValueError(f"Unsupported number of JPEG color components: {ncomponent}")
+            write_object(
+                xref_image,
+                f"<< /Type /XObject /Subtype /Image /Width {image_width} "
+                f"/Height {image_height} /ColorSpace /{colorspace} /BitsPerComponent 8 "
+                f"/Filter /DCTDecode /Length {len(stream)} >>".encode(),
+                stream,
+            )
+        width = _format_number(width)
+        height = _format_number(height)
+        content = f"q {width} 0 0 {height} 0 0 cm /Im0 Do Q".encode()
+        xref_content = contents.get(content)
+        if xref_content is None:
+            xref_content = new_object()
+            contents[content] = xref_content
+            compressed = zlib.compress(content)
+            write_object(
+                xref_content,
+                f"<< /Filter /FlateDecode /Length {len(compressed)} >>".encode(),
+                compressed,
+            )
+        xref_page = new_object()
+        kids.append(xref_page)
+        write_object(
+            xref_page,
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+            f"/Resources << /XObject << /Im0 {xref_image} 0 R >> >> "
+            f"/Contents {xref_content} 0 R >>".encode(),
+        )
+    write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids_str = " ".join(f"{xref} 0 R" for xref in kids)
+    write_object(2, f"<< /Type /Pages /Count {len(kids)} /Kids [{kids_str}] >>".encode())
+    start_xref = fh.tell()
+    fh.write(f"xref\n0 {len(offsets)}\n0000000000 65535 f \n".encode())
+    fh.writelines(f"{offset:010d} 00000 n \n".encode() for offset in offsets[1:])
+    fh.write(
+        f"trailer\n<< /Size {len(offsets)} /Root 1 0 R >>\n"
+        f"startxref\n{start_xref}\n%%EOF\n".encode()
+    )
+
+
+def _format_number(value: float) -> str:
+    """Format a number for a PDF file, without exponent."""
+    return f"{value:.4f}".rstrip("0").rstrip(".")
+
+
+def _get_jpeg_size(data: bytes) -> tuple[int, int, int]:
+    """Return the width, height and number of components of a JPEG image."""
+    pos = 2
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte
+            pos += 1
+            continue
+        # Start of frame markers, excluding DHT, JPG and DAC
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width, ncomponent = struct.unpack(">HHB", data[pos + 5 : pos + 10])
+            return width, height, ncomponent
+        pos += 2 + int.from_bytes(data[pos + 2 : pos + 4], "big")
+    raise ValueError("Could not find the size of a JPEG image.")
+
+
+def iter_raster_pages(
+    src: fitz.Document,
+    resolution: int,
+    quality: int,
+    jobs: int = 1,
+    cache: str | None = None,
+) -> Iterator[tuple[float, float, bytes]]:
+    """Render all pages of a PDF as JPEG images, possibly in parallel.
+
+    Returns
+    -------
+    pages
+        For each page, in order, the width and height of the page and the JPEG image.
+    """
+    npage = src.page_count
+    if jobs == 1:
+        _set_source(src, cache)
+        try:
+            for ipage in range(npage):
+                yield _raster_page(ipage, resolution, quality)
+        finally:
+            _set_source(None)
+        return
+    # The worker processes open the PDF file, or a copy of the document if it was modified.
+    source = src.name if src.name != "" and not src.is_dirty else src.tobytes()
+    with ProcessPoolExecutor(
+        min(jobs, npage) or 1, initializer=_open_source, initargs=(source, cache)
+    ) as executor:
+        pending = deque()
+        try:
+            for ipage in range(npage):
+                pending.append(executor.submit(_raster_page, ipage, resolution, quality))
+                if len(pending) >= 2 * jobs:
+                    yield pending.popleft().result()
+            while len(pending) > 0:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def compute_page_digest(
+    page: fitz.Page,
+    resolution: int,
+    quality: int,
+    memo: dict[int, bytes] | None = None,
+    leaves: dict[int, bytes] | None = None,
+) -> str:
+    """Compute a digest of everything that determines the JPEG image of a page.
+
+    Parameters
+    ----------
+    page
+        The page to be rendered.
+    resolution, quality
+        The settings of the JPEG image, see `raster_pdf`.
+    memo
+        Digests of PDF objects computed before, for pages of the same document.
+        This avoids hashing shared resources, such as fonts, for every page.
+    leaves
+        The page numbers of all page objects, see `page_leaves`.
+        It must be given when `memo` is reused, to avoid computing it for every page.
+
+    Returns
+    -------
+    digest
+        A hexadecimal digest of the page dictionary, its content streams and its resources
+        (recursively including all referenced objects, but not the parent objects),
+        the inherited page attributes, the settings and the version of PyMuPDF.
+        It does not depend on the object numbers in the PDF file,
+        so unchanged pages have the same digest after other pages are modified.
+        References to other pages, e.g. in link annotations, are hashed as page numbers.
+    """
+    if memo is None:
+        memo = {}
+    doc = page.parent
+    if leaves is None:
+        leaves = page_leaves(doc)
+    hasher = new_digest_hasher()
+    hasher.update(
+        f"{fitz.VersionBind} {resolution} {quality} {page.rotation} "
+        f"{tuple(page.mediabox)} {tuple(page.cropbox)}\n".encode()
+    )
+    hasher.update(compute_object_digest(doc, page.xref, memo, leaves))
+    # Resources may be inherited from the page tree.
+    xref = page.xref
+    while doc.xref_get_key(xref, "Resources")[0] == "null":
+        kind, value = doc.xref_get_key(xref, "Parent")
+        if kind != "xref":
+            break
+        xref = int(value.split()[0])
+        kind, value = doc.xref_get_key(xref, "Resources")
+        if kind != "null":
+            hasher.update(compute_source_digest(doc, value.encode(), memo, leaves))
+    return hasher.hexdigest()
+
+
+def page_leaves(doc: fitz.Document) -> dict[int, bytes]:
+    """Return the page number of each page object, to be hashed instead of the page itself.
+
+    Without this, editing one page would change the digests of all pages linking to it.
+    """
+    return {page.xref: f"page {ipage}".encode() for ipage, page in enumerate(doc)}
+
+
+@attrs.define
+class PageCache:
+    """A directory with JPEG images of pages, stored in files named after the page digest.
+
+    Files are written atomically, so the cache may be used by multiple processes.
+    The modification time of a file is updated when it is used,
+    which is used to remove the least recently used images in `prune`.
+    """
+
+    root: Path = attrs.field(converter=Path)
+    """The cache directory, created if needed."""
+
+    def _path(self, digest: str) -> Path:
+        return self.root / f"{digest}.jpg"
+
+    def load(self, digest: str) -> bytes | None:
+        """Return a cached image, or `None` if there is none."""
+        path = self._path(digest)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def store(self, digest: str, data: bytes):
+        """Add an image to the cache."""
+        self.root.makedirs_p()
+        fd, path_tmp = tempfile.mkstemp(prefix=f".{digest}.", suffix=".srr-tmp", dir=self.root)
+        try:
+            with open(fd, "wb") as fh:
+                fh.write(data)
+            os.replace(path_tmp, self._path(digest))
+        except BaseException:
+            if os.path.lexists(path_tmp):
+                os.remove(path_tmp)
+            raise
+
+    def prune(self, max_size: int) -> list[str]:
+        """Remove the least recently used images until the total size is at most `max_size`.
+
+        Returns
+        -------
+        removed
+            The digests of the removed images.
+        """
+        if not self.root.is_dir():
+            return []
+        entries = []
+        total = 0
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.name.endswith(".jpg"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime_ns, entry.name, st.st_size))
+                    total += st.st_size
+        entries.sort()
+        removed = []
+        for _, name, size in entries:
+            if total <= max_size:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.root / name)
+            total -= size
+            removed.append(name[:-4])
+        return removed
+
+
+_SOURCE: fitz.Document | None = None
+"""The input PDF opened in the current (worker) process."""
+
+_CACHE: PageCache | None = None
+"""The page cache used in the current (worker) process, if any."""
+
+_MEMO: dict[int, bytes] = {}
+"""Digests of PDF objects in `_SOURCE`, see `compute_page_digest`."""
+
+_LEAVES: dict[int, bytes] = {}
+"""Page numbers of the page objects in `_SOURCE`, see `page_leaves`."""
+
+
+def _open_source(source: str | bytes, cache: str | None = None):
+    if isinstance(source, bytes):
+        _set_source(fitz.open(stream=source), cache)
+    else:
+        _set_source(fitz.open(source), cache)
+
+
+def _set_source(src: fitz.Document | None, cache: str | None = None):
+    global _SOURCE, _CACHE  # noqa: PLW0603
+    _SOURCE = src
+    _CACHE = None if cache is None else PageCache(cache)
+    _MEMO.clear()
+    _LEAVES.clear()
+    if src is not None and cache is not None:
+        _LEAVES.update(page_leaves(src))
+
+
+def _raster_page(ipage: int, resolution: int, quality: int) -> tuple[float, float, bytes]:
+    """Render a single page of the input PDF opened by `_open_source`."""
+    src_page = _SOURCE[ipage]
+    if src_page.rotation in (90, 270):
+        height, width = src_page.mediabox_size
+    else:
+        width, height = src_page.mediabox_size
+    if _CACHE is not None:
+        digest = compute_page_digest(src_page, resolution, quality, _MEMO, _LEAVES)
+        stream = _CACHE.load(digest)
+        if stream is not None:
+            return width, height, stream
+    src_page.wrap_contents()
+    pix = src_page.get_pixmap(dpi=resolution)
+    stream = pix.tobytes(output="jpg", jpg_quality=quality)
+    if _CACHE is not None:
+        _CACHE.store(digest, stream)
+    return width, height, stream
 
 
 if __name__ == "__main__":
@@ -0,0 +1,306 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Split an inventory into multiple ZIP files, each smaller than a given size."""
+
+import argparse
+import json
+from typing import Self
+
+import attrs
+from path import Path
+
+from stepup.core.api import amend, getenv
+
+from .check_inventory import iter_inventory
+from .inventory import FileSummary, format_summary, iter_ordered
+from .utils import parse_size
+from .zip_inventory import CompressionPolicy, zip_inventory
+
+__all__ = (
+    "ShardPlan",
+    "estimate_member_size",
+    "plan_shards",
+    "shard_inventory",
+)
+
+
+ZIP_OVERHEAD = 256
+"""Upper bound for the size of the end of central directory records of a ZIP file."""
+
+PATH_MAX = 4096
+"""Upper bound for the length of the target of a symbolic link."""
+
+
+def main(argv: list[str] | None = None):
+    """Main program."""
+    parser = argparse.ArgumentParser(
+        prog="srr-shard-inventory",
+        description="Split an inventory.txt file into multiple ZIP files with a maximum size.",
+    )
+    parser.add_argument("inventory_txt", help="The inventory file with all files to be zipped.")
+    parser.add_argument(
+        "-s",
+        "--max-size",
+        type=parse_size,
+        required=True,
+        help="The maximum size of each ZIP file, in bytes or with a unit, e.g. 50G or 2Gi.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of ZIP files created in parallel. "
+        "The default is ${REPREP_INVENTORY_JOBS} or 1 if the variable is not set.",
+    )
+    parser.add_argument(
+        "-c",
+        "--compression",
+        help="The compression policy, see srr-zip-inventory. "
+        "The default is ${REPREP_ZIP_COMPRESSION} or deflate if the variable is not set.",
+    )
+    args = parser.parse_args(argv)
+    if args.jobs is None:
+        args.jobs = int(getenv("REPREP_INVENTORY_JOBS", "1"))
+    if args.compression is None:
+        args.compression = getenv("REPREP_ZIP_COMPRESSION", "deflate")
+    plan = ShardPlan.from_inventory(args.inventory_txt, args.max_size, args.compression)
+    # The outputs are amended before they are written, as required by StepUp.
+    amend(out=plan.paths_out)
+    plan.write(args.jobs)
+
+
+def estimate_member_size(fs: FileSummary) -> int:
+    """Return an upper bound for the number of bytes a file takes in a ZIP archive.
+
+    This includes the local file header, the central directory record
+    (both with ZIP64 extra fields) and the worst-case expansion of deflate.
+    For symbolic links, the length of the link target is bounded by `PATH_MAX`.
+    """
+    nname = len(fs.path.encode("utf-8"))
+    size = PATH_MAX if fs.size is None else fs.size
+    return size + size // 1000 + 64 + 2 * (nname + 80)
+
+
+def plan_shards(refs: list[FileSummary], max_size: int, comment: bytes = b"") -> list[list[int]]:
+    """Assign inventory records to shards with a size budget.
+
+    Parameters
+    ----------
+    refs
+        The records of the inventory.
+    max_size
+        The maximum size of a ZIP file.
+        The estimated size of a shard includes its own inventory file,
+        see `estimate_member_size`.
+    comment
+        The comment of the ZIP files, see `CompressionPolicy.comment`.
+
+    Returns
+    -------
+    shards
+        For each shard, the indexes of its records in `refs`, in increasing order.
+        Records are packed with the first-fit decreasing heuristic,
+        sorting by size and then by path, so the result only depends on the inventory.
+
+    Raises
+    ------
+    ValueError
+        When a single file does not fit in a ZIP file of the given size.
+    """
+    costs = []
+    for fs in refs:
+        # Each file also adds a line to the inventory of its shard.
+        line_size = len(format_summary(fs).encode("utf-8")) + 1
+        costs.append(estimate_member_size(fs) + line_size + line_size // 1000)
+    budget = max_size - ZIP_OVERHEAD - len(comment) - 2 * 80
+    shards = []
+    used = []
+    order = sorted(range(len(refs)), key=lambda i: (-costs[i], refs[i].path))
+    for i in order:
+        if costs[i] > budget:
+            raise ValueError(f"File too large for a ZIP file of {max_size} bytes: {refs[i].path}")
+        for ishard, shard in enumerate(shards):
+            if used[ishard] + costs[i] <= budget:
+                shard.append(i)
+                used[ishard] += costs[i]
+                break
+        else:
+            shards.append([i])
+            used.append(costs[i])
+    for shard in shards:
+        shard.sort()
+    # Shards are numbered in the order of their first file in the inventory.
+    shards.sort()
+    return shards
+
+
+@attrs.define
+class ShardPlan:
+    """The assignment of inventory records to shards, and the files to be written."""
+
+    path_inventory: Path = attrs.field()
+    """The inventory.txt file."""
+
+    max_size: int = attrs.field()
+    """The maximum size of each ZIP file in bytes."""
+
+    policy: CompressionPolicy = attrs.field()
+    """The compression policy of the ZIP files."""
+
+    refs: list[FileSummary] = attrs.field()
+    """The records of the inventory."""
+
+    shards: list[list[int]] = attrs.field()
+    """For each shard, the indexes of its records in `refs`, see `plan_shards`."""
+
+    @classmethod
+    def from_inventory(
+        cls, path_inventory: str, max_size: int, compression: str = "deflate"
+    ) -> Self:
+        """Read an inventory and assign its records to shards, without writing any files."""
+        if not path_inventory.endswith(".txt"):
+            raise ValueError(
+                f"The inventory file must have a `.txt` extension. Got {path_inventory}"
+            )
+        path_inventory = Path(path_inventory)
+        policy = CompressionPolicy.from_spec(compression)
+        refs = list(iter_inventory(path_inventory))
+        return cls(
+            path_inventory, max_size, policy, refs, plan_shards(refs, max_size, policy.comment)
+        )
+
+    @property
+    def paths_shard(self) -> list[Path]:
+        """The inventory files of the shards."""
+        prefix = self.path_inventory[:-4]
+        width = max(3, len(str(len(self.shards))))
+        return [Path(f"{prefix}-{ishard + 1:0{width}d}.txt") for ishard in range(len(self.shards))]
+
+    @property
+    def path_index(self) -> Path:
+        """The index of all shards."""
+        return Path(f"{self.path_inventory[:-4]}-shards.json")
+
+    @property
+    def paths_out(self) -> list[Path]:
+        """All files written by `write`, see `shard_inventory`."""
+        return [
+            *(
+                path
+                for path_shard in self.paths_shard
+                for path in (path_shard, path_shard.with_suffix(".zip"))
+            ),
+            self.path_index,
+        ]
+
+    def write(self, jobs: int = 1) -> list[Path]:
+        """Write the inventory and ZIP files of all shards, and the index.
+
+        Parameters
+        ----------
+        jobs
+            The number of ZIP files created in parallel.
+
+        Returns
+        -------
+        paths_out
+            All files written, see `shard_inventory`.
+        """
+        # Write the inventory files of all shards.
+        paths_shard = self.paths_shard
+        for path_shard, shard in zip(paths_shard, self.shards, strict=True):
+            path_shard.write_text("".join(format_summary(self.refs[i]) + "\n" for i in shard))
+
+        # Create the ZIP files in parallel.
+        def build(path_shard: Path) -> Path:
+            path_zip = path_shard.with_suffix(".zip")
+            zip_inventory(path_shard, path_zip, compression=self.policy.spec)
+            size = path_zip.size
+            if size > self.max_size:
+                raise ValueError(
+                    f"ZIP file larger than {self.max_size} bytes: {path_zip} ({size} bytes)"
+                )
+            return path_zip
+
+        paths_zip = list(iter_ordered(build, paths_shard, jobs))
+
+        # Write the index.
+        root = self.path_inventory.parent
+        names_zip = [path_zip.relpath(root) for path_zip in paths_zip]
+        owners = {}
+        for name_zip, shard in zip(names_zip, self.shards, strict=True):
+            for i in shard:
+                owners[i] = name_zip
+        index = {
+            "inventory": self.path_inventory.name,
+            "max_size": self.max_size,
+            "compression": self.policy.spec,
+            "shards": [
+                {
+                    "inventory": path_shard.relpath(root),
+                    "zip": name_zip,
+                    "count": len(shard),
+                    "size": path_zip.size,
+                }
+                for path_shard, path_zip, name_zip, shard in zip(
+                    paths_shard, paths_zip, names_zip, self.shards, strict=True
+                )
+            ],
+            "paths": {ref.path: owners[i] for i, ref in enumerate(self.refs)},
+        }
+        with open(self.path_index, "w") as fh:
+            json.dump(index, fh, indent=2)
+            fh.write("\n")
+        return self.paths_out
+
+
+def shard_inventory(
+    path_inventory: str, max_size: int, jobs: int = 1, compression: str = "deflate"
+) -> list[str]:
+    """Split an inventory into multiple reproducible ZIP files, each smaller than `max_size`.
+
+    Parameters
+    ----------
+    path_inventory
+        The inventory.txt file.
+    max_size
+        The maximum size of each ZIP file in bytes.
+    jobs
+        The number of ZIP files created in parallel.
+    compression
+        The compression policy, see `CompressionPolicy`.
+
+    Returns
+    -------
+    paths_out
+        All files written by this function. For the n-th shard, these are
+        an inventory file with the same prefix as `path_inventory` and suffix `-00n.txt`,
+        and a ZIP file with the same prefix and suffix `-00n.zip`,
+        as created by `zip_inventory` with the shard inventory as input.
+        The last file is an index, with the same prefix and suffix `-shards.json`,
+        which lists all shards and maps every path in the inventory to its ZIP file.
+        The shards only depend on the inventory, `max_size` and the compression policy.
+        Use `ShardPlan` to know these paths before any file is written.
+    """
+    return ShardPlan.from_inventory(path_inventory, max_size, compression).write(jobs)
+
+
+if __name__ == "__main__":
+    main()
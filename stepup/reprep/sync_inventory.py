@@ -0,0 +1,302 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Mirror the files listed in an inventory.txt file to another directory."""
+
+import argparse
+import fcntl
+import os
+import stat
+import tempfile
+
+from path import Path
+
+from stepup.core.api import getenv
+from stepup.core.hash import HASH_CHUNK_SIZE, compute_file_digest
+
+from .check_inventory import diff_summary, iter_inventory
+from .inventory import (
+    DigestCache,
+    FileSummary,
+    check_dest_paths,
+    get_dest_path,
+    get_summary,
+    iter_ordered,
+    new_digest_hasher,
+)
+
+__all__ = ("SYNC_METHODS", "sync_file", "sync_inventory")
+
+
+SYNC_METHODS = ("copy", "reflink", "hardlink")
+"""Supported methods to transfer the contents of regular files, see `sync_file`."""
+
+FICLONE = 0x40049409
+"""The Linux ioctl request to clone a file on file systems with copy-on-write support."""
+
+REGULAR_FILE_MODES = {stat.filemode(stat.S_IFREG | bits): bits for bits in range(0o10000)}
+"""Permission bits of regular files, indexed by their mode string in an inventory file."""
+
+
+def main(argv: list[str] | None = None):
+    """Main program."""
+    parser = argparse.ArgumentParser(
+        prog="srr-sync-inventory",
+        description="Copy files listed in an inventory.txt file to a destination directory, "
+        "skipping files that are already present with the same digest.",
+    )
+    parser.add_argument("inventory_txt", help="The inventory file with all files to be copied.")
+    parser.add_argument("dest", help="The destination directory.")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of threads used to copy files. "
+        "The default is ${REPREP_INVENTORY_JOBS} or 1 if the variable is not set.",
+    )
+    parser.add_argument(
+        "-m",
+        "--method",
+        choices=SYNC_METHODS,
+        default="reflink",
+        help="How regular files are transferred: "
+        "reflink clones files on file systems with copy-on-write support and copies otherwise. "
+        "hardlink creates hard links when possible and falls back to reflink, "
+        "e.g. when the mode of the source differs from the inventory. "
+        "Only use hardlink when the source files are never modified in place. "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "-c",
+        "--cache",
+        action="store_true",
+        default=False,
+        help="Keep the digests of the destination files in a cache file "
+        "next to the destination inventory, with suffix -cache.sqlite. "
+        "Digests of unchanged files are then taken from the cache in the next synchronization.",
+    )
+    args = parser.parse_args(argv)
+    if args.jobs is None:
+        args.jobs = int(getenv("REPREP_INVENTORY_JOBS", "1"))
+    sync_inventory(args.inventory_txt, args.dest, args.jobs, args.method, args.cache)
+
+
+def sync_inventory(
+    path_inventory: str,
+    dest: str,
+    jobs: int = 1,
+    method: str = "reflink",
+    cache: bool = False,
+) -> list[str]:
+    """Copy all files in an inventory to a destination directory, if they differ.
+
+    Parameters
+    ----------
+    path_inventory
+        The inventory.txt file.
+    dest
+        The destination directory, created if needed.
+        Files are copied to the same relative paths as in the inventory,
+        i.e. relative to the parent of the inventory file.
+    jobs
+        The number of threads used to compare and copy files.
+    method
+        How the contents of regular files are transferred, see `sync_file`.
+    cache
+        When `True`, the digests of files in the destination are stored
+        in a `DigestCache` next to the destination inventory, with suffix `-cache.sqlite`.
+        Files whose size, modification time, inode and mode are unchanged
+        are then not hashed again in the next synchronization.
+
+    Returns
+    -------
+    synced
+        The paths (relative to `dest`) of the files that were copied.
+        Files already present with the correct size, mode and digest are skipped.
+        The inventory file itself is written last, only after all other files were verified,
+        and it is only included in this list when it has changed.
+
+    Raises
+    ------
+    ValueError
+        When a source file is not consistent with the inventory.
+        Files are first written to a temporary file, which is only renamed after verification,
+        so no corrupt files are left in the destination directory.
+    """
+    if method not in SYNC_METHODS:
+        raise ValueError(f"Unknown sync method: {method}")
+    if not path_inventory.endswith(".txt"):
+        raise ValueError(f"The inventory file must have a `.txt` extension. Got {path_inventory}")
+    path_inventory = Path(path_inventory)
+    root = path_inventory.parent
+    dest = Path(dest)
+    dest.makedirs_p()
+    path_inventory_dst = dest / path_inventory.name
+    digest_cache = (
+        DigestCache.load(path_inventory_dst[:-4] + "-cache.sqlite") if cache else DigestCache()
+    )
+    refs = list(iter_inventory(path_inventory))
+    check_dest_paths(refs)
+    todo = iter_ordered(
+        lambda ref: sync_file(root / ref.path, dest, ref, method, digest_cache), refs, jobs
+    )
+    synced = [ref.path for ref, done in zip(refs, todo, strict=True) if done]
+    data = path_inventory.read_bytes()
+    if not (path_inventory_dst.is_file() and path_inventory_dst.read_bytes() == data):
+        path_inventory_dst.write_bytes(data)
+        synced.append(path_inventory.name)
+    digest_cache.save()
+    return synced
+
+
+def sync_file(
+    src: str, dest: str, ref: FileSummary, method: str = "reflink", cache: DigestCache | None = None
+) -> bool:
+    """Copy a single file to the destination directory, unless an identical file is present.
+
+    Parameters
+    ----------
+    src
+        The source file.
+    dest
+        The destination directory.
+    ref
+        The summary of the file in the inventory.
+        The file is copied to `dest / ref.path`.
+    method
+        How the contents of a regular file are transferred:
+
+        - `copy`: the file is read and written in chunks.
+          The digest is computed while copying, so the source is read only once.
+        - `reflink`: the destination shares the data blocks with the source,
+          on file systems with copy-on-write support (e.g. Btrfs or XFS).
+          Otherwise, the file is copied.
+        - `hardlink`: the destination is a hard link to the source,
+          if the source has the mode in the inventory and both are on the same file system.
+          Otherwise, the file is transferred as with `reflink`.
+
+        Copies of regular files get the mode in the inventory, not that of the source.
+
+        In all cases, the digest of the destination file is verified.
+    cache
+        A cache with digests of files in the destination directory.
+
+    Returns
+    -------
+    synced
+        `False` if an identical file was already present, `True` otherwise.
+    """
+    src = Path(src)
+    dest = Path(dest)
+    dst = get_dest_path(dest, ref.path)
+    if dst.islink() or dst.exists():
+        try:
+            st = dst.stat(follow_symlinks=False)
+            if (
+                stat.filemode(st.st_mode) == ref.mode
+                and (stat.S_ISLNK(st.st_mode) or st.st_size == ref.size)
+                and len(diff_summary(get_summary(dst, dest, cache, st), ref)) == 0
+            ):
+                return False
+        except OSError:
+            pass
+    dst.parent.makedirs_p()
+    fd, path_tmp = tempfile.mkstemp(prefix=f".{dst.name}.", suffix=".srr-tmp", dir=dst.parent)
+    try:
+        os.close(fd)
+        if ref.size is None:
+            target = src.readlink()
+            os.remove(path_tmp)
+            os.symlink(target, path_tmp)
+            digest = compute_file_digest(path_tmp, follow_symlinks=False)
+        else:
+            digest = _transfer(src, path_tmp, method, ref.mode)
+        st = os.stat(path_tmp, follow_symlinks=False)
+        new = FileSummary(
+            None if ref.size is None else st.st_size, stat.filemode(st.st_mode), digest, ref.path
+        )
+        issues = diff_summary(new, ref)
+        if len(issues) > 0:
+            raise ValueError(f"Source not consistent with inventory. {issues[0].format()}")
+        os.replace(path_tmp, dst)
+    except BaseException:
+        if os.path.lexists(path_tmp):
+            os.remove(path_tmp)
+        raise
+    if cache is not None and ref.size is not None:
+        cache.store(ref.path, dst.stat(follow_symlinks=False), digest)
+    return True
+
+
+def _transfer(src: Path, path_tmp: str, method: str, mode: str) -> bytes:
+    """Transfer the contents and timestamps of a regular file and return its digest.
+
+    The file gets the given mode, formatted as in an inventory file.
+    """
+    if method == "hardlink":
+        # A hard link cannot have a different mode than its source.
+        if stat.filemode(os.lstat(src).st_mode) != mode:
+            method = "reflink"
+        else:
+            os.remove(path_tmp)
+            try:
+                os.link(src, path_tmp, follow_symlinks=False)
+            except OSError:
+                # E.g. a different file system. Fall back to a new file.
+                Path(path_tmp).touch()
+                method = "reflink"
+            else:
+                return compute_file_digest(path_tmp)
+    with open(src, "rb", buffering=0) as fh_src, open(path_tmp, "wb", buffering=0) as fh_dst:
+        st = os.fstat(fh_src.fileno())
+        if not stat.S_ISREG(st.st_mode):
+            raise ValueError(f"Not a regular file: {src}")
+        if method == "reflink" and _clone(fh_src.fileno(), fh_dst.fileno()):
+            digest = None
+        else:
+            hasher = new_digest_hasher()
+            buf = bytearray(HASH_CHUNK_SIZE)
+            view = memoryview(buf)
+            while True:
+                nread = fh_src.readinto(buf)
+                if nread == 0:
+                    break
+                chunk = view[:nread]
+                hasher.update(chunk)
+                fh_dst.write(chunk)
+            digest = hasher.digest()
+    os.chmod(path_tmp, REGULAR_FILE_MODES.get(mode, stat.S_IMODE(st.st_mode)))
+    # Keep the modification time, such that the digest can be cached.
+    os.utime(path_tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+    if digest is None:
+        digest = compute_file_digest(path_tmp)
+    return digest
+
+
+def _clone(fd_src: int, fd_dst: int) -> bool:
+    """Try to clone a file with a reflink, return `True` if successful."""
+    try:
+        fcntl.ioctl(fd_dst, FICLONE, fd_src)
+    except OSError:
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    main()
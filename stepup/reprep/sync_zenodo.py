@@ -52,8 +52,8 @@ Some of the features implemented in this module were deduced from the Zenodo web
 
 import argparse
 import datetime
-import hashlib
 import json
+import os
 from typing import Any
 
 import attrs
@@ -68,6 +68,9 @@ from rich import print  # noqa: A004
 
 from stepup.core.api import amend, getenv
 
+from .check_inventory import iter_inventory
+from .inventory import RACY_MTIME_NS, compute_file_digests, parse_digest_sums
+
 
 class RESTError(Exception):
     """Raised when a REST API call is not successful."""
@@ -549,6 +552,7 @@ class Config:
     metadata: Metadata = attrs.field()
     access: Access = attrs.field(default=Access())
     path_readme: str | None = attrs.field(default=None)
+    path_inventory: str | None = attrs.field(default=None)
     paths: list[Path] = attrs.field(factory=list, converter=lambda paths: [Path(p) for p in paths])
     code_repository: str | None = attrs.field(default=None)
 
@@ -730,8 +734,14 @@ def update_online(config: Config, verbose: bool):
     paths_inp = list(config.paths)
     if config.path_readme is not None:
         paths_inp.append(config.path_readme)
+    if config.path_inventory is not None:
+        paths_inp.extend([config.path_inventory, _get_path_md5(config.path_inventory)])
     amend(inp=paths_inp)
 
+    # Reuse MD5 checksums computed by srr-make-inventory, if available.
+    if config.path_inventory is not None:
+        _load_inventory_md5(config.path_inventory, config.paths)
+
     # If present, convert README Markdown file to HTML
     if config.path_readme is not None:
         with open(config.path_readme) as fh:
@@ -817,10 +827,58 @@ def _create_new(zenodo: ZenodoWrapper, config: Config) -> dict[str, Any]:
     return record
 
 
-def _compute_md5(path: str) -> bool:
-    """Compute the MD5 sum of a file and compare to the given checksum."""
-    with open(path, "rb") as fh:
-        return hashlib.file_digest(fh, hashlib.md5).hexdigest()
+_MD5_CACHE: dict[str, tuple[tuple[int, int, int], str]] = {}
+
+
+def _compute_md5(path: str) -> str:
+    """Compute the MD5 sum of a file.
+
+    The result is reused as long as the size, modification time and inode of the file
+    are unchanged, so a file is read only once when it is compared to the online version
+    and checked again after uploading.
+    Files with a valid checksum in the `.md5` file of an inventory are not read at all,
+    see `_load_inventory_md5`.
+    """
+    st = os.stat(path)
+    key = (st.st_size, st.st_mtime_ns, st.st_ino)
+    entry = _MD5_CACHE.get(path)
+    if entry is not None and entry[0] == key:
+        return entry[1]
+    md5 = compute_file_digests(path, ["md5"], follow_symlinks=True)["md5"].hex()
+    _MD5_CACHE[path] = (key, md5)
+    return md5
+
+
+def _get_path_md5(path_inventory: str) -> Path:
+    """Return the MD5 sums file written by `srr-make-inventory -d md5` for an inventory."""
+    if not path_inventory.endswith(".txt"):
+        raise ZenodoError(f"The inventory file must have a `.txt` extension. Got {path_inventory}")
+    return Path(path_inventory[:-4] + ".md5")
+
+
+def _load_inventory_md5(path_inventory: str, paths: list[Path]):
+    """Add MD5 sums from the `.md5` file of an inventory to the cache of `_compute_md5`.
+
+    A checksum is only used when the file has the size recorded in the inventory
+    and was last modified at least `RACY_MTIME_NS` before the checksums started to be computed,
+    which is the modification time of the `.md5` file set by `srr-make-inventory`.
+    The margin accounts for file systems with a coarse timestamp resolution.
+    Other files are hashed as usual.
+    """
+    path_inventory = Path(path_inventory)
+    path_md5 = _get_path_md5(path_inventory)
+    root = path_inventory.parent.normpath()
+    mtime_md5 = path_md5.stat().st_mtime_ns
+    sizes = {ref.path: ref.size for ref in iter_inventory(path_inventory)}
+    md5s = parse_digest_sums(path_md5.read_text())
+    for path in paths:
+        relpath = Path(path).relpath(root).normpath()
+        md5 = md5s.get(relpath)
+        if md5 is None:
+            continue
+        st = os.stat(path)
+        if st.st_size == sizes.get(relpath) and st.st_mtime_ns <= mtime_md5 - RACY_MTIME_NS:
+            _MD5_CACHE[path] = ((st.st_size, st.st_mtime_ns, st.st_ino), md5.hex())
 
 
 def _check_record_md5(record: dict[str], paths: dict[str, Path], version: str):
@@ -0,0 +1,227 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Extract a ZIP file created by `srr-zip-inventory` and verify all files."""
+
+import argparse
+import os
+import stat
+import tempfile
+import zipfile
+import zlib
+
+from path import Path
+
+from stepup.core.api import getenv
+from stepup.core.hash import HASH_CHUNK_SIZE
+
+from .check_inventory import diff_summary
+from .check_zip import read_zip_inventory
+from .inventory import (
+    FileSummary,
+    check_dest_paths,
+    get_dest_path,
+    get_summary,
+    iter_ordered,
+    new_digest_hasher,
+)
+
+__all__ = ("extract_member", "unzip_inventory")
+
+
+def main(argv: list[str] | None = None):
+    """Main program."""
+    parser = argparse.ArgumentParser(
+        prog="srr-unzip-inventory",
+        description="Extract a ZIP file and check all files against the inventory.txt it contains.",
+    )
+    parser.add_argument("path_zip", help="A ZIP file created with srr-zip-inventory")
+    parser.add_argument(
+        "dest", nargs="?", default=".", help="The destination directory. (default: %(default)s)"
+    )
+    parser.add_argument(
+        "-i",
+        "--inventory",
+        help="The name of the inventory file in the ZIP. "
+        "The default is the last member, which is where srr-zip-inventory puts it.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of threads used to extract files. "
+        "The default is ${REPREP_INVENTORY_JOBS} or 1 if the variable is not set.",
+    )
+    args = parser.parse_args(argv)
+    if args.jobs is None:
+        args.jobs = int(getenv("REPREP_INVENTORY_JOBS", "1"))
+    unzip_inventory(args.path_zip, args.dest, args.inventory, args.jobs)
+
+
+def unzip_inventory(
+    path_zip: str, dest: str = ".", arcname: str | None = None, jobs: int = 1
+) -> list[str]:
+    """Extract all files listed in the inventory of a ZIP file and verify them.
+
+    Parameters
+    ----------
+    path_zip
+        The ZIP file created with `zip_inventory`.
+    dest
+        The destination directory, created if needed.
+    arcname
+        The name of the inventory member, see `read_zip_inventory`.
+    jobs
+        The number of threads used to extract files.
+
+    Returns
+    -------
+    extracted
+        The paths (relative to `dest`) of the files that were extracted.
+        Files already present with the correct size, mode and digest are skipped,
+        so an interrupted extraction can be resumed by calling this function again.
+
+    Raises
+    ------
+    ValueError
+        At the first member that is missing, corrupt or not consistent with the inventory.
+        Files are first written to a temporary file, which is only renamed after verification.
+        Hence, no corrupt files are left in the destination directory.
+        The inventory file itself is only written after all other files were verified.
+    """
+    dest = Path(dest)
+    with zipfile.ZipFile(path_zip) as fz:
+        if arcname is None:
+            infolist = fz.infolist()
+            if len(infolist) == 0:
+                raise ValueError(f"Empty ZIP file, no inventory found: {path_zip}")
+            arcname = infolist[-1].filename
+        refs = read_zip_inventory(fz, arcname)
+        check_dest_paths(refs)
+        _check_arcname(arcname)
+
+        def extract(ref: FileSummary) -> bool:
+            try:
+                zipinfo = fz.getinfo(ref.path)
+            except KeyError as exc:
+                raise ValueError(f"File missing in {path_zip}: {ref.path}") from exc
+            return extract_member(fz, zipinfo, ref, dest)
+
+        extracted = [
+            ref.path
+            for ref, done in zip(refs, iter_ordered(extract, refs, jobs), strict=True)
+            if done
+        ]
+        path_inventory = get_dest_path(dest, arcname)
+        path_inventory.parent.makedirs_p()
+        data = fz.read(arcname)
+        if path_inventory.islink() or not (
+            path_inventory.is_file() and path_inventory.read_bytes() == data
+        ):
+            path_inventory.remove_p()
+            path_inventory.write_bytes(data)
+            extracted.append(arcname)
+    return extracted
+
+
+def _check_arcname(arcname: str):
+    """Refuse member names that would be extracted outside the destination directory."""
+    path = Path(arcname)
+    if path.isabs() or path.normpath().startswith(".."):
+        raise ValueError(f"Refusing to extract a file outside the destination: {arcname}")
+
+
+def extract_member(
+    fz: zipfile.ZipFile, zipinfo: zipfile.ZipInfo, ref: FileSummary, dest: str
+) -> bool:
+    """Extract a single member, verifying it while it is written.
+
+    Parameters
+    ----------
+    fz
+        A ZIP file opened for reading.
+        This function may be called from multiple threads for the same ZIP file.
+    zipinfo
+        The member to extract.
+    ref
+        The summary of the member in the inventory.
+    dest
+        The destination directory.
+
+    Returns
+    -------
+    extracted
+        `False` if an identical file was already present, `True` otherwise.
+    """
+    dest = Path(dest)
+    dst = get_dest_path(dest, ref.path)
+    if dst.islink() or dst.exists():
+        try:
+            old = get_summary(dst, dest)
+        except OSError:
+            pass
+        else:
+            if len(diff_summary(old, ref)) == 0:
+                return False
+    dst.parent.makedirs_p()
+    st_mode = zipinfo.external_attr >> 16
+    is_link = stat.S_ISLNK(st_mode)
+    link_target = bytearray()
+    hasher = new_digest_hasher()
+    size = 0
+    fd, path_tmp = tempfile.mkstemp(prefix=f".{dst.name}.", suffix=".srr-tmp", dir=dst.parent)
+    try:
+        try:
+            with os.fdopen(fd, "wb") as fh_dst, fz.open(zipinfo) as fh_src:
+                while True:
+                    chunk = fh_src.read(HASH_CHUNK_SIZE)
+                    if len(chunk) == 0:
+                        break
+                    hasher.update(chunk)
+                    size += len(chunk)
+                    if is_link:
+                        link_target.extend(chunk)
+                    else:
+                        fh_dst.write(chunk)
+        except (zipfile.BadZipFile, zlib.error) as exc:
+            raise ValueError(f"Corrupt ZIP member: {ref.path}") from exc
+        new = FileSummary(
+            None if is_link else size,
+            stat.filemode(st_mode),
+            hasher.digest(),
+            ref.path,
+        )
+        issues = diff_summary(new, ref)
+        if len(issues) > 0:
+            raise ValueError(issues[0].format())
+        if is_link:
+            os.remove(path_tmp)
+            os.symlink(link_target.decode("utf-8"), path_tmp)
+        else:
+            os.chmod(path_tmp, stat.S_IMODE(st_mode))
+        os.replace(path_tmp, dst)
+    except BaseException:
+        if os.path.lexists(path_tmp):
+            os.remove(path_tmp)
+        raise
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Utilities shared by multiple scripts of StepUp RepRep."""
+
+import re
+
+__all__ = ("SIZE_UNITS", "parse_size")
+
+
+SIZE_UNITS = {
+    "": 1,
+    "k": 10**3,
+    "M": 10**6,
+    "G": 10**9,
+    "T": 10**12,
+    "Ki": 2**10,
+    "Mi": 2**20,
+    "Gi": 2**30,
+    "Ti": 2**40,
+}
+
+
+def parse_size(size: str) -> int:
+    """Convert a size with an optional unit (k, M, G, T, Ki, Mi, Gi or Ti) to bytes."""
+    match = re.fullmatch(r"\s*(\d+)\s*([kMGT]?i?)B?\s*", size)
+    if match is None or match.group(2) == "i":
+        raise ValueError(f"Invalid size: {size}")
+    return int(match.group(1)) * SIZE_UNITS[match.group(2)]
@@ -20,19 +20,240 @@
 """Create ZIP with all files listed in an inventory.txt file."""
 
 import argparse
-import datetime
+import contextlib
+import itertools
+import os
+import stat
+import struct
+import sys
 import tempfile
 import zipfile
+import zlib
+from collections.abc import Iterable, Iterator
+from typing import Self
 
+import attrs
 from path import Path
 
+from stepup.core.api import getenv
+from stepup.core.hash import HASH_CHUNK_SIZE
+
 from .check_inventory import iter_inventory
-from .inventory import check_summary, get_summary
+from .inventory import (
+    FileSummary,
+    check_summary,
+    get_summary,
+    iter_ordered,
+    new_digest_hasher,
+    parse_summary,
+)
 
 __all__ = ("zip_inventory",)
 
 
-TIMESTAMP = datetime.datetime(1980, 1, 1).timestamp()
+DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+COMPRESSED_EXTENSIONS = (
+    ".7z",
+    ".avif",
+    ".br",
+    ".bz2",
+    ".docx",
+    ".epub",
+    ".flac",
+    ".gif",
+    ".gz",
+    ".heic",
+    ".jar",
+    ".jpeg",
+    ".jpg",
+    ".jxl",
+    ".lz4",
+    ".mkv",
+    ".mp3",
+    ".mp4",
+    ".npz",
+    ".odp",
+    ".ods",
+    ".odt",
+    ".ogg",
+    ".pdf",
+    ".png",
+    ".pptx",
+    ".tgz",
+    ".webm",
+    ".webp",
+    ".whl",
+    ".xlsx",
+    ".xz",
+    ".zip",
+    ".zst",
+)
+"""Extensions of file formats that are already compressed, stored as is by the `auto` policy."""
+
+COMPRESSION_PRESETS = {
+    "deflate": "*=deflate",
+    "auto": ",".join(f"{ext}=store" for ext in COMPRESSED_EXTENSIONS) + ",*=sample",
+}
+"""Named compression policies, which can be combined with other rules."""
+
+SAMPLE_SIZE = 1 << 16
+"""The number of leading bytes used to decide whether a file is compressible."""
+
+SAMPLE_RATIO = 0.9
+"""Files whose sample does not compress below this ratio are stored as is."""
+
+MAX_BUFFERED_SIZE = 1 << 24
+"""Files up to this size are compressed in memory by worker threads.
+
+Larger files are compressed by worker threads to temporary files,
+which keeps the memory usage bounded.
+"""
+
+MAX_PENDING_SIZE = 1 << 27
+"""The maximum total size of the files compressed in memory that wait to be written.
+
+Each file is at most `MAX_BUFFERED_SIZE` bytes, so one file is always allowed.
+"""
+
+RAW_WRITE_PYTHON_VERSIONS = ((3, 11), (3, 14))
+"""The oldest and newest Python versions whose `zipfile` internals are used by `_write_raw`."""
+
+
+@attrs.define
+class CompressionPolicy:
+    """Rules to select the compression method of each file in a ZIP archive.
+
+    A policy is defined by a string with comma-separated rules.
+    Each rule is either the name of a preset in `COMPRESSION_PRESETS`,
+    or has the form `ext=method`, where `ext` is a file extension, e.g. `.png`,
+    or `*` for files not matched by any extension.
+    Supported methods are:
+
+    - `store`: no compression.
+    - `deflate`: deflate with the default compression level.
+    - `deflate0` to `deflate9`: deflate with the given compression level.
+    - `sample`: deflate with the default level,
+      unless the first `SAMPLE_SIZE` bytes of the file are incompressible,
+      in which case the file is stored.
+
+    Later rules override earlier ones.
+    The selected method only depends on the file name and contents,
+    so ZIP files created with the same policy are reproducible.
+    """
+
+    spec: str = attrs.field()
+    """The normalized definition of the policy."""
+
+    rules: dict[str, str] = attrs.field()
+    """Methods by extension, with `*` as the fallback."""
+
+    @classmethod
+    def from_spec(cls, spec: str) -> Self:
+        """Parse a policy definition, see class docstring."""
+        rules = {"*": "deflate"}
+        for item in spec.split(","):
+            item = item.strip()
+            if item == "":
+                continue
+            if "=" not in item:
+                preset = COMPRESSION_PRESETS.get(item)
+                if preset is None:
+                    raise ValueError(f"Unknown compression preset: {item}")
+                rules.update(cls.from_spec(preset).rules)
+                continue
+            ext, method = (word.strip() for word in item.split("=", 1))
+            if not (ext == "*" or (ext.startswith(".") and len(ext) > 1)):
+                raise ValueError(f"Invalid extension in compression rule: {item}")
+            if not (
+                method in ("store", "deflate", "sample")
+                or (len(method) == 8 and method[:7] == "deflate" and method[7].isdigit())
+            ):
+                raise ValueError(f"Invalid method in compression rule: {item}")
+            rules[ext.lower()] = method
+        # The normalized spec does not depend on how the rules were specified.
+        fallback = rules.pop("*")
+        rules = dict(sorted(rules.items()))
+        rules["*"] = fallback
+        return cls(",".join(f"{ext}={method}" for ext, method in rules.items()), rules)
+
+    @property
+    def is_default(self) -> bool:
+        """True when all files are deflated with the default level."""
+        return self.rules == {"*": "deflate"}
+
+    def needs_sample(self, path: str) -> bool:
+        """True when the choice of the compression method depends on the file contents."""
+        return self._get_method(path) == "sample"
+
+    def is_stored(self, path: str) -> bool:
+        """True when the file is stored without compression, regardless of its contents."""
+        return self._get_method(path) == "store"
+
+    def get_level(self, path: str) -> int | None:
+        """The compression level of the file if it is deflated, or `None` for the default."""
+        method = self._get_method(path)
+        return int(method[7]) if len(method) == 8 else None
+
+    def _get_method(self, path: str) -> str:
+        return self.rules.get(Path(path).suffix.lower(), self.rules["*"])
+
+    def choose(self, path: str, sample: bytes) -> tuple[int, int | None]:
+        """Select the compression method for a file.
+
+        Parameters
+        ----------
+        path
+            The file name.
+        sample
+            The first bytes of the file, at least `SAMPLE_SIZE` unless the file is smaller.
+            This is only used when `needs_sample` returns `True`.
+
+        Returns
+        -------
+        compress_type
+            `zipfile.ZIP_STORED` or `zipfile.ZIP_DEFLATED`.
+        compress_level
+            The compression level, or `None` for the default level.
+        """
+        method = self._get_method(path)
+        if method == "sample":
+            sample = sample[:SAMPLE_SIZE]
+            if len(zlib.compress(sample, 1)) > SAMPLE_RATIO * len(sample):
+                method = "store"
+            else:
+                method = "deflate"
+        if method == "store":
+            return zipfile.ZIP_STORED, None
+        if method == "deflate":
+            return zipfile.ZIP_DEFLATED, None
+        return zipfile.ZIP_DEFLATED, int(method[7])
+
+    @property
+    def comment(self) -> bytes:
+        """The comment of a ZIP file created with this policy.
+
+        The default policy has no comment, for compatibility with older versions.
+        """
+        return b"" if self.is_default else f"srr-zip-inventory compression={self.spec}".encode()
+
+
+DEFAULT_POLICY = CompressionPolicy.from_spec("deflate")
+
+
+def _make_compressor(compress_type: int, compress_level: int | None):
+    """Create a compressor with the same settings as `zipfile`, or `None` to store data."""
+    if compress_type == zipfile.ZIP_STORED:
+        return None
+    if compress_level is None:
+        compress_level = zlib.Z_DEFAULT_COMPRESSION
+    return zlib.compressobj(compress_level, zlib.DEFLATED, -15)
+
+
+def _set_compression(zipinfo: zipfile.ZipInfo, compress_type: int, compress_level: int | None):
+    zipinfo.compress_type = compress_type
+    # This attribute is called compress_level as of Python 3.13, with _compresslevel as an alias.
+    zipinfo._compresslevel = compress_level
 
 
 def main(argv: list[str] | None = None):
@@ -47,11 +268,45 @@ def main(argv: list[str] | None = None):
         "The inventory file will be included in the ZIP.",
     )
     parser.add_argument("output_zip", nargs="?", help="Destination zip file.")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of threads used to compress files. "
+        "The default is ${REPREP_INVENTORY_JOBS} or 1 if the variable is not set.",
+    )
+    parser.add_argument(
+        "-u",
+        "--incremental",
+        action="store_true",
+        default=False,
+        help="Copy compressed members from an existing output ZIP file "
+        "when their size, mode and digest are unchanged.",
+    )
+    parser.add_argument(
+        "-c",
+        "--compression",
+        help="The compression policy: comma-separated presets (deflate, auto) "
+        "or rules ext=method, where method is store, deflate, deflate0-9 or sample. "
+        "The default is ${REPREP_ZIP_COMPRESSION} or deflate if the variable is not set.",
+    )
     args = parser.parse_args(argv)
-    zip_inventory(args.inventory_txt, args.output_zip)
+    if args.jobs is None:
+        args.jobs = int(getenv("REPREP_INVENTORY_JOBS", "1"))
+    if args.compression is None:
+        args.compression = getenv("REPREP_ZIP_COMPRESSION", "deflate")
+    zip_inventory(
+        args.inventory_txt, args.output_zip, args.jobs, args.incremental, args.compression
+    )
 
 
-def zip_inventory(path_inventory: str, path_zip: str | None = None):
+def zip_inventory(
+    path_inventory: str,
+    path_zip: str | None = None,
+    jobs: int = 1,
+    incremental: bool = False,
+    compression: str = "deflate",
+):
     """Create a reproducible zip file.
 
     Parameters
@@ -64,7 +319,25 @@ def zip_inventory(path_inventory: str, path_zip: str | None = None):
         When not given, the `.zip` suffix is added to the prefix of `path_inventory`.
         The existing ZIP file with the same path is only overwritten when the ZIP
         file is first succesfully created in a temporary directory.
+    jobs
+        The number of threads used to compress files.
+        The ZIP file does not depend on this number:
+        members are always compressed with the same settings and written in inventory order.
+    incremental
+        When `True` and `path_zip` is an existing ZIP file created by this function,
+        the compressed data of members with the same size, mode and digest
+        in the old and the new inventory are copied verbatim.
+        Only new or changed files are read and compressed.
+        The result is identical to that of a full rebuild.
+        Members are only reused if the old ZIP file was created with the same compression policy.
+    compression
+        The compression policy, see `CompressionPolicy`.
+        The default deflates all files, as in older versions.
+        The preset `auto` stores files with already compressed formats,
+        and other files whose leading bytes are incompressible.
+        Non-default policies are recorded in the ZIP file comment.
     """
+    policy = CompressionPolicy.from_spec(compression)
     if not path_inventory.endswith(".txt"):
         raise ValueError(f"The inventory file must have a `.txt` extension. Got {path_inventory}")
     path_inventory = Path(path_inventory)
@@ -77,38 +350,570 @@ def zip_inventory(path_inventory: str, path_zip: str | None = None):
     # Create a new ZIP archive.
     root = path_inventory.parent
     nskip = 0 if root == "" else len(root) + 1
-    with tempfile.TemporaryDirectory("srr-zip-inventory") as path_tmp:
-        path_tmp = Path(path_tmp)
-        path_zip_tmp = path_tmp / "out.zip"
+    with contextlib.ExitStack() as stack:
+        path_tmp = stack.enter_context(tempfile.TemporaryDirectory("srr-zip-inventory"))
+        path_zip_tmp = Path(path_tmp) / "out.zip"
+        refs = list(iter_inventory(path_inventory))
+        reusable = {}
+        if incremental and path_zip.is_file():
+            fh_old = stack.enter_context(open(path_zip, "rb"))
+            reusable = find_reusable_members(fh_old, path_inventory[nskip:], refs, policy)
         with zipfile.ZipFile(path_zip_tmp, "w") as fz:
-            for ref in iter_inventory(path_inventory):
-                # Copy the file to a temp dir.
-                # This saves bandwith in case of remote datasets and allows
-                # fixing the timestamp before compression.
+            fz.comment = policy.comment
+            buf = bytearray(HASH_CHUNK_SIZE)
+
+            def compress(ref: FileSummary) -> CompressedMember | None:
+                if jobs == 1 or ref.size is None or ref.path in reusable:
+                    return None
+                if ref.size <= MAX_BUFFERED_SIZE:
+                    return compress_member(root / ref.path, ref.path, policy)
+                if policy.is_stored(ref.path):
+                    # Nothing to gain from a worker thread.
+                    return None
+                return compress_member_file(root / ref.path, ref.path, path_tmp, policy)
+
+            def weigh(ref: FileSummary) -> int:
+                if ref.size is None or ref.size > MAX_BUFFERED_SIZE or ref.path in reusable:
+                    return 0
+                return ref.size
+
+            members = iter_ordered(compress, refs, jobs, weigh, MAX_PENDING_SIZE)
+            for ref, member in zip(refs, members, strict=True):
                 src = Path(root / ref.path)
-                dst = path_tmp / "todo"
-                dst.remove_p()
-                src.copy(dst, follow_symlinks=False)
-                # Check the file before adding it to the ZIP
-                new = get_summary(dst, path_tmp)
-                check_summary(new, ref)
-                # Store
-                if ref.size is None:
-                    # Symbolic link
-                    zipinfo = zipfile.ZipInfo(src[nskip:])
+                zipinfo_old = reusable.get(ref.path)
+                if zipinfo_old is not None:
+                    # Unchanged file in the old ZIP
+                    copy_member(fz, fh_old, zipinfo_old, src[nskip:], buf, ref, policy)
+                elif member is not None:
+                    # Compressed by a worker thread
+                    write_compressed_member(fz, member, src[nskip:], ref, buf)
+                elif ref.size is None:
+                    # Symbolic link, of which the digest is cheap to compute.
+                    new = get_summary(src, root)
+                    check_summary(new, ref)
+                    zipinfo = zipfile.ZipInfo(src[nskip:], DATE_TIME)
                     zipinfo.create_system = 3  # 3 means Unix
-                    zipinfo.external_attr |= dst.stat(follow_symlinks=False).st_mode << 16
-                    fz.writestr(zipinfo, dst.readlink())
+                    zipinfo.external_attr |= src.stat(follow_symlinks=False).st_mode << 16
+                    fz.writestr(zipinfo, src.readlink())
                 else:
                     # Actual file
-                    dst.utime((TIMESTAMP, TIMESTAMP))
-                    fz.write(dst, src[nskip:], zipfile.ZIP_DEFLATED)
-            dst = path_tmp / "todo"
-            path_inventory.copy(dst)
-            dst.utime((TIMESTAMP, TIMESTAMP))
-            fz.write(dst, path_inventory[nskip:], zipfile.ZIP_DEFLATED)
+                    write_member(fz, src, src[nskip:], buf, ref, policy)
+            write_member(fz, path_inventory, path_inventory[nskip:], buf, None, policy)
         path_zip_tmp.move(path_zip)
 
 
+def write_member(
+    fz: zipfile.ZipFile,
+    path_src: str,
+    arcname: str,
+    buf: bytearray,
+    ref: FileSummary | None = None,
+    policy: CompressionPolicy = DEFAULT_POLICY,
+):
+    """Add a regular file to a ZIP archive, reading it only once.
+
+    Parameters
+    ----------
+    fz
+        The ZIP archive, opened for writing.
+    path_src
+        The file to be added.
+    arcname
+        The name of the file in the archive.
+    buf
+        A reusable buffer for reading the file in chunks.
+        It must be at least `SAMPLE_SIZE` bytes long.
+    ref
+        If given, the size, mode and digest of the file are checked while it is compressed.
+        In case of a mismatch, a `ValueError` is raised
+        and the (partially written) archive should be discarded.
+    policy
+        The compression policy.
+
+    Notes
+    -----
+    The timestamp of the member is fixed to January 1st, 1980 for reproducibility.
+    The result is the same as calling `fz.write` after setting this timestamp on the file.
+    """
+    with open(path_src, "rb", buffering=0) as fh:
+        st = os.fstat(fh.fileno())
+        if not stat.S_ISREG(st.st_mode):
+            raise ValueError(f"Not a regular file: {path_src}")
+        view = memoryview(buf)
+        # The first chunk doubles as the sample for the compression policy.
+        nread = _read_full(fh, view[:SAMPLE_SIZE]) if policy.needs_sample(arcname) else 0
+        zipinfo = zipfile.ZipInfo(arcname, DATE_TIME)
+        zipinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+        zipinfo.file_size = st.st_size
+        _set_compression(zipinfo, *policy.choose(arcname, view[:nread]))
+        hasher = new_digest_hasher()
+        size = 0
+        with fz.open(zipinfo, "w") as dest:
+            while True:
+                if nread == 0:
+                    nread = fh.readinto(buf)
+                    if nread == 0:
+                        break
+                chunk = view[:nread]
+                hasher.update(chunk)
+                dest.write(chunk)
+                size += nread
+                nread = 0
+    if ref is not None:
+        new = FileSummary(size, stat.filemode(st.st_mode), hasher.digest(), ref.path)
+        check_summary(new, ref)
+
+
+def write_chunks_member(
+    fz: zipfile.ZipFile,
+    chunks: Iterable[bytes],
+    arcname: str,
+    st_mode: int,
+    size: int,
+    ref: FileSummary | None = None,
+    policy: CompressionPolicy = DEFAULT_POLICY,
+):
+    """Add a regular file, given as an iterable of chunks, to a ZIP archive.
+
+    Parameters
+    ----------
+    fz
+        The ZIP archive, opened for writing.
+    chunks
+        The consecutive parts of the file contents.
+    arcname
+        The name of the file in the archive.
+    st_mode
+        The file mode, in the encoding of `os.stat_result.st_mode`.
+    size
+        The size of the file.
+    ref, policy
+        See `write_member`.
+
+    Notes
+    -----
+    The result is the same as that of `write_member` for a file with the same contents and mode.
+    """
+    chunks = iter(chunks)
+    head = []
+    if policy.needs_sample(arcname):
+        nhead = 0
+        for chunk in chunks:
+            head.append(chunk)
+            nhead += len(chunk)
+            if nhead >= SAMPLE_SIZE:
+                break
+    zipinfo = zipfile.ZipInfo(arcname, DATE_TIME)
+    zipinfo.external_attr = (st_mode & 0xFFFF) << 16
+    zipinfo.file_size = size
+    _set_compression(zipinfo, *policy.choose(arcname, b"".join(head)[:SAMPLE_SIZE]))
+    hasher = new_digest_hasher()
+    size = 0
+    with fz.open(zipinfo, "w") as dest:
+        for chunk in itertools.chain(head, chunks):
+            hasher.update(chunk)
+            dest.write(chunk)
+            size += len(chunk)
+    if ref is not None:
+        new = FileSummary(size, stat.filemode(st_mode), hasher.digest(), ref.path)
+        check_summary(new, ref)
+
+
+def _read_full(fh, view: memoryview) -> int:
+    """Fill a buffer as much as possible, unlike readinto, which may return fewer bytes."""
+    size = 0
+    while size < len(view):
+        nread = fh.readinto(view[size:])
+        if nread == 0:
+            break
+        size += nread
+    return size
+
+
+@attrs.define
+class CompressedMember:
+    """A regular file compressed in memory or to a temporary file, ready to be added to a ZIP."""
+
+    data: bytes = attrs.field()
+    """The raw deflate stream, or the file contents if it is stored.
+
+    This is empty when the data is written to `path_data`.
+    """
+
+    crc: int = attrs.field()
+    """The CRC-32 of the uncompressed file."""
+
+    size: int = attrs.field()
+    """The size of the uncompressed file."""
+
+    mode: int = attrs.field()
+    """The file mode, in the encoding of `os.stat_result.st_mode`."""
+
+    digest: bytes = attrs.field()
+    """The digest of the uncompressed file, see `new_digest_hasher`."""
+
+    compress_type: int = attrs.field(default=zipfile.ZIP_DEFLATED)
+    """The compression method: `zipfile.ZIP_STORED` or `zipfile.ZIP_DEFLATED`."""
+
+    compress_level: int | None = attrs.field(default=None)
+    """The compression level, or `None` for the default level."""
+
+    path_data: str | None = attrs.field(default=None, kw_only=True)
+    """A temporary file with the compressed data, used instead of `data` for large files.
+
+    It is removed by `write_compressed_member`.
+    """
+
+    @property
+    def compress_size(self) -> int:
+        """The size of the compressed data."""
+        return len(self.data) if self.path_data is None else os.path.getsize(self.path_data)
+
+
+def compress_member(
+    path_src: str, arcname: str, policy: CompressionPolicy = DEFAULT_POLICY
+) -> CompressedMember:
+    """Read a regular file once and compress it in memory, as `zipfile` would do."""
+    with open(path_src, "rb") as fh:
+        st = os.fstat(fh.fileno())
+        if not stat.S_ISREG(st.st_mode):
+            raise ValueError(f"Not a regular file: {path_src}")
+        data = fh.read()
+    hasher = new_digest_hasher()
+    hasher.update(data)
+    compress_type, compress_level = policy.choose(arcname, data[:SAMPLE_SIZE])
+    compressor = _make_compressor(compress_type, compress_level)
+    compressed = data if compressor is None else compressor.compress(data) + compressor.flush()
+    return CompressedMember(
+        compressed,
+        zlib.crc32(data),
+        len(data),
+        st.st_mode,
+        hasher.digest(),
+        compress_type,
+        compress_level,
+    )
+
+
+def compress_member_file(
+    path_src: str, arcname: str, dir_tmp: str, policy: CompressionPolicy = DEFAULT_POLICY
+) -> CompressedMember:
+    """Read a regular file once and compress it to a temporary file in `dir_tmp`.
+
+    This is the counterpart of `compress_member` for files too large to be kept in memory.
+    The result is the same and the temporary file is removed by `write_compressed_member`.
+    """
+    fd, path_data = tempfile.mkstemp(suffix=".srr-tmp", dir=dir_tmp)
+    try:
+        with open(path_src, "rb", buffering=0) as fh, open(fd, "wb") as fh_data:
+            st = os.fstat(fh.fileno())
+            if not stat.S_ISREG(st.st_mode):
+                raise ValueError(f"Not a regular file: {path_src}")
+            buf = bytearray(HASH_CHUNK_SIZE)
+            view = memoryview(buf)
+            nread = _read_full(fh, view[:SAMPLE_SIZE]) if policy.needs_sample(arcname) else 0
+            compress_type, compress_level = policy.choose(arcname, view[:nread])
+            compressor = _make_compressor(compress_type, compress_level)
+            hasher = new_digest_hasher()
+            crc = 0
+            size = 0
+            while True:
+                if nread == 0:
+                    nread = fh.readinto(buf)
+                    if nread == 0:
+                        break
+                chunk = view[:nread]
+                hasher.update(chunk)
+                crc = zlib.crc32(chunk, crc)
+                size += nread
+                fh_data.write(chunk if compressor is None else compressor.compress(chunk))
+                nread = 0
+            if compressor is not None:
+                fh_data.write(compressor.flush())
+    except BaseException:
+        os.remove(path_data)
+        raise
+    return CompressedMember(
+        b"",
+        crc,
+        size,
+        st.st_mode,
+        hasher.digest(),
+        compress_type,
+        compress_level,
+        path_data=path_data,
+    )
+
+
+def write_compressed_member(
+    fz: zipfile.ZipFile,
+    member: CompressedMember,
+    arcname: str,
+    ref: FileSummary | None = None,
+    buf: bytearray | None = None,
+):
+    """Add a file compressed with `compress_member` or `compress_member_file` to a ZIP archive.
+
+    Parameters
+    ----------
+    fz
+        The ZIP archive, opened for writing.
+    member
+        The compressed file.
+        Its temporary file, if any, is removed.
+    arcname
+        The name of the file in the archive.
+    ref
+        If given, the size, mode and digest of the file are checked before it is written.
+    buf
+        A reusable buffer for reading the temporary file in chunks.
+
+    Notes
+    -----
+    This function writes the same bytes as `write_member`, see `write_raw_member`.
+    """
+    try:
+        if ref is not None:
+            new = FileSummary(member.size, stat.filemode(member.mode), member.digest, ref.path)
+            check_summary(new, ref)
+        zipinfo = zipfile.ZipInfo(arcname, DATE_TIME)
+        zipinfo.external_attr = (member.mode & 0xFFFF) << 16
+        _set_compression(zipinfo, member.compress_type, member.compress_level)
+        zipinfo.file_size = member.size
+        zipinfo.compress_size = member.compress_size
+        zipinfo.CRC = member.crc
+        if member.path_data is None:
+            write_raw_member(fz, zipinfo, [member.data])
+        else:
+            if buf is None:
+                buf = bytearray(HASH_CHUNK_SIZE)
+            with open(member.path_data, "rb", buffering=0) as fh:
+                write_raw_member(fz, zipinfo, _iter_chunks(fh, buf))
+    finally:
+        if member.path_data is not None:
+            os.remove(member.path_data)
+
+
+def _iter_chunks(fh, buf: bytearray) -> Iterator[memoryview]:
+    """Iterate over the contents of a file, reusing a buffer for all chunks."""
+    view = memoryview(buf)
+    while True:
+        nread = fh.readinto(buf)
+        if nread == 0:
+            break
+        yield view[:nread]
+
+
+def write_raw_member(fz: zipfile.ZipFile, zipinfo: zipfile.ZipInfo, chunks: Iterable[bytes]):
+    """Add a member with precompressed data to a ZIP archive.
+
+    Parameters
+    ----------
+    fz
+        The ZIP archive, opened for writing.
+    zipinfo
+        The member info, including the compression method and level,
+        the CRC, the file size and the compressed size.
+    chunks
+        The compressed data, possibly split into multiple chunks.
+
+    Notes
+    -----
+    The `zipfile` module has no public API to add precompressed data.
+    When `can_write_raw` returns `True`, the data is written as is by `_write_raw`.
+    Otherwise, it is decompressed and compressed again with the public API.
+    In both cases, the result is the same as that of `write_member` for the uncompressed file.
+    """
+    if can_write_raw(fz):
+        _write_raw(fz, zipinfo, chunks)
+        return
+    decompressor = (
+        zlib.decompressobj(-15) if zipinfo.compress_type == zipfile.ZIP_DEFLATED else None
+    )
+    crc = zipinfo.CRC
+    size = zipinfo.file_size
+    with fz.open(zipinfo, "w") as dest:
+        for chunk in chunks:
+            dest.write(chunk if decompressor is None else decompressor.decompress(chunk))
+        if decompressor is not None:
+            dest.write(decompressor.flush())
+    if crc != zipinfo.CRC or size != zipinfo.file_size:
+        raise ValueError(f"CRC or size mismatch for ZIP member {zipinfo.filename}")
+
+
+ZIPFILE_INTERNALS = (
+    "_didModify",
+    "_seekable",
+    "_writecheck",
+    "_writing",
+    "NameToInfo",
+    "filelist",
+    "fp",
+    "start_dir",
+)
+"""Attributes of `ZipFile` objects used by `_write_raw`, most of which are private."""
+
+
+def can_write_raw(fz: zipfile.ZipFile) -> bool:
+    """Return `True` when precompressed data can be added to a ZIP archive with `_write_raw`.
+
+    This is only the case for Python versions in the range `RAW_WRITE_PYTHON_VERSIONS`,
+    whose `zipfile` internals have been checked,
+    and when the archive is written to a seekable file.
+    """
+    oldest, newest = RAW_WRITE_PYTHON_VERSIONS
+    return (
+        oldest <= sys.version_info[:2] <= newest
+        and all(hasattr(fz, name) for name in ZIPFILE_INTERNALS)
+        and fz._seekable
+        and not fz._writing
+    )
+
+
+def _write_raw(fz: zipfile.ZipFile, zipinfo: zipfile.ZipInfo, chunks: Iterable[bytes]):
+    """Write precompressed data, following the steps of `ZipFile.open` in write mode.
+
+    This must only be called when `can_write_raw` returns `True`.
+    """
+    zipinfo.flag_bits = 0x00
+    zip64 = zipinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+    fz.fp.seek(fz.start_dir)
+    zipinfo.header_offset = fz.fp.tell()
+    fz._writecheck(zipinfo)
+    fz._didModify = True
+    fz.fp.write(zipinfo.FileHeader(zip64))
+    compress_size = 0
+    for chunk in chunks:
+        fz.fp.write(chunk)
+        compress_size += len(chunk)
+    if compress_size != zipinfo.compress_size:
+        raise ValueError(f"Compressed size mismatch for ZIP member {zipinfo.filename}")
+    fz.start_dir = fz.fp.tell()
+    fz.filelist.append(zipinfo)
+    fz.NameToInfo[zipinfo.filename] = zipinfo
+
+
+def find_reusable_members(
+    fh_old, arcname_inventory: str, refs: list[FileSummary], policy: CompressionPolicy
+) -> dict[str, zipfile.ZipInfo]:
+    """Find members of an old ZIP archive that can be copied verbatim into a new one.
+
+    Parameters
+    ----------
+    fh_old
+        The old ZIP archive, opened in binary mode.
+    arcname_inventory
+        The name of the inventory file in the archive.
+    refs
+        The records of the new inventory.
+    policy
+        The compression policy of the new archive.
+        No members are reused when the old archive was created with a different policy.
+
+    Returns
+    -------
+    reusable
+        A dictionary with paths from the new inventory as keys and members of the old archive
+        as values, for all regular files whose record in the old inventory
+        is identical to the one in the new inventory.
+        If the old archive cannot be read or was not created by `zip_inventory`,
+        an empty dictionary is returned.
+    """
+    try:
+        with zipfile.ZipFile(fh_old) as fz_old:
+            if fz_old.comment != policy.comment:
+                return {}
+            old_refs = {}
+            for line in fz_old.read(arcname_inventory).decode().splitlines():
+                old_ref = parse_summary(line)
+                old_refs[old_ref.path] = old_ref
+            zipinfos = fz_old.NameToInfo
+    except (zipfile.BadZipFile, KeyError, ValueError):
+        return {}
+    reusable = {}
+    for ref in refs:
+        if ref.size is None or old_refs.get(ref.path) != ref:
+            continue
+        zipinfo = zipinfos.get(ref.path)
+        if (
+            zipinfo is not None
+            and zipinfo.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+            and zipinfo.file_size == ref.size
+            and stat.filemode(zipinfo.external_attr >> 16) == ref.mode
+            and zipinfo.date_time == DATE_TIME
+            and zipinfo.flag_bits & ~0x800 == 0x00
+        ):
+            reusable[ref.path] = zipinfo
+    return reusable
+
+
+def iter_raw_data(
+    fh_old, zipinfo: zipfile.ZipInfo, buf: bytearray, ref: FileSummary
+) -> Iterator[bytes]:
+    """Iterate over the compressed data of a member in an opened ZIP archive.
+
+    The data is decompressed on the fly to verify the CRC and the digest of the member,
+    which is much cheaper than compressing it again.
+    A `ValueError` is raised after the last chunk in case of a mismatch.
+    """
+    fh_old.seek(zipinfo.header_offset)
+    header = fh_old.read(zipfile.sizeFileHeader)
+    fields = struct.unpack(zipfile.structFileHeader, header)
+    if fields[0] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Bad local file header for ZIP member {zipinfo.filename}")
+    fh_old.seek(fields[10] + fields[11], os.SEEK_CUR)
+    decompressor = (
+        zlib.decompressobj(-15) if zipinfo.compress_type == zipfile.ZIP_DEFLATED else None
+    )
+    hasher = new_digest_hasher()
+    crc = 0
+    size = 0
+    view = memoryview(buf)
+    remaining = zipinfo.compress_size
+    while remaining > 0:
+        nread = fh_old.readinto(view[: min(remaining, len(buf))])
+        if nread == 0:
+            raise zipfile.BadZipFile(f"Truncated ZIP member {zipinfo.filename}")
+        remaining -= nread
+        chunk = view[:nread]
+        try:
+            data = chunk if decompressor is None else decompressor.decompress(chunk)
+        except zlib.error as exc:
+            raise ValueError(f"Corrupt data in old ZIP member: {zipinfo.filename}") from exc
+        hasher.update(data)
+        crc = zlib.crc32(data, crc)
+        size += len(data)
+        yield chunk
+    data = b"" if decompressor is None else decompressor.flush()
+    hasher.update(data)
+    crc = zlib.crc32(data, crc)
+    size += len(data)
+    if crc != zipinfo.CRC:
+        raise ValueError(f"CRC mismatch in old ZIP member: {zipinfo.filename}")
+    check_summary(FileSummary(size, ref.mode, hasher.digest(), ref.path), ref)
+
+
+def copy_member(
+    fz: zipfile.ZipFile,
+    fh_old,
+    zipinfo_old: zipfile.ZipInfo,
+    arcname: str,
+    buf: bytearray,
+    ref: FileSummary,
+    policy: CompressionPolicy = DEFAULT_POLICY,
+):
+    """Copy the compressed data of a member from an old ZIP archive, see `iter_raw_data`.
+
+    The policy must be the one with which the old archive was created.
+    """
+    zipinfo = zipfile.ZipInfo(arcname, DATE_TIME)
+    zipinfo.external_attr = zipinfo_old.external_attr
+    _set_compression(zipinfo, zipinfo_old.compress_type, policy.get_level(arcname))
+    zipinfo.file_size = zipinfo_old.file_size
+    zipinfo.compress_size = zipinfo_old.compress_size
+    zipinfo.CRC = zipinfo_old.CRC
+    write_raw_member(fz, zipinfo, iter_raw_data(fh_old, zipinfo_old, buf, ref))
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,116 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Unit tests for stepup.reprep.cat_pdf."""
+
+import fitz
+import pytest
+from path import Path
+
+from stepup.reprep.cat_pdf import cat_pdf, share_objects
+
+
+def _make_chapter(path_pdf: Path, title: str, logo: bytes):
+    with fitz.open() as doc:
+        page = doc.new_page()
+        page.insert_font(fontname="F0", fontbuffer=fitz.Font("cour").buffer)
+        page.insert_text((50, 50), title, fontname="F0")
+        page.insert_image(fitz.Rect(50, 100, 150, 200), stream=logo)
+        # A form XObject, which is not shared by share_objects.
+        with fitz.open() as stamp:
+            stamp.new_page(width=100, height=50).draw_rect(
+                fitz.Rect(10, 10, 90, 40), fill=(0, 0, 1)
+            )
+            page.show_pdf_page(fitz.Rect(50, 250, 150, 300), stamp)
+        doc.save(path_pdf, garbage=4, deflate=True)
+
+
+def _count_objects(path_pdf: Path) -> tuple[int, int]:
+    """Count the number of images and font descriptors in a PDF."""
+    nimage = 0
+    nfont = 0
+    with fitz.open(path_pdf) as doc:
+        for xref in range(1, doc.xref_length()):
+            if doc.xref_get_key(xref, "Subtype")[1] == "/Image":
+                nimage += 1
+            elif doc.xref_get_key(xref, "Type")[1] == "/FontDescriptor":
+                nfont += 1
+    return nimage, nfont
+
+
+def _make_chapters(path_tmp: Path, nchapter: int) -> list[Path]:
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 64), False)
+    pix.set_rect(pix.irect, (200, 100, 0))
+    logo = pix.tobytes("png")
+    paths_src = []
+    for ichapter in range(nchapter):
+        path_src = path_tmp / f"chapter{ichapter}.pdf"
+        _make_chapter(path_src, f"Chapter {ichapter}", logo)
+        paths_src.append(path_src)
+    return paths_src
+
+
+def test_share_objects(path_tmp: Path):
+    paths_src = _make_chapters(path_tmp, 3)
+    shared = {}
+    memo = {}
+    with fitz.open() as doc:
+        nshared = []
+        for path_src in paths_src:
+            with fitz.open(path_src) as src:
+                start = doc.xref_length()
+                doc.insert_pdf(src)
+                nshared.append(share_objects(doc, start, shared, memo))
+        assert nshared[0] == 0
+        assert nshared[1] > 0
+        assert nshared[2] == nshared[1]
+        assert len({page.get_images()[0][0] for page in doc}) == 1
+        assert len({page.get_fonts()[0][0] for page in doc}) == 1
+        assert [page.get_text().strip() for page in doc] == ["Chapter 0", "Chapter 1", "Chapter 2"]
+
+
+@pytest.mark.parametrize("dedup", [False, True])
+def test_cat_pdf_dedup(path_tmp: Path, dedup: bool):
+    paths_src = _make_chapters(path_tmp, 3)
+    path_dst = path_tmp / "book.pdf"
+    cat_pdf(paths_src, path_dst, True, dedup)
+    with fitz.open(path_dst) as doc:
+        assert doc.page_count == 6
+        assert [doc[i].get_text().strip() for i in range(0, 6, 2)] == [
+            "Chapter 0",
+            "Chapter 1",
+            "Chapter 2",
+        ]
+        assert len({doc[i].get_images()[0][0] for i in range(0, 6, 2)}) == 1
+    assert _count_objects(path_dst) == (1, 1)
+    # The result is reproducible.
+    data = path_dst.read_bytes()
+    cat_pdf(paths_src, path_dst, True, dedup)
+    assert path_dst.read_bytes() == data
+
+
+def test_cat_pdf_dedup_size(path_tmp: Path):
+    paths_src = _make_chapters(path_tmp, 5)
+    cat_pdf(paths_src, path_tmp / "plain.pdf", False)
+    cat_pdf(paths_src, path_tmp / "dedup.pdf", False, True)
+    # Duplicates not handled by share_objects are still merged when saving.
+    with fitz.open(path_tmp / "dedup.pdf") as doc:
+        xrefs = range(1, doc.xref_length())
+        assert sum(doc.xref_get_key(xref, "Subtype")[1] == "/Form" for xref in xrefs) == 2
+    assert (path_tmp / "dedup.pdf").size <= (path_tmp / "plain.pdf").size
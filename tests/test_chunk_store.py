@@ -0,0 +1,135 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Unit tests for stepup.reprep.chunk_store."""
+
+import contextlib
+import io
+import random
+
+import pytest
+from path import Path
+
+from stepup.reprep.check_inventory import check_inventory
+from stepup.reprep.chunk_store import MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, ChunkStore, iter_chunks
+from stepup.reprep.make_inventory import write_inventory
+from stepup.reprep.zip_inventory import zip_inventory
+
+
+class SmallReads(io.BytesIO):
+    def read(self, size=-1):
+        return super().read(min(size, 123457))
+
+
+def test_iter_chunks():
+    data = random.Random(1).randbytes(10_000_000)
+    chunks = list(iter_chunks(io.BytesIO(data)))
+    assert b"".join(chunks) == data
+    assert all(MIN_CHUNK_SIZE <= len(chunk) <= MAX_CHUNK_SIZE for chunk in chunks[:-1])
+    # The boundaries do not depend on how the file is read.
+    assert list(iter_chunks(SmallReads(data))) == chunks
+    # An insertion only changes the chunk in which it occurs.
+    other = list(iter_chunks(io.BytesIO(data[:5000000] + b"insertion" + data[5000000:])))
+    assert len(set(chunks) - set(other)) == 1
+    # No boundaries in low-entropy data, except the maximum chunk size.
+    assert [len(chunk) for chunk in iter_chunks(io.BytesIO(bytes(9000000)))] == [
+        MAX_CHUNK_SIZE,
+        MAX_CHUNK_SIZE,
+        9000000 - 2 * MAX_CHUNK_SIZE,
+    ]
+    assert list(iter_chunks(io.BytesIO(b""))) == []
+
+
+def _make_version(data: bytes):
+    Path("data").makedirs_p()
+    Path("data/big.bin").write_bytes(data)
+    Path("data/small.txt").write_text("Small file\n")
+    Path("run.sh").write_text("#!/usr/bin/env bash\n")
+    Path("run.sh").chmod(0o755)
+    Path("link.txt").remove_p()
+    Path("link.txt").symlink_to("data/small.txt")
+    write_inventory(
+        "inventory.txt", ["data/big.bin", "data/small.txt", "link.txt", "run.sh"], do_amend=False
+    )
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_chunk_store(path_tmp, jobs):
+    store = ChunkStore(path_tmp / "store")
+    data = random.Random(2).randbytes(6_000_000)
+    with contextlib.chdir(path_tmp):
+        _make_version(data)
+        zip_inventory("inventory.txt", "v1.zip")
+        zip_inventory("inventory.txt", "v1-auto.zip", compression="auto")
+        stats1 = store.add_version("inventory.txt", "v1", jobs)
+        assert stats1.nfile == 4
+        assert stats1.nchunk_new == stats1.nchunk
+        with pytest.raises(ValueError):
+            store.add_version("inventory.txt", "v1", jobs)
+        _make_version(data[:3000000] + b"changed" + data[3000000:])
+        zip_inventory("inventory.txt", "v2.zip")
+        stats2 = store.add_version("inventory.txt", "v2", jobs)
+        assert stats2.nchunk == stats1.nchunk
+        assert stats2.nchunk_new == 1
+        assert stats2.size_new < stats2.size // 2
+        assert store.list_versions() == ["v1", "v2"]
+        # Reconstructed ZIP files are identical to those of zip_inventory.
+        store.write_zip("v1", "v1-store.zip")
+        store.write_zip("v1", "v1-auto-store.zip", compression="auto")
+        store.write_zip("v2", "v2-store.zip")
+        assert Path("v1-store.zip").read_bytes() == Path("v1.zip").read_bytes()
+        assert Path("v1-auto-store.zip").read_bytes() == Path("v1-auto.zip").read_bytes()
+        assert Path("v2-store.zip").read_bytes() == Path("v2.zip").read_bytes()
+        # Restore files.
+        store.restore("v1", "restored")
+        check_inventory("restored/inventory.txt")
+        assert Path("restored/data/big.bin").read_bytes() == data
+        assert Path("restored/link.txt").readlink() == "data/small.txt"
+        with pytest.raises(ValueError):
+            store.restore("v3", "restored")
+
+
+def test_chunk_store_corrupt(path_tmp):
+    store = ChunkStore(path_tmp / "store")
+    with contextlib.chdir(path_tmp):
+        _make_version(b"Some data\n")
+        Path("run.sh").write_text("#!/bin/sh\n")
+        with pytest.raises(ValueError):
+            store.add_version("inventory.txt", "v1")
+        assert store.list_versions() == []
+        _make_version(b"Some data\n")
+        store.add_version("inventory.txt", "v1")
+        for path_chunk in Path("store/chunks").walkfiles():
+            path_chunk.write_bytes(b"corrupt")
+        with pytest.raises(ValueError):
+            store.write_zip("v1", "v1.zip")
+        assert not Path("v1.zip").exists()
+
+
+def test_chunk_store_restore_symlink_dest(path_tmp):
+    store = ChunkStore(path_tmp / "store")
+    with contextlib.chdir(path_tmp):
+        _make_version(b"Some data\n")
+        store.add_version("inventory.txt", "v1")
+        Path("outside").mkdir()
+        Path("restored").mkdir()
+        Path("restored/data").symlink_to("../outside")
+        with pytest.raises(ValueError):
+            store.restore("v1", "restored")
+        assert list(Path("outside").iterdir()) == []
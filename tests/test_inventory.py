@@ -20,15 +20,46 @@
 """Unit tests for inventory files."""
 
 import contextlib
+import hashlib
+import json
 import os
+import sqlite3
+import subprocess
 
+import attrs
 import pytest
 from path import Path
 
+from stepup.core.hash import FileHash
+from stepup.reprep import make_inventory as make_inventory_module
+from stepup.reprep.check_inventory import audit_inventory, check_inventory, iter_inventory
 from stepup.reprep.check_inventory import main as check_main
-from stepup.reprep.inventory import get_summary
+from stepup.reprep.diff_inventory import (
+    InventoryChange,
+    diff_indexes,
+    diff_inventories,
+    diff_inventory,
+)
+from stepup.reprep.diff_inventory import main as diff_main
+from stepup.reprep.inventory import (
+    DigestCache,
+    FileSummary,
+    check_dest_paths,
+    compute_file_digests,
+    compute_tree_digests,
+    get_summary,
+    iter_ordered,
+    parse_digest_sums,
+    parse_summary,
+)
+from stepup.reprep.inventory_index import (
+    InventoryIndex,
+    load_inventory_index,
+    write_inventory_index,
+)
+from stepup.reprep.make_inventory import FileLister, parse_inventory_def, write_inventory
 from stepup.reprep.make_inventory import main as make_main
-from stepup.reprep.make_inventory import parse_inventory_def
+from stepup.reprep.sync_inventory import sync_inventory
 from stepup.reprep.zip_inventory import main as zip_main
 
 
@@ -74,6 +105,434 @@ SYMLINK_INVENTORY = """\
 """
 
 
+def test_jobs(path_tmp):
+    with contextlib.chdir(path_tmp):
+        names = [f"file{i:03d}.txt" for i in range(50)]
+        for i, name in enumerate(names):
+            with open(name, "w") as fh:
+                fh.write("x" * i)
+        Path("link.txt").symlink_to("file001.txt")
+        make_main(["-o", "inventory1.txt", *names, "link.txt"])
+        make_main(["-o", "inventory4.txt", "-j", "4", *names, "link.txt"])
+        with open("inventory1.txt") as fh1, open("inventory4.txt") as fh4:
+            assert fh1.read() == fh4.read()
+        check_main(["inventory4.txt"])
+
+
+def test_cache(path_tmp):
+    with contextlib.chdir(path_tmp):
+        with open("a.txt", "w") as fh:
+            print("aaa", file=fh)
+        with open("b.txt", "w") as fh:
+            print("bbb", file=fh)
+        # Avoid racy timestamps, which are not cached.
+        os.utime("a.txt", ns=(10**18, 10**18))
+        make_main(["-o", "inventory.txt", "a.txt", "b.txt"])
+        assert not Path("inventory-cache.sqlite").exists()
+        make_main(["-o", "inventory.txt", "a.txt", "b.txt", "--cache"])
+        assert Path("inventory-cache.sqlite").is_file()
+        with open("inventory.txt") as fh:
+            assert fh.read() == BASIC_INVENTORY
+        # Change the contents without changing the stat properties.
+        with open("a.txt", "r+") as fh:
+            fh.write("ccc")
+        os.utime("a.txt", ns=(10**18, 10**18))
+        make_main(["-o", "inventory.txt", "a.txt", "b.txt", "-c"])
+        with open("inventory.txt") as fh:
+            assert fh.read() == BASIC_INVENTORY
+        make_main(["-o", "inventory.txt", "a.txt", "b.txt"])
+        with open("inventory.txt") as fh:
+            assert fh.read() != BASIC_INVENTORY
+        check_main(["inventory.txt"])
+
+
+def test_cache_corrupt(path_tmp):
+    with contextlib.chdir(path_tmp):
+        with open("a.txt", "w") as fh:
+            print("aaa", file=fh)
+        with open("inventory-cache.sqlite", "w") as fh:
+            print("not a database", file=fh)
+        cache = DigestCache.load("inventory-cache.sqlite")
+        assert cache.lookup("a.txt", os.stat("a.txt")) is None
+
+
+def _make_graph_db(path_graph_db, hashes):
+    """Create a minimal StepUp graph.db with the given file hashes."""
+    path_graph_db.parent.makedirs_p()
+    con = sqlite3.connect(path_graph_db)
+    con.execute("CREATE TABLE node (i INTEGER PRIMARY KEY, label TEXT)")
+    con.execute("CREATE TABLE file (node INTEGER PRIMARY KEY, state INTEGER, hash TEXT)")
+    for i, (label, file_hash) in enumerate(hashes.items()):
+        con.execute("INSERT INTO node VALUES (?, ?)", (i, label))
+        con.execute("INSERT INTO file VALUES (?, ?, ?)", (i, 0, file_hash.to_json()))
+    con.commit()
+    con.close()
+
+
+def test_graph_db(path_tmp):
+    with contextlib.chdir(path_tmp):
+        with open("a.txt", "w") as fh:
+            print("aaa", file=fh)
+        with open("b.txt", "w") as fh:
+            print("bbb", file=fh)
+        st_a = os.stat("a.txt")
+        st_b = os.stat("b.txt")
+        fake_digest = bytes(32)
+        _make_graph_db(
+            Path(".stepup/graph.db"),
+            {
+                # Matching stat properties: the (fake) digest is reused.
+                "a.txt": FileHash(fake_digest, st_a.st_mode, 4, st_a.st_mtime, st_a.st_ino),
+                # Different modification time: the digest is recomputed.
+                "b.txt": FileHash(fake_digest, st_b.st_mode, 4, st_b.st_mtime - 1, st_b.st_ino),
+            },
+        )
+        make_main(["-o", "inventory.txt", "a.txt", "b.txt", "-g", ".stepup/graph.db"])
+        lines = Path("inventory.txt").read_text().splitlines()
+        assert parse_summary(lines[0]).digest == fake_digest
+        assert lines[1] == BASIC_INVENTORY.splitlines()[1]
+        check_main(["inventory.txt", "-g", ".stepup/graph.db"])
+        with pytest.raises(ValueError):
+            check_main(["inventory.txt"])
+
+
+def test_audit(path_tmp):
+    with contextlib.chdir(path_tmp):
+        for name in "abcd":
+            with open(f"{name}.txt", "w") as fh:
+                print(name * 3, file=fh)
+        make_main(["-o", "inventory.txt", "a.txt", "b.txt", "c.txt", "d.txt"])
+        check_main(["inventory.txt", "--json", "report.json", "-j", "2"])
+        with open("report.json") as fh:
+            assert json.load(fh)["issues"] == []
+        with open("a.txt", "w") as fh:
+            print("AAA", file=fh)
+        Path("b.txt").remove()
+        Path("c.txt").chmod(0o600)
+        with open("d.txt", "w") as fh:
+            print("dddd", file=fh)
+        with pytest.raises(ValueError):
+            check_main(["inventory.txt"])
+        with pytest.raises(SystemExit):
+            check_main(["inventory.txt", "--json", "report.json", "-j", "2"])
+        with open("report.json") as fh:
+            issues = json.load(fh)["issues"]
+        assert [(issue["path"], issue["kind"]) for issue in issues] == [
+            ("a.txt", "digest"),
+            ("b.txt", "missing"),
+            ("c.txt", "mode"),
+            ("d.txt", "size"),
+            ("d.txt", "digest"),
+        ]
+        assert issues[2]["expected"] == "-rw-r--r--"
+        assert issues[2]["actual"] == "-rw-------"
+        issues = audit_inventory("inventory.txt", stat_only=True)
+        assert [(issue.path, issue.kind) for issue in issues] == [
+            ("b.txt", "missing"),
+            ("c.txt", "mode"),
+            ("d.txt", "size"),
+        ]
+
+
+@pytest.mark.parametrize("stat_only", [False, True])
+def test_audit_type(path_tmp, stat_only):
+    with contextlib.chdir(path_tmp):
+        Path("sub").mkdir()
+        Path("a.txt").write_text("aaa\n")
+        Path("sub/b.txt").write_text("bbb\n")
+        make_main(["-o", "inventory.txt", "a.txt", "sub/b.txt"])
+        # Replace a file by a directory and a parent directory by a file.
+        Path("a.txt").remove()
+        Path("a.txt").mkdir()
+        Path("sub/b.txt").remove()
+        Path("sub").rmdir()
+        Path("sub").write_text("sub\n")
+        issues = audit_inventory("inventory.txt", stat_only=stat_only)
+        assert [(issue.path, issue.kind) for issue in issues] == [
+            ("a.txt", "type"),
+            ("sub/b.txt", "missing"),
+        ]
+        assert issues[0].expected == "-rw-r--r--"
+        assert issues[0].actual.startswith("d")
+        with pytest.raises(SystemExit):
+            check_main(["inventory.txt", "-k"])
+
+
+def test_stat_only(path_tmp):
+    with contextlib.chdir(path_tmp):
+        with open("a.txt", "w") as fh:
+            print("aaa", file=fh)
+        make_main(["-o", "inventory.txt", "a.txt"])
+        with open("a.txt", "w") as fh:
+            print("AAA", file=fh)
+        check_main(["inventory.txt", "--stat-only"])
+        with pytest.raises(ValueError):
+            check_main(["inventory.txt"])
+
+
+def test_index(path_tmp):
+    with contextlib.chdir(path_tmp):
+        names = [f"f{i:03d}.txt" for i in range(100)]
+        for name in names:
+            Path(name).write_text(name)
+        Path("link.txt").symlink_to("f000.txt")
+        make_main(["-o", "inventory.txt", "--index", "link.txt", *names])
+        refs = list(iter_inventory("inventory.txt"))
+        with load_inventory_index("inventory.txt") as index:
+            assert len(index) == 101
+            assert list(index) == sorted(refs, key=lambda ref: ref.path)
+            for ref in refs:
+                assert ref.path in index
+                assert index.get(ref.path) == ref
+            assert index.get("link.txt").size is None
+            assert "f100.txt" not in index
+            assert "a.txt" not in index
+            assert "z.txt" not in index
+        # A stale index is ignored.
+        with open("inventory.txt", "a") as fh:
+            fh.write("\n")
+        assert load_inventory_index("inventory.txt") is None
+        Path("empty.idx").write_bytes(b"")
+        with pytest.raises(ValueError):
+            InventoryIndex.load("empty.idx")
+
+
+def test_extra_digests(path_tmp):
+    with contextlib.chdir(path_tmp):
+        data = os.urandom(300000)
+        Path("data.bin").write_bytes(data)
+        Path("link.bin").symlink_to("data.bin")
+        digests = compute_file_digests("data.bin", ["sha256", "md5", "blake2b"])
+        assert digests["sha256"] == hashlib.sha256(data).digest()
+        assert digests["md5"] == hashlib.md5(data).digest()
+        assert digests["blake2b"] == hashlib.blake2b(data).digest()
+        assert compute_file_digests("link.bin", ["md5"])["md5"] == hashlib.md5(b"data.bin").digest()
+        assert compute_file_digests("link.bin", ["md5"], follow_symlinks=True) == {
+            "md5": hashlib.md5(data).digest()
+        }
+        summary = get_summary("data.bin", ".", extra_digests=["md5"])
+        assert summary == get_summary("data.bin", ".")
+        assert summary.extra_digests == {"md5": hashlib.md5(data).digest()}
+        make_main(["-o", "other.txt", "data.bin", "link.bin"])
+        args = ["-o", "inventory.txt", "-d", "md5", "-d", "sha1"]
+        make_main([*args, "data.bin", "link.bin"])
+        assert Path("inventory.txt").read_text() == Path("other.txt").read_text()
+        # The companion files are never included in the inventory.
+        make_main([*args, "data.bin", "link.bin", "inventory.md5"])
+        with pytest.raises(ValueError):
+            make_main(["-o", "wrong.txt", "-d", "shake_128", "data.bin"])
+        assert Path("inventory.txt").read_text() == Path("other.txt").read_text()
+        assert parse_digest_sums(Path("inventory.md5").read_text()) == {
+            "data.bin": hashlib.md5(data).digest()
+        }
+        assert Path("inventory.sha1").read_text() == f"{hashlib.sha1(data).hexdigest()}  data.bin\n"
+
+
+@pytest.mark.parametrize("cache", [False, True])
+@pytest.mark.parametrize("method", ["copy", "reflink", "hardlink"])
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_sync_inventory(path_tmp, method, jobs, cache):
+    with contextlib.chdir(path_tmp):
+        Path("src/sub").makedirs()
+        Path("src/sub/a.txt").write_text("Aaa" * 1000)
+        Path("src/b.bin").write_bytes(os.urandom(300000))
+        Path("src/c.sh").write_text("#!/usr/bin/env bash\n")
+        Path("src/c.sh").chmod(0o755)
+        Path("src/link.txt").symlink_to("sub/a.txt")
+        paths = ["b.bin", "c.sh", "link.txt", "sub/a.txt"]
+        make_main(["-o", "src/inventory.txt", *(f"src/{path}" for path in paths)])
+        assert sync_inventory("src/inventory.txt", "dst", jobs, method, cache) == [
+            *paths,
+            "inventory.txt",
+        ]
+        check_inventory("dst/inventory.txt")
+        assert Path("dst/inventory-cache.sqlite").exists() == cache
+        assert Path("dst/link.txt").readlink() == "sub/a.txt"
+        assert Path("dst/c.sh").stat().st_mode & 0o777 == 0o755
+        is_linked = Path("dst/b.bin").stat().st_ino == Path("src/b.bin").stat().st_ino
+        assert is_linked == (method == "hardlink")
+        assert sync_inventory("src/inventory.txt", "dst", jobs, method, cache) == []
+        # Only files that differ are copied again.
+        Path("dst/sub/a.txt").remove()
+        Path("dst/sub/a.txt").write_text("Bbb" * 1000)
+        # Replace instead of chmod, which would also affect the source of a hard link.
+        Path("dst/c.sh").remove()
+        Path("dst/c.sh").write_text("#!/usr/bin/env bash\n")
+        assert sync_inventory("src/inventory.txt", "dst", jobs, method, cache) == [
+            "c.sh",
+            "sub/a.txt",
+        ]
+        check_inventory("dst/inventory.txt")
+        # A source that does not match the inventory is not copied.
+        Path("src/sub/a.txt").write_text("Ccc" * 1000)
+        Path("dst/sub/a.txt").remove()
+        with pytest.raises(ValueError):
+            sync_inventory("src/inventory.txt", "dst", jobs, method, cache)
+        assert not Path("dst/sub/a.txt").exists()
+        assert list(Path("dst/sub").iterdir()) == []
+
+
+@pytest.mark.parametrize("method", ["copy", "reflink", "hardlink"])
+def test_sync_inventory_mode(path_tmp, method):
+    with contextlib.chdir(path_tmp):
+        Path("src").mkdir()
+        Path("src/c.sh").write_text("#!/usr/bin/env bash\n")
+        Path("src/c.sh").chmod(0o755)
+        make_main(["-o", "src/inventory.txt", "src/c.sh"])
+        # The source has a different mode than in the inventory.
+        Path("src/c.sh").chmod(0o644)
+        assert sync_inventory("src/inventory.txt", "dst", 1, method) == ["c.sh", "inventory.txt"]
+        check_inventory("dst/inventory.txt")
+        assert Path("dst/c.sh").stat().st_ino != Path("src/c.sh").stat().st_ino
+        assert Path("dst/c.sh").stat().st_mode & 0o777 == 0o755
+        assert Path("src/c.sh").stat().st_mode & 0o777 == 0o644
+
+
+def test_sync_inventory_symlink_dest(path_tmp):
+    with contextlib.chdir(path_tmp):
+        Path("src/sub").makedirs()
+        Path("src/sub/a.txt").write_text("Aaa" * 1000)
+        make_main(["-o", "src/inventory.txt", "src/sub/a.txt"])
+        Path("outside").mkdir()
+        Path("dst").mkdir()
+        Path("dst/sub").symlink_to("../outside")
+        with pytest.raises(ValueError):
+            sync_inventory("src/inventory.txt", "dst")
+        assert list(Path("outside").iterdir()) == []
+
+
+def test_check_dest_paths():
+    check_dest_paths([FileSummary(None, "lrwxrwxrwx", bytes(32), "a"), _summary("ab/c")])
+    for path in ["/a", "../a", "a/../b", "a//b", "./a"]:
+        with pytest.raises(ValueError):
+            check_dest_paths([_summary(path)])
+    with pytest.raises(ValueError):
+        check_dest_paths([FileSummary(None, "lrwxrwxrwx", bytes(32), "a"), _summary("a/b/c")])
+
+
+def _summary(path):
+    return FileSummary(1, "-rw-r--r--", bytes(32), path)
+
+
+def test_diff_inventory(path_tmp):
+    with contextlib.chdir(path_tmp):
+        for name in "abcdef":
+            Path(f"{name}.txt").write_text(name * 10)
+        make_main(["-o", "old.txt", *(f"{name}.txt" for name in "abcdef")])
+        Path("b.txt").write_text("modified")
+        Path("c.txt").chmod(0o755)
+        Path("d.txt").move("g.txt")
+        Path("e.txt").remove()
+        Path("h.txt").write_text("new")
+        make_main(["-o", "new.txt", *(f"{name}.txt" for name in "abcfgh")])
+        assert diff_inventory("old.txt", "new.txt") == [
+            InventoryChange("b.txt", "modified"),
+            InventoryChange("c.txt", "mode", None, "-rw-r--r--", "-rwxr-xr-x"),
+            InventoryChange("e.txt", "removed"),
+            InventoryChange("g.txt", "renamed", "d.txt"),
+            InventoryChange("h.txt", "added"),
+        ]
+        assert [change.kind for change in diff_inventory("old.txt", "new.txt", False)] == [
+            "modified",
+            "mode",
+            "removed",
+            "removed",
+            "added",
+            "added",
+        ]
+        assert diff_inventory("new.txt", "new.txt") == []
+        diff_main(["old.txt", "new.txt", "--json", "report.json"])
+        with open("report.json") as fh:
+            report = json.load(fh)
+        assert report["changes"][3] == {
+            "path": "g.txt",
+            "kind": "renamed",
+            "old_path": "d.txt",
+            "old_mode": None,
+            "new_mode": None,
+        }
+
+
+def test_tree_digests():
+    def fs(path, digest=b"a" * 32, mode="-rw-r--r--"):
+        return FileSummary(1, mode, digest, path)
+
+    digests1 = compute_tree_digests([fs("a/b/c.txt"), fs("a/d.txt"), fs("e/b/c.txt"), fs("f")])
+    assert set(digests1) == {"", "a", "a/b", "e", "e/b"}
+    assert digests1["a/b"] == digests1["e/b"]
+    assert digests1["a"] != digests1["e"]
+    digests2 = compute_tree_digests([fs("a/b/c.txt", b"b" * 32), fs("a/d.txt"), fs("e/b/c.txt")])
+    assert digests2["a/b"] != digests1["a/b"]
+    assert digests2["a"] != digests1["a"]
+    assert digests2["e"] == digests1["e"]
+    assert digests2[""] != digests1[""]
+    digests3 = compute_tree_digests([fs("a/b/c.txt", mode="-rwxr-xr-x")])
+    assert digests3["a/b"] != digests1["a/b"]
+    assert compute_tree_digests([]) == {"": compute_tree_digests([])[""]}
+
+
+def test_diff_indexes(path_tmp):
+    def make(path_txt, summaries):
+        with open(path_txt, "w") as fh:
+            for summary in summaries:
+                print(summary.path, file=fh)
+        write_inventory_index(path_txt[:-4] + ".idx", summaries, path_txt)
+        return InventoryIndex.load(path_txt[:-4] + ".idx")
+
+    olds = []
+    for i in range(500):
+        digest = i.to_bytes(32, "little")
+        olds.append(FileSummary(i, "-rw-r--r--", digest, f"d{i % 7}/s{i % 11}/f{i:03d}"))
+    olds.append(FileSummary(None, "lrwxrwxrwx", b"l" * 32, "d0.link"))
+    olds.sort(key=lambda fs: fs.path)
+    news = [attrs.evolve(fs) for fs in olds]
+    news[10].digest = b"x" * 32
+    news[200].mode = "-rwxr-xr-x"
+    news[300].path = news[300].path.replace("f", "g")
+    news.append(FileSummary(5, "-rw-r--r--", b"n" * 32, "d9/new"))
+    del news[400]
+    news.sort(key=lambda fs: fs.path)
+    with (
+        contextlib.chdir(path_tmp),
+        make("old.txt", olds) as old_index,
+        make("new.txt", news) as new_index,
+    ):
+        expected = diff_inventories(olds, news)
+        assert [change.kind for change in expected] == [
+            "modified",
+            "mode",
+            "renamed",
+            "removed",
+            "added",
+        ]
+        assert diff_indexes(old_index, new_index) == expected
+        assert diff_indexes(old_index, new_index, False) == diff_inventories(olds, news, False)
+        assert diff_indexes(old_index, old_index) == []
+        assert diff_indexes(new_index, old_index) == diff_inventories(news, olds)
+
+
+def test_iter_ordered():
+    assert list(iter_ordered(lambda x: x * x, range(100), 3)) == [x * x for x in range(100)]
+    # The total weight of the pending items is bounded, but heavy items are still processed.
+    weights = [5, 1, 1, 20, 2, 2, 2, 0, 3]
+    pending = set()
+
+    def weigh(x):
+        pending.add(x)
+        return weights[x]
+
+    results = []
+    for x in iter_ordered(lambda x: x, range(len(weights)), 3, weigh, 6):
+        # The last weighed item waits to be submitted until the result is consumed.
+        submitted = pending - {max(pending)}
+        assert sum(weights[y] for y in submitted) <= max(6, weights[x])
+        pending.remove(x)
+        results.append(x)
+    assert results == list(range(len(weights)))
+    with pytest.raises(ValueError):
+        list(iter_ordered(lambda x: x, [1], 0))
+
+
 def test_symbolic_link(path_tmp):
     with contextlib.chdir(path_tmp):
         with open("dest.txt", "w") as fh:
@@ -90,6 +549,57 @@ def test_directory(path_tmp):
         make_main(["-o", path_tmp / "inventory.txt", path_tmp])
 
 
+def test_directory_no_amend(path_tmp):
+    with contextlib.chdir(path_tmp):
+        Path("sub").mkdir()
+        Path("link").symlink_to("sub")
+        Path("a.txt").write_text("aaa\n")
+        for path in "sub", "link":
+            with pytest.raises(ValueError):
+                write_inventory("inventory.txt", ["a.txt", path], do_amend=False)
+        assert not Path("inventory.txt").exists()
+
+
+def test_amend_chunks(path_tmp, monkeypatch):
+    calls = []
+
+    def fake_amend(**kwargs):
+        calls.append(kwargs)
+        assert not Path("inventory.txt").exists()
+
+    monkeypatch.setattr(make_inventory_module, "AMEND_CHUNK_SIZE", 3)
+    monkeypatch.setattr(make_inventory_module, "amend", fake_amend)
+    with contextlib.chdir(path_tmp):
+        paths = [f"f{i}.txt" for i in range(7)]
+        for path in paths:
+            Path(path).write_text(path)
+        write_inventory("inventory.txt", paths, path_index="inventory.idx")
+        assert len(Path("inventory.txt").read_text().splitlines()) == 7
+    assert calls == [
+        {"out": ["inventory.idx"], "vol": []},
+        {"inp": paths[:3]},
+        {"inp": paths[3:6]},
+        {"inp": paths[6:]},
+    ]
+
+
+def test_known_files(path_tmp, monkeypatch):
+    calls = []
+    monkeypatch.setattr(make_inventory_module, "amend", lambda **kwargs: calls.append(kwargs))
+    with contextlib.chdir(path_tmp):
+        Path("sub").mkdir()
+        Path("a.txt").write_text("aaa\n")
+        with pytest.raises(ValueError):
+            write_inventory("inventory.txt", ["a.txt", "sub"])
+        assert calls == [{"out": [], "vol": []}]
+        # Known files are not checked before amending, but directories are still rejected
+        # when they are summarized, without leaving a partial inventory file behind.
+        with pytest.raises(ValueError):
+            write_inventory("inventory.txt", ["a.txt", "sub"], known_files=["sub"])
+        assert calls[-1] == {"inp": ["a.txt", "sub"]}
+        assert sorted(os.listdir()) == ["a.txt", "sub"]
+
+
 def test_symbolic_link_directory(path_tmp):
     path_sub = path_tmp / "sub"
     path_sub.mkdir()
@@ -99,6 +609,119 @@ def test_symbolic_link_directory(path_tmp):
             make_main(["-o", "inventory.txt", "link"])
 
 
+def test_parse_inventory_def(path_tmp):
+    with contextlib.chdir(path_tmp):
+        for path in [
+            "a.txt",
+            "b.md",
+            ".hidden/c.txt",
+            "sub/d.txt",
+            "sub/e.md",
+            "sub/deep/f.txt",
+            "sub/deep/deeper/g.txt",
+            "other/h.txt",
+        ]:
+            path = Path(path)
+            if path.parent != "":
+                path.parent.makedirs_p()
+            path.write_text(path)
+        Path("link").symlink_to("sub/deep")
+        lines = [
+            "# comment\n",
+            "include *.txt other/*\n",
+            "include sub/**\n",
+            "exclude sub/*/*.txt other/h.txt\n",
+            "include .hidden/*.txt\n",
+            "include ${*name}/d.txt\n",
+            "include link/*.txt\n",
+        ]
+        assert parse_inventory_def(lines) == {
+            ".hidden/c.txt",
+            "a.txt",
+            "link/f.txt",
+            "sub/d.txt",
+            "sub/e.md",
+            "sub/deep/deeper/g.txt",
+        }
+        with pytest.raises(ValueError):
+            parse_inventory_def(["include *.pdf\n"])
+        with pytest.raises(ValueError):
+            parse_inventory_def(["include\n"])
+
+
+def test_file_lister_plan(path_tmp):
+    with contextlib.chdir(path_tmp):
+        Path("README.md").write_text("readme")
+        for path in ["data/a/b.txt", ".git/objects/x", "docs/sub/c.md"]:
+            Path(path).parent.makedirs_p()
+            Path(path).write_text(path)
+        lister = FileLister()
+        commands = [
+            (0, "include", "", ["*.md", "data/**"]),
+            (1, "include", "", ["docs/*.md", "docs/sub/*.md"]),
+            (2, "exclude", "", ["*/*/*.txt"]),
+        ]
+        # A shallow pattern in the root does not turn data/** into a walk of the whole tree.
+        assert lister.plan(commands) == {"": 3, "data/": None}
+        assert lister.glob(["*.md", "data/**"]) == {"README.md", "data/a/b.txt"}
+        assert lister.glob(["docs/*.md", "docs/sub/*.md"]) == {"docs/sub/c.md"}
+        # Patterns that were not planned are walked separately.
+        assert lister.glob(["**/x"]) == {".git/objects/x"}
+
+
+def test_include_tree(path_tmp):
+    with contextlib.chdir(path_tmp):
+        for path in [
+            "data/a.txt",
+            "data/.git/config",
+            "data/run/b.dat",
+            "data/run/__pycache__/c.pyc",
+            "data/run/d.pyc",
+            "other/e.txt",
+        ]:
+            Path(path).parent.makedirs_p()
+            Path(path).write_text(path)
+        Path("data/link.txt").symlink_to("a.txt")
+        Path("data/linkdir").symlink_to("../other")
+        stats = {}
+        paths = parse_inventory_def(
+            ["include-tree data .git __pycache__\n", "exclude-tree data/run *.pyc\n"], stats=stats
+        )
+        assert paths == {"data/a.txt", "data/link.txt", "data/run/d.pyc"}
+        assert set(stats) == paths
+        assert stats["data/a.txt"].st_size == 10
+        assert parse_inventory_def(["include-tree . *.pyc .git\n"]) == {
+            "data/a.txt",
+            "data/link.txt",
+            "data/run/b.dat",
+            "other/e.txt",
+        }
+        with pytest.raises(ValueError):
+            parse_inventory_def(["include-tree\n"])
+        with pytest.raises(ValueError):
+            parse_inventory_def(["include-tree data/a.txt\n"])
+        Path("inventory.def").write_text("include-tree data .git run\n")
+        make_main(["-i", "inventory.def"])
+        make_main(["-o", "reference.txt", "data/a.txt", "data/link.txt"])
+        assert Path("inventory.txt").read_text() == Path("reference.txt").read_text()
+
+
+def test_include_tree_unreadable(path_tmp, monkeypatch):
+    scandir = os.scandir
+
+    def fake_scandir(path):
+        if path == "data/run/":
+            raise PermissionError(13, "Permission denied", path)
+        return scandir(path)
+
+    with contextlib.chdir(path_tmp):
+        Path("data/run").makedirs()
+        Path("data/a.txt").write_text("a")
+        monkeypatch.setattr(make_inventory_module.os, "scandir", fake_scandir)
+        with pytest.raises(ValueError, match="data/run/"):
+            parse_inventory_def(["include-tree data\n"])
+
+
 def test_git1():
     with contextlib.chdir("tests/examples/check_hrefs_md"):
         paths = parse_inventory_def(["include-git\n"])
@@ -147,3 +770,11 @@ def test_zip_inventory(path_tmp):
         os.system("unzip archive.zip")
         check_main(["inventory1.txt"])
         check_main(["inventory2.txt"])
+
+
+def test_git_pathspec_glob():
+    pathspec = "tests/examples/check_hrefs_md/*.txt"
+    paths = parse_inventory_def([f"include-git '{pathspec}'\n"])
+    cp = subprocess.run(["git", "ls-files", pathspec], capture_output=True, text=True, check=True)
+    assert paths == set(cp.stdout.split())
+    assert len(paths) == 3
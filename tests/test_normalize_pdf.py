@@ -0,0 +1,62 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Unit tests for stepup.reprep.normalize_pdf."""
+
+import fitz
+import pytest
+from path import Path
+
+from stepup.reprep.normalize_pdf import SAVE_PROFILES, normalize_document, save_document
+
+
+def _make_document() -> fitz.Document:
+    doc = fitz.open()
+    for ipage in range(3):
+        page = doc.new_page()
+        page.insert_font(fontname="F0", fontbuffer=fitz.Font("cour").buffer)
+        page.insert_text((50, 50), f"Page {ipage}", fontname="F0")
+    normalize_document(doc)
+    return doc
+
+
+@pytest.mark.parametrize("profile", SAVE_PROFILES)
+def test_save_document(path_tmp: Path, profile: str):
+    for name in "out1.pdf", "out2.pdf":
+        with _make_document() as doc:
+            save_document(doc, path_tmp / name, profile)
+    assert (path_tmp / "out1.pdf").read_bytes() == (path_tmp / "out2.pdf").read_bytes()
+    with fitz.open(path_tmp / "out1.pdf") as doc:
+        assert [page.get_text().strip() for page in doc] == ["Page 0", "Page 1", "Page 2"]
+        assert doc.metadata["producer"] == ""
+
+
+def test_save_document_sizes(path_tmp: Path):
+    sizes = {}
+    for profile in SAVE_PROFILES:
+        with _make_document() as doc:
+            save_document(doc, path_tmp / f"{profile}.pdf", profile)
+        sizes[profile] = (path_tmp / f"{profile}.pdf").size
+    # The same font is inserted on each page, which is only merged with garbage=4.
+    assert sizes["fast"] > sizes["default"] >= sizes["compact"]
+
+
+def test_save_document_unknown(path_tmp: Path):
+    with _make_document() as doc, pytest.raises(ValueError):
+        save_document(doc, path_tmp / "out.pdf", "foo")
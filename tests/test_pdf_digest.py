@@ -0,0 +1,58 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Unit tests for stepup.reprep.pdf_digest."""
+
+import fitz
+
+from stepup.reprep.pdf_digest import compute_object_digest
+
+
+def _make_cycle(doc: fitz.Document, value1: int, value2: int) -> tuple[int, int]:
+    """Create two objects that refer to each other."""
+    xref1 = doc.get_new_xref()
+    xref2 = doc.get_new_xref()
+    doc.update_object(xref1, f"<< /K {xref2} 0 R /V {value1} >>")
+    doc.update_object(xref2, f"<< /K {xref1} 0 R /V {value2} >>")
+    return xref1, xref2
+
+
+def test_cycles():
+    doc = fitz.open()
+    x1, y1 = _make_cycle(doc, 1, 2)
+    x2, y2 = _make_cycle(doc, 3, 2)
+    x3, y3 = _make_cycle(doc, 1, 2)
+    memo = {}
+    compute_object_digest(doc, x1, memo)
+    compute_object_digest(doc, x2, memo)
+    # The second objects have the same source, but they are part of different cycles.
+    assert compute_object_digest(doc, y1, memo) != compute_object_digest(doc, y2, memo)
+    # Digests do not depend on the object where the traversal started or on the memo.
+    assert compute_object_digest(doc, y1, memo) == compute_object_digest(doc, y3, {})
+    assert compute_object_digest(doc, x1, {}) == compute_object_digest(doc, x3, memo)
+    assert compute_object_digest(doc, x1, memo) != compute_object_digest(doc, x2, memo)
+
+
+def test_leaves():
+    doc = fitz.open()
+    x1, y1 = _make_cycle(doc, 1, 2)
+    x2, y2 = _make_cycle(doc, 3, 2)
+    leaves = {x1: b"first", x2: b"first"}
+    assert compute_object_digest(doc, y1, {}, leaves) == compute_object_digest(doc, y2, {}, leaves)
+    assert compute_object_digest(doc, y1, {}) != compute_object_digest(doc, y2, {})
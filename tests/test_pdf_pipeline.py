@@ -0,0 +1,114 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Unit tests for stepup.reprep.pdf_pipeline."""
+
+import contextlib
+import json
+
+import fitz
+import pytest
+from path import Path
+
+from stepup.reprep.add_notes_pdf import add_notes_pdf
+from stepup.reprep.cat_pdf import cat_pdf
+from stepup.reprep.nup_pdf import nup_pdf
+from stepup.reprep.pdf_pipeline import CatOperation, NupOperation, load_pipeline, main
+from stepup.reprep.raster_pdf import raster_pdf
+
+
+def _make_pdf(path_pdf: Path, texts: list[str]):
+    with fitz.open() as doc:
+        for text in texts:
+            doc.new_page(width=400, height=300).insert_text((50, 50), text)
+        doc.save(path_pdf)
+
+
+def _get_texts(path_pdf: Path) -> list[list[str]]:
+    with fitz.open(path_pdf) as doc:
+        return [page.get_text().split() for page in doc]
+
+
+def _get_images(path_pdf: Path) -> list[bytes]:
+    with fitz.open(path_pdf) as doc:
+        return [doc.xref_stream_raw(page.get_images()[0][0]) for page in doc]
+
+
+PIPELINE_YAML = """\
+- op: cat
+  paths: [ch1.pdf, ch2.pdf]
+  insert_blank: true
+- op: add_notes
+  notes: notes.pdf
+- op: nup
+  nrow: 1
+  ncol: 2
+  page_format: A4-L
+"""
+
+
+def test_load_pipeline(path_tmp: Path):
+    path_pipeline = path_tmp / "pipeline.yaml"
+    path_pipeline.write_text(PIPELINE_YAML)
+    operations = load_pipeline(path_pipeline)
+    assert len(operations) == 3
+    assert operations[0] == CatOperation(["ch1.pdf", "ch2.pdf"], insert_blank=True)
+    assert operations[1].inputs() == ["notes.pdf"]
+    assert operations[2] == NupOperation(1, 2, page_format="A4-L")
+    path_pipeline.write_text(json.dumps([{"op": "foo"}]))
+    with pytest.raises(ValueError):
+        load_pipeline(path_pipeline)
+
+
+def test_pdf_pipeline(path_tmp: Path):
+    with contextlib.chdir(path_tmp):
+        Path("sub").mkdir()
+        _make_pdf("sub/ch1.pdf", ["one", "two", "three"])
+        _make_pdf("sub/ch2.pdf", ["four"])
+        _make_pdf("sub/notes.pdf", ["notes"])
+        Path("sub/pipeline.yaml").write_text(PIPELINE_YAML)
+        main(["sub/pipeline.yaml", "out.pdf"])
+
+        # Compare to the result of the separate scripts.
+        cat_pdf(["sub/ch1.pdf", "sub/ch2.pdf"], "cat.pdf", True)
+        add_notes_pdf("cat.pdf", "sub/notes.pdf", "notes.pdf")
+        nup_pdf("notes.pdf", "ref.pdf", 1, 2, 10.0, "A4-L")
+        assert _get_texts("out.pdf") == _get_texts("ref.pdf")
+        assert _get_texts("out.pdf")[0] == ["one", "notes"]
+        assert len(_get_texts("out.pdf")) == 6
+
+        # The result is reproducible.
+        data = Path("out.pdf").read_bytes()
+        main(["sub/pipeline.yaml", "out.pdf"])
+        assert Path("out.pdf").read_bytes() == data
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_pdf_pipeline_raster(path_tmp: Path, jobs: int):
+    with contextlib.chdir(path_tmp):
+        _make_pdf("ch1.pdf", ["one", "two", "three"])
+        operations = [
+            {"op": "cat", "paths": ["ch1.pdf"]},
+            {"op": "raster", "resolution": 50, "quality": 50, "jobs": jobs},
+        ]
+        Path("pipeline.json").write_text(json.dumps(operations))
+        main(["pipeline.json", "out.pdf"])
+        cat_pdf(["ch1.pdf"], "cat.pdf", False)
+        raster_pdf("cat.pdf", "ref.pdf", 50, 50)
+        assert _get_images("out.pdf") == _get_images("ref.pdf")
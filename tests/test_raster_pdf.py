@@ -0,0 +1,197 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Unit tests for stepup.reprep.raster_pdf."""
+
+import os
+
+import fitz
+import pytest
+from path import Path
+
+from stepup.reprep.raster_pdf import (
+    PageCache,
+    compute_page_digest,
+    page_leaves,
+    raster_pdf,
+    write_jpeg_pdf,
+)
+
+SMILE_PDF = Path(__file__).parent / "examples/raster_pdf/smile.pdf"
+
+
+def _make_pdf(path_pdf: Path, npage: int, edit: int | None = None, links: bool = False):
+    with fitz.open(SMILE_PDF) as src, fitz.open() as dst:
+        if edit is not None:
+            # Shift all object numbers.
+            dst.new_page()
+        for ipage in range(npage):
+            dst.insert_pdf(src)
+            dst[-1].set_rotation(90 * (ipage % 4))
+            dst[-1].insert_text((50, 50), f"Page {ipage}")
+            if ipage == edit:
+                dst[-1].insert_text((50, 100), "Edited")
+        if edit is not None:
+            dst.delete_page(0)
+        if links:
+            # Each page links to the next one.
+            for ipage in range(npage):
+                link = {"kind": fitz.LINK_GOTO, "page": (ipage + 1) % npage, "to": fitz.Point()}
+                dst[ipage].insert_link(link | {"from": fitz.Rect(0, 0, 20, 20)})
+        dst.save(path_pdf, garbage=4, deflate=True)
+
+
+def _page_digests(path_pdf: Path) -> list[str]:
+    with fitz.open(path_pdf) as doc:
+        memo = {}
+        leaves = page_leaves(doc)
+        return [compute_page_digest(page, 50, 50, memo, leaves) for page in doc]
+
+
+@pytest.mark.parametrize("jobs", [2, 3])
+def test_raster_pdf_jobs(path_tmp: Path, jobs: int):
+    path_inp = path_tmp / "inp.pdf"
+    _make_pdf(path_inp, 7)
+    raster_pdf(path_inp, path_tmp / "serial.pdf", 50, 50)
+    raster_pdf(path_inp, path_tmp / "parallel.pdf", 50, 50, jobs)
+    assert (path_tmp / "serial.pdf").read_bytes() == (path_tmp / "parallel.pdf").read_bytes()
+    with fitz.open(path_tmp / "parallel.pdf") as doc:
+        assert doc.page_count == 7
+        # The second page is rotated by 90 degrees.
+        assert doc[0].rect.width == pytest.approx(doc[1].rect.height)
+        assert doc[0].rect.height == pytest.approx(doc[1].rect.width)
+
+
+def test_write_jpeg_pdf(path_tmp: Path):
+    # Noisy images, larger than the buffer of the output file.
+    noise = fitz.Pixmap(fitz.csRGB, 120, 80, os.urandom(120 * 80 * 3), False)
+    images = [noise.tobytes(output="jpg")] * 2
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 30, 20), False)
+    pix.set_rect(pix.irect, (255, 100, 0))
+    images.append(pix.tobytes(output="jpg"))
+    images.append(fitz.Pixmap(fitz.csGRAY, noise).tobytes(output="jpg"))
+    path_pdf = path_tmp / "out.pdf"
+    path_partial = path_tmp / ".out.pdf.srr-tmp"
+
+    def iter_pages():
+        for ipage, image in enumerate(images):
+            if ipage > 0:
+                # The first image is written before the next page is rendered.
+                assert images[0] in path_partial.read_bytes()
+            yield 60.5, 40.25, image
+
+    write_jpeg_pdf(path_pdf, iter_pages())
+    assert not path_partial.exists()
+    with fitz.open(path_pdf) as doc:
+        assert not doc.is_repaired
+        assert doc.page_count == 4
+        assert doc[3].rect == fitz.Rect(0, 0, 60.5, 40.25)
+        xrefs = [page.get_images()[0][0] for page in doc]
+        assert xrefs[0] == xrefs[1]
+        assert len(set(xrefs)) == 3
+        assert [doc.xref_stream_raw(xref) for xref in xrefs] == images
+        assert doc[3].get_images()[0][5] == "DeviceGray"
+        pix = doc[2].get_pixmap(dpi=72)
+        assert pix.pixel(30, 20) == pytest.approx((255, 100, 0), abs=5)
+
+    # A partial output is removed.
+    def iter_fail():
+        yield 10, 10, images[0]
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        write_jpeg_pdf(path_tmp / "fail.pdf", iter_fail())
+    assert sorted(path_tmp.iterdir()) == [path_pdf]
+
+
+def test_raster_pdf_invalid_jobs(path_tmp: Path):
+    with pytest.raises(ValueError):
+        raster_pdf(SMILE_PDF, path_tmp / "out.pdf", 50, 50, 0)
+
+
+def test_page_digest(path_tmp: Path):
+    _make_pdf(path_tmp / "orig.pdf", 4)
+    _make_pdf(path_tmp / "edit.pdf", 4, edit=2)
+    with fitz.open(path_tmp / "orig.pdf") as orig, fitz.open(path_tmp / "edit.pdf") as edit:
+        assert [page.xref for page in orig] != [page.xref for page in edit]
+    orig = _page_digests(path_tmp / "orig.pdf")
+    edit = _page_digests(path_tmp / "edit.pdf")
+    assert len(set(orig)) == 4
+    assert [o == e for o, e in zip(orig, edit, strict=True)] == [True, True, False, True]
+    with fitz.open(path_tmp / "orig.pdf") as doc:
+        assert compute_page_digest(doc[0], 50, 50) == orig[0]
+        assert compute_page_digest(doc[0], 60, 50) != orig[0]
+        assert compute_page_digest(doc[0], 50, 60) != orig[0]
+
+
+def test_page_digest_links(path_tmp: Path):
+    path_cache = path_tmp / "cache"
+    _make_pdf(path_tmp / "orig.pdf", 4, links=True)
+    _make_pdf(path_tmp / "edit.pdf", 4, edit=2, links=True)
+    with fitz.open(path_tmp / "edit.pdf") as doc:
+        assert doc[1].first_link.dest.page == 2
+    orig = _page_digests(path_tmp / "orig.pdf")
+    edit = _page_digests(path_tmp / "edit.pdf")
+    assert len(set(orig)) == 4
+    # Page 1 links to the edited page 2, but its digest does not change.
+    assert [o == e for o, e in zip(orig, edit, strict=True)] == [True, True, False, True]
+    raster_pdf(path_tmp / "orig.pdf", path_tmp / "out.pdf", 50, 50, 1, path_cache)
+    raster_pdf(path_tmp / "edit.pdf", path_tmp / "out.pdf", 50, 50, 1, path_cache)
+    assert sorted(path_cache.iterdir()) == sorted(
+        path_cache / f"{d}.jpg" for d in set(orig) | set(edit)
+    )
+    assert len(list(path_cache.iterdir())) == 5
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_raster_pdf_cache(path_tmp: Path, jobs: int):
+    path_cache = path_tmp / "cache"
+    _make_pdf(path_tmp / "orig.pdf", 4)
+    _make_pdf(path_tmp / "edit.pdf", 4, edit=2)
+    raster_pdf(path_tmp / "orig.pdf", path_tmp / "ref.pdf", 50, 50)
+    raster_pdf(path_tmp / "orig.pdf", path_tmp / "out.pdf", 50, 50, jobs, path_cache)
+    assert (path_tmp / "out.pdf").read_bytes() == (path_tmp / "ref.pdf").read_bytes()
+    digests = _page_digests(path_tmp / "orig.pdf")
+    assert sorted(path_cache.iterdir()) == sorted(path_cache / f"{d}.jpg" for d in digests)
+
+    # Replace a cached image, to check that it is used instead of rendering the page.
+    with fitz.open(path_tmp / "edit.pdf") as doc:
+        image = doc[0].get_pixmap(dpi=10).tobytes(output="jpg")
+    PageCache(path_cache).store(digests[1], image)
+    raster_pdf(path_tmp / "edit.pdf", path_tmp / "out.pdf", 50, 50, jobs, path_cache)
+    assert len(list(path_cache.iterdir())) == 5
+    with fitz.open(path_tmp / "out.pdf") as doc:
+        assert doc[1].get_images()[0][2] == fitz.Pixmap(image).width
+
+    # Only the most recently used images are kept.
+    raster_pdf(path_tmp / "edit.pdf", path_tmp / "out.pdf", 50, 50, jobs, path_cache, 0)
+    assert list(path_cache.iterdir()) == []
+
+
+def test_page_cache_prune(path_tmp: Path):
+    cache = PageCache(path_tmp / "cache")
+    assert cache.prune(0) == []
+    for i, name in enumerate(["a", "b", "c"]):
+        cache.store(name, bytes(100))
+        os.utime(path_tmp / f"cache/{name}.jpg", ns=(i, i))
+    assert cache.load("a") == bytes(100)
+    assert cache.load("d") is None
+    assert cache.prune(250) == ["b"]
+    assert cache.prune(100) == ["c"]
+    assert sorted(path_tmp.joinpath("cache").iterdir()) == [path_tmp / "cache/a.jpg"]
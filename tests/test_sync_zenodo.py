@@ -19,9 +19,17 @@
 # --
 """Unit tests for stepup.reprep.sync_zenodo."""
 
+import contextlib
+import hashlib
+import os
+import time
+
 import pytest
+from path import Path
 
-from stepup.reprep.sync_zenodo import Creator
+from stepup.reprep import sync_zenodo as sync_zenodo_module
+from stepup.reprep.make_inventory import write_inventory
+from stepup.reprep.sync_zenodo import Creator, _compute_md5, _load_inventory_md5
 
 
 @pytest.mark.parametrize(
@@ -54,3 +62,34 @@ def test_creator_orcid_valid(orcid):
 def test_creator_orcid_invalid(orcid):
     with pytest.raises(ValueError):
         Creator("Test User", "StepUp RepRep", {"orcid": orcid})
+
+
+def test_inventory_md5(path_tmp, monkeypatch):
+    monkeypatch.setattr(sync_zenodo_module, "_MD5_CACHE", {})
+    with contextlib.chdir(path_tmp):
+        Path("sub").mkdir()
+        for path in "a.txt", "sub/b.txt", "sub/c.txt", "d.txt", "e.txt":
+            Path(path).write_text(path)
+            # Files written just before the inventory are not trusted, see below.
+            os.utime(path, ns=(0, 0))
+        start_ns = time.time_ns()
+        write_inventory(
+            "inventory.txt",
+            ["a.txt", "sub/b.txt", "sub/c.txt", "e.txt"],
+            do_amend=False,
+            extra_digests=["md5"],
+        )
+        st = os.stat("inventory.md5")
+        assert st.st_mtime_ns >= start_ns
+        # Different size, modified after the inventory, and not in the inventory.
+        Path("a.txt").write_text("changed")
+        os.utime("sub/c.txt", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        # Rewritten with the same size while the checksums were computed,
+        # with a timestamp that may be rounded down by the file system.
+        Path("e.txt").write_text("E.TXT")
+        os.utime("e.txt", ns=(st.st_atime_ns, st.st_mtime_ns - 10**9))
+        paths = [Path(path) for path in ("a.txt", "sub/b.txt", "sub/c.txt", "d.txt", "e.txt")]
+        _load_inventory_md5("inventory.txt", paths)
+        assert list(sync_zenodo_module._MD5_CACHE) == ["sub/b.txt"]
+        for path in paths:
+            assert _compute_md5(path) == hashlib.md5(path.read_bytes()).hexdigest()
@@ -0,0 +1,35 @@
+# StepUp RepRep is the StepUp extension for Reproducible Reporting.
+# Copyright 2024-2026 Toon Verstraelen
+#
+# This file is part of StepUp RepRep.
+#
+# StepUp RepRep is free software;  you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# StepUp RepRep is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Unit tests for stepup.reprep.utils."""
+
+import pytest
+
+from stepup.reprep.utils import parse_size
+
+
+def test_parse_size():
+    assert parse_size("123") == 123
+    assert parse_size("50G") == 50 * 10**9
+    assert parse_size("2Gi") == 2 * 2**30
+    assert parse_size("10 MB") == 10**7
+    with pytest.raises(ValueError):
+        parse_size("1.5G")
+    with pytest.raises(ValueError):
+        parse_size("2i")
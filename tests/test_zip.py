@@ -20,10 +20,24 @@
 """Unit tests for stepup.reprep.zip_inventory."""
 
 import contextlib
+import datetime as dt
+import json
+import os
+import sys
 import zipfile
 
+import pytest
+from path import Path
+
+from stepup.core.hash import compute_file_digest
+from stepup.reprep import zip_inventory as zip_inventory_module
+from stepup.reprep.check_inventory import check_inventory
+from stepup.reprep.check_zip import audit_zip, check_zip
+from stepup.reprep.inventory import FileSummary, format_summary, new_digest_hasher
 from stepup.reprep.make_inventory import write_inventory
-from stepup.reprep.zip_inventory import zip_inventory
+from stepup.reprep.shard_inventory import ShardPlan, shard_inventory
+from stepup.reprep.unzip_inventory import unzip_inventory
+from stepup.reprep.zip_inventory import CompressionPolicy, can_write_raw, zip_inventory
 
 
 def test_simple_chdir(path_tmp):
@@ -57,3 +71,343 @@ def test_simple(path_tmp):
     assert contents["a.txt"] == "Aaa"
     assert contents["b.txt"] == "Bbb"
     assert "inventory.txt" in contents
+
+
+def test_new_digest_hasher(path_tmp):
+    path = path_tmp / "a.bin"
+    data = os.urandom(100000)
+    path.write_bytes(data)
+    hasher = new_digest_hasher()
+    hasher.update(data)
+    assert hasher.digest() == compute_file_digest(path)
+
+
+def _make_dataset():
+    Path("sub").mkdir()
+    with open("sub/a.txt", "w") as fh:
+        fh.write("Aaa" * 1000)
+    with open("b.bin", "wb") as fh:
+        fh.write(os.urandom(300000))
+    with open("c.sh", "w") as fh:
+        fh.write("#!/usr/bin/env bash\n")
+    Path("c.sh").chmod(0o755)
+    Path("link.txt").symlink_to("sub/a.txt")
+    paths = ["b.bin", "c.sh", "link.txt", "sub/a.txt"]
+    write_inventory("inventory.txt", paths, do_amend=False)
+    return paths
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_reproducible(path_tmp, jobs):
+    with contextlib.chdir(path_tmp):
+        paths = _make_dataset()
+        zip_inventory("inventory.txt", "test.zip", jobs)
+        # Reference ZIP created with fz.write on copies with fixed timestamps.
+        timestamp = dt.datetime(1980, 1, 1).timestamp()
+        Path("tmp").mkdir()
+        with zipfile.ZipFile("ref.zip", "w") as fz:
+            for path in [*paths, "inventory.txt"]:
+                dst = Path("tmp/todo")
+                dst.remove_p()
+                Path(path).copy(dst, follow_symlinks=False)
+                if dst.islink():
+                    zipinfo = zipfile.ZipInfo(path)
+                    zipinfo.create_system = 3
+                    zipinfo.external_attr |= dst.stat(follow_symlinks=False).st_mode << 16
+                    fz.writestr(zipinfo, dst.readlink())
+                else:
+                    dst.utime((timestamp, timestamp))
+                    fz.write(dst, path, zipfile.ZIP_DEFLATED)
+        assert Path("test.zip").read_bytes() == Path("ref.zip").read_bytes()
+
+
+@pytest.mark.parametrize("compression", ["deflate", "auto,.sh=deflate9", "*=store"])
+def test_jobs_large(path_tmp, monkeypatch, compression):
+    with contextlib.chdir(path_tmp):
+        _make_dataset()
+        zip_inventory("inventory.txt", "test1.zip", 1, compression=compression)
+        # Mix of files compressed in memory and to temporary files.
+        monkeypatch.setattr(zip_inventory_module, "MAX_BUFFERED_SIZE", 4000)
+        monkeypatch.setattr(zip_inventory_module, "MAX_PENDING_SIZE", 5000)
+        zip_inventory("inventory.txt", "test4.zip", 4, compression=compression)
+        assert Path("test1.zip").read_bytes() == Path("test4.zip").read_bytes()
+
+
+def test_can_write_raw(path_tmp):
+    with zipfile.ZipFile(path_tmp / "test.zip", "w") as fz:
+        assert can_write_raw(fz) == (sys.version_info[:2] <= (3, 14))
+        with fz.open("a.txt", "w") as fh:
+            # Not while another member is being written.
+            assert not can_write_raw(fz)
+            fh.write(b"aaa")
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_write_raw_fallback(path_tmp, monkeypatch, jobs):
+    with contextlib.chdir(path_tmp):
+        paths = _make_dataset()
+        zip_inventory("inventory.txt", "ref.zip", 1, compression="auto,.sh=deflate9")
+        # Without the zipfile internals, precompressed members are compressed again.
+        monkeypatch.setattr(zip_inventory_module, "RAW_WRITE_PYTHON_VERSIONS", ((3, 0), (3, 0)))
+        monkeypatch.setattr(zip_inventory_module, "MAX_BUFFERED_SIZE", 4000)
+        zip_inventory("inventory.txt", "test.zip", jobs, compression="auto,.sh=deflate9")
+        assert Path("test.zip").read_bytes() == Path("ref.zip").read_bytes()
+        with open("c.sh", "a") as fh:
+            fh.write("echo hello\n")
+        write_inventory("inventory.txt", paths, do_amend=False)
+        zip_inventory(
+            "inventory.txt", "test.zip", jobs, incremental=True, compression="auto,.sh=deflate9"
+        )
+        zip_inventory("inventory.txt", "ref.zip", 1, compression="auto,.sh=deflate9")
+        assert Path("test.zip").read_bytes() == Path("ref.zip").read_bytes()
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_corrupt(path_tmp, jobs):
+    with contextlib.chdir(path_tmp):
+        _make_dataset()
+        with open("sub/a.txt", "w") as fh:
+            fh.write("Bbb" * 1000)
+        with pytest.raises(ValueError):
+            zip_inventory("inventory.txt", "test.zip", jobs)
+        assert not Path("test.zip").exists()
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_incremental(path_tmp, jobs):
+    with contextlib.chdir(path_tmp):
+        paths = _make_dataset()
+        zip_inventory("inventory.txt", "test.zip", jobs, incremental=True)
+        with open("c.sh", "a") as fh:
+            fh.write("echo hello\n")
+        with open("d.txt", "w") as fh:
+            fh.write("new file")
+        write_inventory("inventory.txt", [*paths, "d.txt"], do_amend=False)
+        # Corrupt an unchanged file on disk. It should not be read in incremental mode.
+        data = Path("b.bin").read_bytes()
+        Path("b.bin").write_bytes(bytes(len(data)))
+        zip_inventory("inventory.txt", "test.zip", jobs, incremental=True)
+        Path("b.bin").write_bytes(data)
+        zip_inventory("inventory.txt", "full.zip", jobs)
+        assert Path("test.zip").read_bytes() == Path("full.zip").read_bytes()
+
+
+def test_incremental_corrupt_old(path_tmp):
+    with contextlib.chdir(path_tmp):
+        _make_dataset()
+        zip_inventory("inventory.txt", "test.zip")
+        # Corrupt the compressed data of b.bin in the old ZIP file.
+        with zipfile.ZipFile("test.zip") as fz:
+            zipinfo = fz.getinfo("b.bin")
+        with open("test.zip", "r+b") as fh:
+            fh.seek(zipinfo.header_offset + 30 + len("b.bin") + 1000)
+            fh.write(b"corrupt")
+        with pytest.raises(ValueError):
+            zip_inventory("inventory.txt", "test.zip", incremental=True)
+
+
+def test_compression_policy():
+    policy = CompressionPolicy.from_spec("auto, .csv=deflate9 ,.PNG=deflate")
+    assert policy.rules[".csv"] == "deflate9"
+    assert policy.rules[".png"] == "deflate"
+    assert policy.rules["*"] == "sample"
+    assert policy.choose("a.csv", b"") == (zipfile.ZIP_DEFLATED, 9)
+    assert policy.choose("a.jpg", b"") == (zipfile.ZIP_STORED, None)
+    assert policy.choose("a.txt", b"a" * 1000) == (zipfile.ZIP_DEFLATED, None)
+    assert policy.choose("a.bin", os.urandom(1000)) == (zipfile.ZIP_STORED, None)
+    assert CompressionPolicy.from_spec(policy.spec) == policy
+    assert CompressionPolicy.from_spec("").is_default
+    assert CompressionPolicy.from_spec("deflate").comment == b""
+    with pytest.raises(ValueError):
+        CompressionPolicy.from_spec("foo")
+    with pytest.raises(ValueError):
+        CompressionPolicy.from_spec(".png=lzma")
+    with pytest.raises(ValueError):
+        CompressionPolicy.from_spec("png=store")
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_compression_auto(path_tmp, jobs):
+    with contextlib.chdir(path_tmp):
+        paths = _make_dataset()
+        Path("image.png").write_bytes(b"a" * 10000)
+        write_inventory("inventory.txt", [*paths, "image.png"], do_amend=False)
+        zip_inventory("inventory.txt", "test.zip", jobs, compression="auto,.sh=deflate9")
+        with zipfile.ZipFile("test.zip") as fz:
+            assert fz.comment.startswith(b"srr-zip-inventory compression=")
+            assert fz.getinfo("b.bin").compress_type == zipfile.ZIP_STORED
+            assert fz.getinfo("image.png").compress_type == zipfile.ZIP_STORED
+            assert fz.getinfo("c.sh").compress_type == zipfile.ZIP_DEFLATED
+            assert fz.getinfo("sub/a.txt").compress_type == zipfile.ZIP_DEFLATED
+            assert fz.read("image.png") == b"a" * 10000
+        zip_inventory("inventory.txt", "ref.zip", 1, compression="auto,.sh=deflate9")
+        assert Path("test.zip").read_bytes() == Path("ref.zip").read_bytes()
+        # Incremental update with a different policy must not reuse members.
+        zip_inventory("inventory.txt", "test.zip", jobs, incremental=True)
+        zip_inventory("inventory.txt", "ref.zip", 1)
+        assert Path("test.zip").read_bytes() == Path("ref.zip").read_bytes()
+        # Incremental update with the same policy, reusing stored and deflated members.
+        zip_inventory("inventory.txt", "test.zip", jobs, compression="auto")
+        zip_inventory("inventory.txt", "test.zip", jobs, incremental=True, compression="auto")
+        zip_inventory("inventory.txt", "ref.zip", 1, compression="auto")
+        assert Path("test.zip").read_bytes() == Path("ref.zip").read_bytes()
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_check_zip(path_tmp, jobs):
+    with contextlib.chdir(path_tmp):
+        _make_dataset()
+        zip_inventory("inventory.txt", "test.zip", jobs, compression="auto")
+        check_zip("test.zip", jobs=jobs)
+        assert audit_zip("test.zip", jobs=jobs) == []
+
+
+def _rewrite_zip(path_src, path_dst, replace):
+    """Copy a ZIP file, replacing or dropping (None) member contents."""
+    with zipfile.ZipFile(path_src) as fz_src, zipfile.ZipFile(path_dst, "w") as fz_dst:
+        for zipinfo in fz_src.infolist():
+            data = replace.get(zipinfo.filename, fz_src.read(zipinfo))
+            if data is not None:
+                fz_dst.writestr(zipinfo, data)
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_check_zip_issues(path_tmp, jobs):
+    with contextlib.chdir(path_tmp):
+        _make_dataset()
+        zip_inventory("inventory.txt", "test.zip")
+        replace = {"c.sh": "#!/bin/sh\n", "link.txt": "sub/b.txt", "sub/a.txt": None}
+        _rewrite_zip("test.zip", "bad.zip", replace)
+        with pytest.raises(ValueError):
+            check_zip("bad.zip", jobs=jobs)
+        issues = audit_zip("bad.zip", jobs=jobs)
+        assert [(issue.path, issue.kind) for issue in issues] == [
+            ("c.sh", "size"),
+            ("c.sh", "digest"),
+            ("link.txt", "digest"),
+            ("sub/a.txt", "missing"),
+        ]
+
+
+def test_check_zip_corrupt(path_tmp):
+    with contextlib.chdir(path_tmp):
+        _make_dataset()
+        zip_inventory("inventory.txt", "test.zip")
+        with zipfile.ZipFile("test.zip", "a") as fz:
+            fz.writestr("extra.txt", "not in inventory")
+        with zipfile.ZipFile("test.zip") as fz:
+            zipinfo = fz.getinfo("b.bin")
+        with open("test.zip", "r+b") as fh:
+            fh.seek(zipinfo.header_offset + 30 + len("b.bin") + 1000)
+            fh.write(b"corrupt")
+        issues = audit_zip("test.zip", "inventory.txt")
+        assert [(issue.path, issue.kind) for issue in issues] == [
+            ("b.bin", "corrupt"),
+            ("extra.txt", "extra"),
+        ]
+        with pytest.raises(ValueError):
+            check_zip("test.zip", "inventory.txt")
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_unzip_inventory(path_tmp, jobs):
+    with contextlib.chdir(path_tmp):
+        paths = _make_dataset()
+        zip_inventory("inventory.txt", "test.zip")
+        extracted = unzip_inventory("test.zip", "out", jobs=jobs)
+        assert extracted == [*paths, "inventory.txt"]
+        assert Path("out/link.txt").islink()
+        assert Path("out/link.txt").readlink() == "sub/a.txt"
+        assert Path("out/c.sh").stat().st_mode & 0o777 == 0o755
+        assert Path("out/b.bin").read_bytes() == Path("b.bin").read_bytes()
+        check_inventory("out/inventory.txt")
+        # Resume after a partial extraction: only changed files are written.
+        Path("out/b.bin").remove()
+        Path("out/c.sh").chmod(0o644)
+        Path("out/link.txt").remove()
+        Path("out/link.txt").symlink_to("b.bin")
+        assert unzip_inventory("test.zip", "out", jobs=jobs) == ["b.bin", "c.sh", "link.txt"]
+        assert unzip_inventory("test.zip", "out", jobs=jobs) == []
+        check_inventory("out/inventory.txt")
+
+
+def test_unzip_inventory_corrupt(path_tmp):
+    with contextlib.chdir(path_tmp):
+        _make_dataset()
+        zip_inventory("inventory.txt", "test.zip")
+        _rewrite_zip("test.zip", "bad.zip", {"c.sh": "#!/bin/sh\n"})
+        with pytest.raises(ValueError):
+            unzip_inventory("bad.zip", "out")
+        assert not Path("out/c.sh").exists()
+        assert not Path("out/inventory.txt").exists()
+        assert sorted(Path("out").iterdir()) == [Path("out/b.bin")]
+
+
+def test_unzip_inventory_symlink_parent(path_tmp):
+    with contextlib.chdir(path_tmp):
+        Path("outside").mkdir()
+        lines = [
+            format_summary(FileSummary(None, "lrwxrwxrwx", bytes(32), "evil")),
+            format_summary(FileSummary(4, "-rw-r--r--", bytes(32), "evil/x.txt")),
+        ]
+        with zipfile.ZipFile("bad.zip", "w") as fz:
+            zipinfo = zipfile.ZipInfo("evil")
+            zipinfo.create_system = 3
+            zipinfo.external_attr |= 0o120777 << 16
+            fz.writestr(zipinfo, "../outside")
+            fz.writestr("evil/x.txt", "abc\n")
+            fz.writestr("inventory.txt", "".join(line + "\n" for line in lines))
+        with pytest.raises(ValueError):
+            unzip_inventory("bad.zip", "out")
+        assert list(Path("outside").iterdir()) == []
+        assert not Path("out/evil").islink()
+
+
+def test_unzip_inventory_symlink_dest(path_tmp):
+    with contextlib.chdir(path_tmp):
+        _make_dataset()
+        zip_inventory("inventory.txt", "test.zip")
+        Path("outside").mkdir()
+        Path("out").mkdir()
+        Path("out/sub").symlink_to("../outside")
+        with pytest.raises(ValueError):
+            unzip_inventory("test.zip", "out")
+        assert list(Path("outside").iterdir()) == []
+
+
+def test_shard_inventory(path_tmp):
+    with contextlib.chdir(path_tmp):
+        paths = _make_dataset()
+        for i in range(10):
+            Path(f"data{i}.bin").write_bytes(os.urandom(10000 * (i + 1)))
+            paths.append(f"data{i}.bin")
+        write_inventory("inventory.txt", paths, do_amend=False)
+        # The output paths are known before any file is written.
+        plan = ShardPlan.from_inventory("inventory.txt", 400000)
+        paths_planned = plan.paths_out
+        assert not any(Path(path).exists() for path in paths_planned)
+        paths_out = shard_inventory("inventory.txt", 400000)
+        assert paths_out == paths_planned
+        with open("inventory-shards.json") as fh:
+            index = json.load(fh)
+        assert paths_out[-1] == "inventory-shards.json"
+        assert len(paths_out) == 2 * len(index["shards"]) + 1
+        assert len(index["shards"]) > 1
+        assert sorted(index["paths"]) == sorted(paths)
+        assert sum(shard["count"] for shard in index["shards"]) == len(paths)
+        contents = {}
+        for shard in index["shards"]:
+            assert shard["size"] == Path(shard["zip"]).size <= 400000
+            check_zip(shard["zip"])
+            with zipfile.ZipFile(shard["zip"]) as fz:
+                names = fz.namelist()
+            assert names[-1] == shard["inventory"]
+            for name in names[:-1]:
+                assert index["paths"][name] == shard["zip"]
+            contents[shard["zip"]] = Path(shard["zip"]).read_bytes()
+        # The result does not depend on the number of threads.
+        shard_inventory("inventory.txt", 400000, jobs=3)
+        for path_zip, data in contents.items():
+            assert Path(path_zip).read_bytes() == data
+        with pytest.raises(ValueError):
+            shard_inventory("inventory.txt", 50000)